@@ -7,160 +7,165 @@ Este script analiza los sesgos históricos del CIS y proyecta
 los resultados para las elecciones de 2027.
 """
 
-import json
+import argparse
 import os
-from datetime import datetime
+import sys
+
+import numpy as np
 
 # Rutas de archivos
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 ARCHIVO_DATOS = os.path.join(BASE_DIR, '../data/raw_data.jsonl')
 ARCHIVO_SALIDA = os.path.join(BASE_DIR, '../data/final_prediction_2027.csv')
+ARCHIVO_CHECKPOINT = os.path.join(BASE_DIR, '../data/analysis_checkpoint.json')
+# Directorio del archivo Parquet (common/archivo.py); si se fija, cargar_fuentes lee de él y no del log
+ARCHIVO_PARQUET = None
+# (host, puerto) del servidor de ingesta en marcha; si se fija, cargar_fuentes le consulta a él (common/ultimos.py)
+SERVIDOR = None
+# Fuentes que lee cargar_fuentes (se piden todas juntas al servidor)
+FUENTES_ANALISIS = ('CIS_HISTORICAL_MULTI', 'OFFICIAL_MULTI', 'CIS_CURRENT', 'ELECTOMANIA', 'GOOGLE_TRENDS',
+                    'ELECTOMANIA_HISTORICAL', 'ECONOMIC_MATRIX', 'ECONOMIC_CONTEXT', 'OFFICIAL_PROVINCES_MATRIX')
 
-def cargar_datos():
-    """Carga todos los datos scrapeados del JSON Lines"""
-    datos = []
-    with open(ARCHIVO_DATOS, 'r', encoding='utf-8') as f:
-        for linea in f:
-            try:
-                datos.append(json.loads(linea))
-            except:
-                pass  # Ignora líneas mal formadas
-    return datos
+# Vida media (en meses) de los pesos por recencia en la regresión; None = todas las encuestas pesan igual
+VIDA_MEDIA_MESES = None
 
-def analizar():
-    """Función principal que realiza todo el análisis"""
-    datos = cargar_datos()
-    
-    # Extraemos los diferentes conjuntos de datos
-    cis_historico = next((item['data'] for item in datos if item['source'] == 'CIS_HISTORICAL_MULTI'), [])
-    oficial = next((item['data'] for item in datos if item['source'] == 'OFFICIAL_MULTI'), {})
-    cis_actual = next((item['data'] for item in datos if item['source'] == 'CIS_CURRENT'), {})
-    electomania = next((item['data'] for item in datos if item['source'] == 'ELECTOMANIA'), {})
-    tendencias = next((item['data'] for item in datos if item['source'] == 'GOOGLE_TRENDS'), {})
-    economia = next((item['data'] for item in datos if item['source'] == 'ECONOMIC_CONTEXT'), [])
-    
-    print("\n" + "="*50)
-    print("   SISTEMA DE PREDICCIÓN ELECTORAL 2027   ")
-    print("="*50 + "\n")
+sys.path.append(os.path.join(BASE_DIR, '..'))
+from common.storage import LectorAlmacen, leer_registros
+from common.archivo import LectorArchivo, ruta_rollups_archivo
+from common.rollups import LectorConRollups, leer_rollups, ruta_rollups
+from common.ultimos import LectorServidor
+from common import dimensiones
+from trend_engine import matriz_encuestas, ajustar_tendencias, pesos_recencia
+import incremental
+import socioeconomico
 
-    # Trabajamos con los 4 partidos principales
-    partidos = ['PSOE', 'PP', 'VOX', 'SUMAR']
-    
-    # Mapeo para Google Trends
-    candidatos = {
-        'PSOE': 'Sanchez_Interest',
-        'PP': 'Feijoo_Interest',
-        'VOX': 'Abascal_Interest',
-        'SUMAR': 'Diaz_Interest'
-    }
+def cargar_datos(fuentes=(), prefijos=()):
+    """
+    Recorre los registros scrapeados de las fuentes pedidas (nombre exacto o
+    prefijo; sin filtros, todos) sin cargar el log entero en memoria.
+    Al terminar avisa de las líneas mal formadas que se han ignorado.
+    """
+    errores = {}
+    yield from leer_registros(ARCHIVO_DATOS, fuentes, prefijos, errores)
+    if errores:
+        print(f"  Aviso: líneas mal formadas ignoradas en {ARCHIVO_DATOS}: {errores}")
+
+# Trabajamos con los 4 partidos principales
+PARTIDOS = ['PSOE', 'PP', 'VOX', 'SUMAR']
 
-    # PASO 0: Contexto Económico (Factor de Corrección)
+# Mapeo para Google Trends
+CANDIDATOS = {
+    'PSOE': 'Sanchez_Interest',
+    'PP': 'Feijoo_Interest',
+    'VOX': 'Abascal_Interest',
+    'SUMAR': 'Diaz_Interest'
+}
+
+def paso_economia(economia, provincias, partidos=PARTIDOS):
+    """PASO 0: Corrección económica de cada partido (regresión provincial voto ~ indicadores)"""
     print("--- 0. ANÁLISIS DE CONTEXTO ECONÓMICO ---")
-    factor_malestar = 0.0
-    if economia:
-        paro_medio = sum(p['unemployment_rate'] for p in economia) / len(economia)
-        print(f"  Tasa de Paro Media (Provincial): {paro_medio:.2f}%")
-        
-        # Si el paro es alto (>15%), históricamente favorece a la oposición (PP/VOX)
-        if paro_medio > 15.0:
-            factor_malestar = (paro_medio - 15.0) * 0.2  # 0.2 puntos por cada % extra
-            print(f"  ⚠️ ALERTA: Malestar económico detectado (+{factor_malestar:.2f}pp bonificación oposición)")
-        else:
-            print("  Situación económica estable (sin corrección significativa)")
-    else:
+    ajuste_economico = {p: 0.0 for p in partidos}
+    if economia is None or np.isnan(economia).all():
         print("  No hay datos económicos disponibles.")
+        return ajuste_economico
+    elecciones, V, X = socioeconomico.arrays_provinciales(provincias, economia, partidos)
+    medias = np.nanmean(X, axis=0)
+    print(f"  Tasa de Paro Media (Provincial): {medias[0]:.2f}%")
+    print(f"  Renta Media (Provincial): {medias[1]:.0f}€")
+
+    ajuste = socioeconomico.ajustar(V, X)
+    if ajuste is None:
+        print("  Sin resultados provinciales suficientes para la regresión (sin corrección)")
+        return ajuste_economico
+    _, coeficientes, n_provincias = ajuste
+    print(f"  Regresión voto ~ {' + '.join(socioeconomico.INDICADORES)}: "
+          f"{n_provincias} provincias × {len(elecciones)} elecciones")
+    for p, beta, corr in zip(partidos, coeficientes.mean(axis=0), socioeconomico.efecto(coeficientes, X)):
+        ajuste_economico[p] = float(corr)
+        detalle = ", ".join(f"{k} {b:+.4g}" for k, b in zip(socioeconomico.INDICADORES, beta))
+        print(f"  {p}: {detalle} → {corr:+.2f}pp")
+    return ajuste_economico
 
+def emparejar_cis_oficial(cis_historico, oficial):
+    """Pares (elección, datos CIS, datos reales) de las elecciones con resultado oficial"""
+    return [(b.get('election_id'), b['data'], oficial[b.get('election_id')])
+            for b in cis_historico if b.get('election_id') in oficial]
 
-    # PASO 1: Calcular el sesgo histórico del CIS
+def paso_sesgo(pares, partidos=PARTIDOS):
+    """PASO 1: Sesgo medio del CIS (predicción - resultado real) por partido"""
     print("--- 1. ANÁLISIS DEL SESGO HISTÓRICO DEL CIS ---")
     sesgo = {p: 0.0 for p in partidos}
     contador = 0
     
     # Comparamos predicciones CIS vs resultados reales
-    for barometro in cis_historico:
-        eleccion = barometro.get('election_id')
-        if eleccion in oficial:
-            print(f"\nComprobando Elección {eleccion}:")
-            datos_cis = barometro['data']
-            datos_reales = oficial[eleccion]
-            
-            for p in partidos:
-                pred_cis = datos_cis.get(p, 0)
-                real = datos_reales.get(p, 0)
-                error = pred_cis - real
-                sesgo[p] += error
-                print(f"  > {p}: CIS predijo {pred_cis}% vs Real {real}% (Error: {error:+.2f}%)")
-            contador += 1
+    for eleccion, datos_cis, datos_reales in pares:
+        print(f"\nComprobando Elección {eleccion}:")
+        for p in partidos:
+            pred_cis = datos_cis.get(p, 0)
+            real = datos_reales.get(p, 0)
+            error = pred_cis - real
+            sesgo[p] += error
+            print(f"  > {p}: CIS predijo {pred_cis}% vs Real {real}% (Error: {error:+.2f}%)")
+        contador += 1
     
     # Calculamos el sesgo promedio
     if contador > 0:
         for p in partidos:
             sesgo[p] /= contador
             print(f"  => SESGO PROMEDIO {p}: {sesgo[p]:+.2f}%")
+    return sesgo
 
-    # PASO 2: Proyección a 2027 usando regresión lineal
-    print("\n--- 2. PROYECCIÓN DE TENDENCIAS → 2027 ---")
-    electo_hist = next((item['data'] for item in datos if item['source'] == 'ELECTOMANIA_HISTORICAL'), [])
-    
+def mostrar_proyeccion(partidos_encuestas, pendientes, ordenadas, partidos=PARTIDOS):
+    """Proyección a enero 2027 a partir de las rectas ajustadas (y = m*x + b)"""
     proyeccion_2027 = {p: 0.0 for p in partidos}
-    
-    if electo_hist and len(electo_hist) >= 5:
-        print(f"Analizando {len(electo_hist)} encuestas históricas...")
-        print("Periodo: Julio 2025 → Enero 2026 (6 meses)")
-        print("Proyectando a: Enero 2027 (12 meses adelante)\n")
+    for p, m, b in zip(partidos_encuestas, pendientes, ordenadas):
+        # Valor actual (enero 2026 = mes 6)
+        valor_ahora = m * 6 + b
         
-        for p in partidos:
-            # Convertimos fechas a números (meses desde julio 2025)
-            meses = []
-            valores = []
-            for encuesta in electo_hist:
-                fecha = datetime.strptime(encuesta['date'], '%Y-%m-%d')
-                # Julio 2025 = mes 0
-                mes = (fecha.year - 2025) * 12 + fecha.month - 7
-                meses.append(mes)
-                valores.append(encuesta['data'].get(p, 0))
-            
-            # Regresión lineal: y = m*x + b
-            # donde m es la tendencia (cuánto sube/baja por mes)
-            n = len(meses)
-            suma_x = sum(meses)
-            suma_y = sum(valores)
-            suma_xy = sum(x*y for x,y in zip(meses, valores))
-            suma_x2 = sum(x*x for x in meses)
-            
-            # Calculamos la pendiente
-            denom = (n * suma_x2 - suma_x * suma_x)
-            if denom != 0:
-                m = (n * suma_xy - suma_x * suma_y) / denom
-                b = (suma_y - m * suma_x) / n
-            else:
-                m = 0
-                b = suma_y / n if n > 0 else 0
-            
-            # Valor actual (enero 2026 = mes 6)
-            valor_ahora = m * 6 + b
-            
-            # Proyección a enero 2027 (= mes 18)
-            valor_2027 = m * 18 + b
-            
-            proyeccion_2027[p] = valor_2027
-            
-            # Mostramos
-            flecha = "↗" if m > 0 else "↘"
-            print(f"  {flecha} {p}:")
-            print(f"      Tendencia: {m:+.3f}pp/mes")
-            print(f"      Enero 2026 (hoy): {valor_ahora:.1f}%")
-            print(f"      → Enero 2027 (proyección): {valor_2027:.1f}% ({valor_2027-valor_ahora:+.1f}pp)")
-    else:
+        # Proyección a enero 2027 (= mes 18)
+        valor_2027 = m * 18 + b
+        
+        proyeccion_2027[p] = float(valor_2027)
+        
+        # Mostramos
+        flecha = "↗" if m > 0 else "↘"
+        print(f"  {flecha} {p}:")
+        print(f"      Tendencia: {m:+.3f}pp/mes")
+        print(f"      Enero 2026 (hoy): {valor_ahora:.1f}%")
+        print(f"      → Enero 2027 (proyección): {valor_2027:.1f}% ({valor_2027-valor_ahora:+.1f}pp)")
+    return proyeccion_2027
+
+def cabecera_tendencias(n_encuestas):
+    """Cabecera del PASO 2. Devuelve False si no hay encuestas suficientes para proyectar."""
+    print("\n--- 2. PROYECCIÓN DE TENDENCIAS → 2027 ---")
+    if n_encuestas < 5:
         print("  Datos insuficientes para proyección")
+        return False
+    print(f"Analizando {n_encuestas} encuestas históricas...")
+    print("Periodo: Julio 2025 → Enero 2026 (6 meses)")
+    print("Proyectando a: Enero 2027 (12 meses adelante)\n")
+    return True
 
-    # PASO 2.5: Detección de Voto Oculto (Google Trends)
+def paso_tendencias(electo_hist, partidos=PARTIDOS):
+    """PASO 2: Proyección a 2027 usando regresión lineal"""
+    if cabecera_tendencias(len(electo_hist or [])):
+        # Matriz encuestas × partidos con todos los partidos presentes en los datos
+        meses, partidos_encuestas, Y = matriz_encuestas(electo_hist)
+        pesos = pesos_recencia(meses, VIDA_MEDIA_MESES) if VIDA_MEDIA_MESES else None
+        # Regresión lineal y = m*x + b de todos los partidos en una sola pasada
+        # donde m es la tendencia (cuánto sube/baja por mes)
+        pendientes, ordenadas = ajustar_tendencias(meses, Y, pesos)
+        return mostrar_proyeccion(partidos_encuestas, pendientes, ordenadas, partidos)
+    return {p: 0.0 for p in partidos}
+
+def paso_voto_oculto(tendencias, cis_actual, partidos=PARTIDOS):
+    """PASO 2.5: Detección de Voto Oculto (Google Trends)"""
     print("\n--- 2.5. DETECCIÓN DE VOTO OCULTO (Google Trends) ---")
     ajuste_voto_oculto = {p: 0.0 for p in partidos}
     
     if tendencias:
         for p in partidos:
-            key_trend = candidatos.get(p)
+            key_trend = CANDIDATOS.get(p)
             volumen_busqueda = tendencias.get(key_trend, 0)
             intencion_directa = cis_actual.get(p, 1) # Evitar div/0
             
@@ -175,48 +180,55 @@ def analizar():
                 print(f"  {p}: Tendencias normales (Ratio {ratio:.1f})")
     else:
         print("  Sin datos de Google Trends para análisis cruzado")
+    return ajuste_voto_oculto
 
-    # PASO 3: Predicción final combinada
+def combinar_prediccion(base, sesgo_p, economico_p, ajuste_p, electo_val):
+    """
+    Fórmula de la predicción final de un partido. Funciona igual con escalares
+    que con arrays NumPy (un valor por escenario simulado).
+    Devuelve (final sin recortar, final >= 0).
+    """
+    # 1. Corregimos el sesgo del CIS (50% de corrección)
+    corregida = base - (sesgo_p * 0.5)
+    
+    # 2. Aplicamos la corrección económica (regresión provincial, ver socioeconomico.py)
+    corregida = corregida + economico_p
+        
+    # 3. Sumamos voto oculto específico
+    corregida = corregida + ajuste_p
+    
+    # 4. Mezclamos con Electomania actual para suavizar (70% proyección, 30% actual)
+    final = corregida * 0.7 + electo_val * 0.3
+    
+    # Aseguramos valor mínimo razonable
+    final = np.where((final < 0.5) & (base > 0), base * 0.5, final)
+    return final, np.maximum(0, final)
+
+def paso_prediccion(proyeccion_2027, sesgo, ajuste_economico, ajuste_voto_oculto, electomania, partidos=PARTIDOS):
+    """PASO 3: Predicción final combinada"""
     print("\n--- 3. PREDICCIÓN FINAL 2027 ---")
     prediccion = {}
     
     for p in partidos:
         # Empezamos con la proyección de tendencias (que ya mira a 2027)
         base = proyeccion_2027.get(p, 0)
-        
-        # 1. Corregimos el sesgo del CIS (50% de corrección)
-        corregida = base - (sesgo.get(p, 0) * 0.5)
-        
-        # 2. Aplicamos corrección por malestar económico (Bonifica oposición: PP/VOX)
-        if p in ['PP', 'VOX'] and factor_malestar > 0:
-            corregida += (factor_malestar * 0.5) # Repartimos el malestar
-        elif p in ['PSOE', 'SUMAR'] and factor_malestar > 0:
-            corregida -= (factor_malestar * 0.5) # Penalizamos gobierno
-            
-        # 3. Sumamos voto oculto específico
-        corregida += ajuste_voto_oculto.get(p, 0)
-        
-        # 4. Mezclamos con Electomania actual para suavizar (70% proyección, 30% actual)
-        electo_val = electomania.get(p, base)
-        final = corregida * 0.7 + electo_val * 0.3
-        
-        # Aseguramos valor mínimo razonable
-        if final < 0.5 and base > 0:
-            final = base * 0.5
-        
-        prediccion[p] = max(0, final)
+        final, recortada = combinar_prediccion(base, sesgo.get(p, 0), ajuste_economico.get(p, 0),
+                                               ajuste_voto_oculto.get(p, 0), electomania.get(p, base))
+        final = float(final)
+        prediccion[p] = float(recortada)
         
         print(f"{p}:")
         print(f"  Proyección 2027: {base:.2f}%")
         print(f"  - Sesgo CIS: {sesgo.get(p, 0)*0.5:+.2f}pp")
-        if factor_malestar > 0:
-            signo = "+" if p in ['PP', 'VOX'] else "-"
-            print(f"  {signo} Factor Económico: {factor_malestar*0.5:.2f}pp")
+        if ajuste_economico.get(p, 0):
+            print(f"  ± Factor Económico: {ajuste_economico[p]:+.2f}pp")
         if ajuste_voto_oculto.get(p, 0) > 0:
             print(f"  + Voto Oculto: {ajuste_voto_oculto[p]:+.2f}pp")
         print(f"  → FINAL: {final:.2f}%")
+    return prediccion
 
-    # Mostramos el resultado final
+def guardar_prediccion(prediccion):
+    """Muestra el ranking final y lo guarda en ARCHIVO_SALIDA"""
     print("\n" + "="*30)
     print("   ESTIMACIÓN 2027   ")
     print("="*30)
@@ -225,12 +237,127 @@ def analizar():
     for partido, porcentaje in ordenado:
         print(f"{partido:10} | {porcentaje:.2f}%")
 
-    # Guardamos a CSV
+    # Guardamos a CSV de forma atómica (tmp + rename): quien lo lea nunca ve un fichero a medias
     print(f"\nGuardando resultados en {ARCHIVO_SALIDA}")
-    with open(ARCHIVO_SALIDA, 'w') as f:
+    tmp = ARCHIVO_SALIDA + '.tmp'
+    with open(tmp, 'w') as f:
         f.write("Party,Estimated %\n")
         for partido, porcentaje in ordenado:
             f.write(f"{partido},{porcentaje:.2f}\n")
+    os.replace(tmp, ARCHIVO_SALIDA)
+
+def cubo_economia(lector):
+    """Indicadores provincia × indicador (NaN sin dato) de la matriz más reciente."""
+    data = lector.dato('ECONOMIC_MATRIX')
+    if data is not None:
+        return dimensiones.cubo_desde_matriz(data, dimensiones.DIMS_ECONOMIA)
+    # Logs anteriores a las matrices y a las filas ECONOMIC_*: agregado por filas
+    filas = lector.dato('ECONOMIC_CONTEXT', [])
+    return dimensiones.cubo_desde_celdas(dimensiones.DIMS_ECONOMIA, dimensiones.celdas_economicas(filas))
+
+def cubo_provincias(lector):
+    """Resultados elección × provincia × partido (NaN sin dato) de la matriz más reciente."""
+    data = lector.dato('OFFICIAL_PROVINCES_MATRIX')
+    if data is None:
+        return dimensiones.cubo_vacio(dimensiones.DIMS_PROVINCIAS)
+    return dimensiones.cubo_desde_matriz(data, dimensiones.DIMS_PROVINCIAS)
+
+def cargar_fuentes():
+    """Versión más reciente de cada fuente que usa el análisis"""
+    # El índice del log permite ir directamente a la versión más reciente de cada fuente;
+    # el archivo Parquet solo lee las familias (y columnas) de las fuentes pedidas
+    if SERVIDOR:
+        # Una sola consulta al servidor; sus respuestas ya llevan los rollups al día
+        base, vistas = LectorServidor(*SERVIDOR).precargar(FUENTES_ANALISIS), {}
+    elif ARCHIVO_PARQUET:
+        base, vistas = LectorArchivo(ARCHIVO_PARQUET), leer_rollups(ruta_rollups_archivo(ARCHIVO_PARQUET))
+    else:
+        base, vistas = LectorAlmacen(ARCHIVO_DATOS), leer_rollups(ruta_rollups(ARCHIVO_DATOS))
+    # Los agregados (matrices, históricos) salen de los rollups que materializa el servidor,
+    # o de las filas si no hay (ver common/rollups.py)
+    lector = LectorConRollups(base, vistas)
+    fuentes = fuentes_desde(lector)
+    lector.cerrar()
+    return fuentes
+
+def fuentes_desde(lector):
+    """Entradas del análisis a partir de un lector (cualquier objeto con dato(source, defecto))"""
+    return {
+        'cis_historico': lector.dato('CIS_HISTORICAL_MULTI', []),
+        'oficial': lector.dato('OFFICIAL_MULTI', {}),
+        'cis_actual': lector.dato('CIS_CURRENT', {}),
+        'electomania': lector.dato('ELECTOMANIA', {}),
+        'tendencias': lector.dato('GOOGLE_TRENDS', {}),
+        'electo_hist': lector.dato('ELECTOMANIA_HISTORICAL', []),
+        # Matrices indexadas por los ids de common/dimensiones.py
+        'economia': cubo_economia(lector),
+        'provincias': cubo_provincias(lector),
+    }
+
+def analizar():
+    """Función principal que realiza todo el análisis"""
+    f = cargar_fuentes()
+    
+    print("\n" + "="*50)
+    print("   SISTEMA DE PREDICCIÓN ELECTORAL 2027   ")
+    print("="*50 + "\n")
+
+    ajuste_economico = paso_economia(f['economia'], f['provincias'])
+    sesgo = paso_sesgo(emparejar_cis_oficial(f['cis_historico'], f['oficial']))
+    proyeccion_2027 = paso_tendencias(f['electo_hist'])
+    ajuste_voto_oculto = paso_voto_oculto(f['tendencias'], f['cis_actual'])
+    prediccion = paso_prediccion(proyeccion_2027, sesgo, ajuste_economico, ajuste_voto_oculto, f['electomania'])
+    guardar_prediccion(prediccion)
+
+def analizar_incremental(reiniciar=False):
+    """
+    Igual que analizar(), pero solo lee los registros añadidos desde la última
+    ejecución: el resto está resumido en el checkpoint (ver incremental.py).
+    """
+    cp = (incremental.checkpoint_vacio(VIDA_MEDIA_MESES) if reiniciar
+          else incremental.cargar_checkpoint(ARCHIVO_CHECKPOINT, VIDA_MEDIA_MESES))
+    errores = {}
+    nuevos = incremental.actualizar(cp, ARCHIVO_DATOS, errores)
+    incremental.guardar_checkpoint(ARCHIVO_CHECKPOINT, cp)
+
+    print("\n" + "="*50)
+    print("   SISTEMA DE PREDICCIÓN ELECTORAL 2027   ")
+    print("="*50)
+    print(f"(modo incremental: {nuevos} registros nuevos)\n")
+    if errores:
+        print(f"  Aviso: líneas mal formadas ignoradas: {errores}\n")
+
+    ajuste_economico = paso_economia(*incremental.socioeconomico(cp))
+    sesgo = paso_sesgo(emparejar_cis_oficial(incremental.agregado(cp, 'CIS_HISTORICAL_MULTI', []),
+                                             cp['ultimos'].get('OFFICIAL_MULTI', {})))
+    proyeccion_2027 = {p: 0.0 for p in PARTIDOS}
+    if cabecera_tendencias(incremental.n_encuestas(cp)):
+        proyeccion_2027 = mostrar_proyeccion(*incremental.rectas(cp))
+    ajuste_voto_oculto = paso_voto_oculto(cp['ultimos'].get('GOOGLE_TRENDS', {}),
+                                          cp['ultimos'].get('CIS_CURRENT', {}))
+    prediccion = paso_prediccion(proyeccion_2027, sesgo, ajuste_economico, ajuste_voto_oculto,
+                                 cp['ultimos'].get('ELECTOMANIA', {}))
+    guardar_prediccion(prediccion)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Análisis de sesgos y predicción electoral 2027")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Procesar solo los registros nuevos desde la última ejecución")
+    parser.add_argument('--reiniciar', action='store_true',
+                        help="Con --incremental, descartar el checkpoint y releer todo el log")
+    parser.add_argument('--archivo', metavar='DIR',
+                        help="Leer del archivo Parquet exportado con common/archivo.py en vez del log")
+    parser.add_argument('--servidor', metavar='HOST:PUERTO',
+                        help="Consultar al servidor de ingesta en marcha en vez de leer el log")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    analizar()
+    args = parse_args()
+    ARCHIVO_PARQUET = args.archivo
+    if args.servidor:
+        host, _, puerto = args.servidor.rpartition(':')
+        SERVIDOR = (host or '127.0.0.1', int(puerto))
+    if args.incremental:
+        analizar_incremental(args.reiniciar)
+    else:
+        analizar()
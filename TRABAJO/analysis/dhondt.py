@@ -0,0 +1,202 @@
+"""
+Proyección de escaños 2027 (Ley D'Hondt por provincia)
+
+Reparte los 350 escaños del Congreso con los escaños reales de cada
+circunscripción y la barrera del 3% de los votos de la provincia. El voto
+provincial se proyecta desde el nacional: cada partido conserva en cada
+provincia su proporción respecto al resultado nacional de la elección de
+referencia (OFFICIAL_PROVINCES_MATRIX).
+
+El reparto está vectorizado: las provincias con el mismo número de escaños
+se resuelven juntas, para todos los escenarios a la vez, buscando el cociente
+que ocupa el último escaño con np.partition; los empates con ese cociente se
+resuelven a favor del partido de índice menor. Se aplica tanto a la predicción
+puntual como a los escenarios de monte_carlo.py.
+
+Solo se reparten los partidos analizados: el voto del resto no tiene
+desglose provincial y no compite por los escaños.
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+import bias_calculator as bc
+import monte_carlo as mc
+from common import dimensiones
+
+ARCHIVO_ESCANOS = os.path.join(bc.BASE_DIR, '../data/seat_distribution_2027.csv')
+
+# Escaños por circunscripción (reparto vigente desde 2023, 350 en total)
+ESCANOS_PROVINCIA = {
+    'Alava': 4, 'Albacete': 4, 'Alicante': 12, 'Almeria': 6, 'Asturias': 7, 'Avila': 3, 'Badajoz': 5,
+    'Baleares': 8, 'Barcelona': 32, 'Burgos': 4, 'Caceres': 4, 'Cadiz': 9, 'Cantabria': 5, 'Castellon': 5,
+    'Ciudad Real': 5, 'Cordoba': 6, 'Coruña': 8, 'Cuenca': 3, 'Girona': 6, 'Granada': 7, 'Guadalajara': 3,
+    'Guipuzcoa': 6, 'Huelva': 5, 'Huesca': 3, 'Jaen': 5, 'Leon': 4, 'Lleida': 4, 'Lugo': 4, 'Madrid': 37,
+    'Malaga': 11, 'Murcia': 10, 'Navarra': 5, 'Ourense': 4, 'Palencia': 3, 'Las Palmas': 8, 'Pontevedra': 7,
+    'La Rioja': 4, 'Salamanca': 4, 'Santa Cruz de Tenerife': 7, 'Segovia': 3, 'Sevilla': 12, 'Soria': 2,
+    'Tarragona': 6, 'Teruel': 3, 'Toledo': 6, 'Valencia': 16, 'Valladolid': 5, 'Vizcaya': 8, 'Zamora': 3,
+    'Zaragoza': 7, 'Ceuta': 1, 'Melilla': 1,
+}
+TOTAL_ESCANOS = sum(ESCANOS_PROVINCIA.values())
+MAYORIA = TOTAL_ESCANOS // 2 + 1
+# Barrera legal: % de los votos válidos de la circunscripción
+UMBRAL = 3.0
+# Elección cuyo reparto provincial se usa para proyectar
+ELECCION_REFERENCIA = '23J-2023'
+
+
+def ratios_provinciales(provincias, oficial, partidos=bc.PARTIDOS, eleccion=ELECCION_REFERENCIA):
+    """
+    Matriz provincias × partidos (en el orden de dimensiones.PROVINCIAS) con
+    el voto provincial de cada partido dividido por su voto nacional en la
+    elección de referencia. Las provincias sin datos quedan a 1 (mismo voto
+    que el nacional).
+    """
+    voto = provincias[:, :, [dimensiones.IDS['partido'][p] for p in partidos]]
+    con_eleccion = np.flatnonzero(~np.isnan(voto).all(axis=(1, 2)))
+    if len(con_eleccion) == 0:
+        return np.ones((len(dimensiones.PROVINCIAS), len(partidos))), None, 0
+    e = dimensiones.IDS['eleccion'].get(eleccion)
+    if e not in con_eleccion:
+        # Sin la de referencia, la elección más reciente que haya (la tabla es cronológica)
+        e = con_eleccion[-1]
+    eleccion = dimensiones.ELECCIONES[e]
+    voto = voto[e]
+
+    ratios = np.ones_like(voto)
+    con_datos = ~np.isnan(voto).any(axis=1)
+    # Nacional oficial; si falta, la media de las provincias
+    nacional = np.array([oficial.get(eleccion, {}).get(p, np.nan) for p in partidos], dtype=float)
+    nacional = np.where(np.isnan(nacional), voto[con_datos].mean(axis=0), nacional)
+    ratios[con_datos] = np.divide(voto[con_datos], nacional, out=np.zeros_like(voto[con_datos]),
+                                  where=nacional > 0)
+    return ratios, eleccion, int(con_datos.sum())
+
+
+def repartir(votos, escanos, umbral=UMBRAL):
+    """
+    D'Hondt vectorizado. `votos` es escenarios × provincias × partidos (en %
+    del voto de la provincia) y `escanos` los escaños de cada provincia.
+    Devuelve los escaños de cada partido con la misma forma que `votos`.
+    """
+    votos = np.where(votos >= umbral, votos, 0.0)
+    S, R, P = votos.shape
+    resultado = np.zeros(votos.shape, dtype=np.int64)
+    for k in np.unique(escanos):
+        provincias = np.flatnonzero(escanos == k)
+        # Cocientes v/1 ... v/k de cada partido, en una fila por escenario y provincia
+        cocientes = (votos[:, provincias, :, None] / np.arange(1, k + 1)).reshape(S, len(provincias), P * k)
+        # El k-ésimo cociente más alto se lleva el último escaño
+        ultimo = -np.partition(-cocientes, k - 1, axis=-1)[..., k - 1:k]
+        mayores = cocientes > ultimo
+        # Empates con el último: los escaños que quedan, por orden de partido (primero el de índice menor)
+        empatados = (cocientes == ultimo) & (cocientes > 0)
+        faltan = k - mayores.sum(axis=-1, keepdims=True)
+        ganados = mayores | (empatados & (np.cumsum(empatados, axis=-1) <= faltan))
+        # Cada provincia reparte exactamente sus k escaños (ninguno si nadie pasa la barrera)
+        if not (ganados.sum(axis=-1) == np.where(cocientes.max(axis=-1) > 0, k, 0)).all():
+            raise RuntimeError(f"El reparto D'Hondt no asigna {k} escaños en alguna provincia de {k}")
+        resultado[:, provincias, :] = ganados.reshape(S, len(provincias), P, k).sum(axis=-1)
+    return resultado
+
+
+def escanos_nacional(nacional, modelo_escanos):
+    """Escaños por provincia (escenarios × provincias × partidos) de un voto nacional (escenarios × partidos)."""
+    votos = nacional[:, None, :] * modelo_escanos['ratios'][None, :, :]
+    return repartir(votos, modelo_escanos['escanos'])
+
+
+def reducir_escanos(modelo, final):
+    """Reductor de monte_carlo.simular: histogramas de escaños de un bloque."""
+    escanos = escanos_nacional(final, modelo)
+    S, R, P = escanos.shape
+    total = escanos.sum(axis=1)
+    tope = modelo['escanos'].max() + 1
+    por_provincia = np.bincount((escanos + np.arange(R * P).reshape(R, P) * tope).ravel(),
+                                minlength=R * P * tope)
+    return {
+        'n': S,
+        'total': np.bincount((total + np.arange(P) * (TOTAL_ESCANOS + 1)).ravel(),
+                             minlength=P * (TOTAL_ESCANOS + 1)).reshape(P, TOTAL_ESCANOS + 1),
+        'provincias': por_provincia.reshape(R, P, tope),
+        'mayoria': (total >= MAYORIA).sum(axis=0),
+    }
+
+
+def _resumen(histograma):
+    """Media y percentiles 5/50/95 de un histograma de escaños."""
+    n = histograma.sum()
+    acumulado = np.cumsum(histograma)
+    cuantiles = [int(np.searchsorted(acumulado, q * n)) for q in (0.05, 0.5, 0.95)]
+    return [float(np.arange(len(histograma)) @ histograma / n)] + cuantiles
+
+
+def guardar_escanos(puntual, total, partidos, ruta=None):
+    """CSV con una fila por ámbito (Total y cada provincia) y partido."""
+    ruta = ruta or ARCHIVO_ESCANOS
+    print(f"\nGuardando reparto de escaños en {ruta}")
+    with open(ruta, 'w') as f:
+        f.write("Scope,Party,Seats,Mean Seats,P05,P50,P95,Prob Majority\n")
+        orden = np.argsort(-puntual.sum(axis=0), kind='stable')
+        for j in orden:
+            media, p05, p50, p95 = _resumen(total['total'][j])
+            f.write(f"Total,{partidos[j]},{puntual[:, j].sum()},{media:.2f},{p05},{p50},{p95},"
+                    f"{total['mayoria'][j] / total['n']:.4f}\n")
+        for i, provincia in enumerate(dimensiones.PROVINCIAS):
+            for j in orden:
+                media, p05, p50, p95 = _resumen(total['provincias'][i, j])
+                f.write(f"{provincia},{partidos[j]},{puntual[i, j]},{media:.2f},{p05},{p50},{p95},\n")
+
+
+def analizar_escanos(simulaciones=mc.SIMULACIONES, procesos=None, tam_bloque=mc.TAM_BLOQUE, semilla=0):
+    """Predicción puntual + escenarios Monte Carlo, repartidos en escaños."""
+    f = bc.cargar_fuentes()
+    print("\n" + "="*50)
+    print("   PROYECCIÓN DE ESCAÑOS 2027 (D'HONDT)   ")
+    print("="*50 + "\n")
+    ajuste_economico = bc.paso_economia(f['economia'], f['provincias'])
+    sesgo = bc.paso_sesgo(bc.emparejar_cis_oficial(f['cis_historico'], f['oficial']))
+    proyeccion_2027 = bc.paso_tendencias(f['electo_hist'])
+    ajuste_voto_oculto = bc.paso_voto_oculto(f['tendencias'], f['cis_actual'])
+    prediccion = bc.paso_prediccion(proyeccion_2027, sesgo, ajuste_economico, ajuste_voto_oculto, f['electomania'])
+
+    modelo = mc.preparar_modelo(f, ajuste_economico, ajuste_voto_oculto)
+    partidos = modelo['partidos']
+    ratios, eleccion, n_provincias = ratios_provinciales(f['provincias'], f['oficial'], partidos)
+    modelo['ratios'] = ratios
+    modelo['escanos'] = np.array([ESCANOS_PROVINCIA[p] for p in dimensiones.PROVINCIAS])
+    print(f"\n--- REPARTO D'HONDT ({TOTAL_ESCANOS} escaños, barrera {UMBRAL}%) ---")
+    print(f"  Voto provincial de {eleccion}: {n_provincias}/{len(ESCANOS_PROVINCIA)} circunscripciones "
+          f"(el resto con el voto nacional)")
+
+    puntual = escanos_nacional(np.array([[prediccion[p] for p in partidos]]), modelo)[0]
+    inicio = time.perf_counter()
+    total = mc.simular(modelo, simulaciones, procesos, tam_bloque, semilla, reductor=reducir_escanos)
+    print(f"  {total['n']} escenarios repartidos en {time.perf_counter() - inicio:.2f}s")
+
+    print("\n" + "="*52)
+    print(f"{'Partido':10} | {'Escaños':>7} | {'P05':>4} | {'P50':>4} | {'P95':>4} | {'P(mayoría)':>10}")
+    print("="*52)
+    for j in np.argsort(-puntual.sum(axis=0), kind='stable'):
+        _, p05, p50, p95 = _resumen(total['total'][j])
+        print(f"{partidos[j]:10} | {puntual[:, j].sum():7d} | {p05:4d} | {p50:4d} | {p95:4d} | "
+              f"{total['mayoria'][j] / total['n']:10.1%}")
+    guardar_escanos(puntual, total, partidos)
+    return puntual, total
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Proyección de escaños 2027 por D'Hondt provincial")
+    parser.add_argument('--simulaciones', type=int, default=mc.SIMULACIONES, help="Escenarios Monte Carlo a repartir")
+    parser.add_argument('--procesos', type=int, default=None, help="Procesos del pool (por defecto, uno por CPU)")
+    parser.add_argument('--bloque', type=int, default=mc.TAM_BLOQUE, help="Escenarios por bloque (acota la memoria)")
+    parser.add_argument('--semilla', type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    analizar_escanos(args.simulaciones, args.procesos, args.bloque, args.semilla)
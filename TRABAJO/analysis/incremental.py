@@ -0,0 +1,252 @@
+"""
+Análisis incremental con checkpoint
+
+Guarda en un checkpoint hasta dónde se ha leído cada segmento del log y los
+estadísticos suficientes del análisis, de modo que cada ejecución solo lee y
+parsea los registros añadidos desde la anterior:
+
+- Los barómetros del CIS del CIS_HISTORICAL_MULTI más reciente (para el sesgo
+  medio, con el último OFFICIAL_MULTI).
+- Sumas de la regresión por partido (Σw, Σwx, Σwx², Σwy, Σwxy) de las
+  encuestas del ELECTOMANIA_HISTORICAL más reciente; solo se guardan las sumas.
+- Indicadores económicos y resultados de cada provincia (regresión socioeconómica).
+- Último CIS_CURRENT, ELECTOMANIA, GOOGLE_TRENDS y OFFICIAL_MULTI.
+
+Los agregados (AGREGADOS) se eligen igual que en el modo completo: el más
+reciente entre el registro que envía el scraper y la vista que materializa
+el servidor con sus filas (ver LectorConRollups). Cuando llega uno más
+reciente, lo guardado de él se sustituye entero: un barómetro o una encuesta
+que ya no está en el agregado deja de contar.
+
+Los segmentos que el checkpoint no conoce (por ejemplo, los que crea la
+compactación) se leen desde el principio, pero solo cuentan los registros
+recibidos después de la marca '_received_at' de la ejecución anterior.
+"""
+
+import json
+import os
+
+from trend_engine import matriz_encuestas, pesos_recencia, sumas_normales, recta_desde_sumas
+from common.storage import (LectorAlmacen, leer_manifiesto, rutas_segmentos, iterar_lineas, fuente_linea,
+                            recibido_linea)
+from common.rollups import Rollups, leer_rollups, rollup_de, ruta_rollups
+from common import dimensiones
+
+VERSION_CHECKPOINT = 5
+
+# Fuentes que usa el análisis (nombre exacto o prefijo)
+FUENTES = ('CIS_HISTORICAL_MULTI', 'OFFICIAL_MULTI', 'CIS_CURRENT', 'ELECTOMANIA',
+           'GOOGLE_TRENDS', 'ELECTOMANIA_HISTORICAL', 'ECONOMIC_MATRIX', 'OFFICIAL_PROVINCES_MATRIX',
+           'ECONOMIC_CONTEXT', 'OFFICIAL_PROVINCES_MULTI')
+PREFIJOS = ('CIS_BAROMETER_', 'ELECTOMANIA_POLL_', 'ECONOMIC_', 'PROVINCE_')
+
+
+def checkpoint_vacio(vida_media=None):
+    return {
+        'version': VERSION_CHECKPOINT,
+        'vida_media': vida_media,
+        'offsets': {},        # segmento -> bytes ya procesados
+        'recibido': '',       # '_received_at' más reciente procesado
+        'agregados': {},      # agregado -> {'recibido', 'vista', 'datos': lo que se guarda de él}
+        'registros': {},      # agregado -> '_received_at' de su último registro
+        'economia': {},       # 'provincia|indicador' -> valor
+        'provincias': {},     # 'elección|provincia|partido' -> voto
+        'ultimos': {},        # CIS_CURRENT / ELECTOMANIA / GOOGLE_TRENDS / OFFICIAL_MULTI
+    }
+
+
+def cargar_checkpoint(ruta, vida_media=None):
+    """
+    Lee el checkpoint. Si no existe, es de otra versión o se calculó con otros
+    pesos por recencia, se empieza de cero.
+    """
+    try:
+        with open(ruta, 'r', encoding='utf-8') as f:
+            cp = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return checkpoint_vacio(vida_media)
+    if cp.get('version') != VERSION_CHECKPOINT or cp.get('vida_media') != vida_media:
+        return checkpoint_vacio(vida_media)
+    return cp
+
+
+def guardar_checkpoint(ruta, cp):
+    """Escribe el checkpoint de forma atómica (tmp + rename)."""
+    tmp = ruta + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(cp, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, ruta)
+
+
+def relevante(source):
+    return source in FUENTES or (source is not None and source.startswith(PREFIJOS))
+
+
+def _sumas_encuestas(cp, encuestas):
+    """Sumas de la regresión de `encuestas`, con los mismos pesos que paso_tendencias."""
+    meses, partidos, Y = matriz_encuestas(encuestas)
+    h = cp['vida_media']
+    pesos = pesos_recencia(meses, h) if h and len(meses) else None
+    return {
+        'n': len(encuestas),
+        'partidos': partidos,
+        'sumas': [[float(v) for v in suma] for suma in sumas_normales(meses, Y, pesos)],
+    }
+
+
+# Agregado -> qué se guarda de él en el checkpoint
+AGREGADOS = {
+    'ELECTOMANIA_HISTORICAL': _sumas_encuestas,
+    'CIS_HISTORICAL_MULTI': lambda cp, barometros: [{'election_id': b.get('election_id'), 'data': b['data']}
+                                                    for b in barometros],
+}
+
+
+def _vista(cp, ruta_datos, nombre):
+    """
+    Vista del agregado en los rollups del servidor. Como en LectorConRollups,
+    si no hay vista guardada y nunca ha llegado el registro se construye con
+    las filas del almacén.
+    """
+    vista = leer_rollups(ruta_rollups(ruta_datos)).get(nombre)
+    if vista is None and nombre not in cp['registros']:
+        lector = LectorAlmacen(ruta_datos)
+        try:
+            vista = Rollups().cargar(lector, [nombre]).vista(nombre)
+        finally:
+            lector.cerrar()
+    return vista
+
+
+def _elegir_agregado(cp, ruta_datos, nombre, registro, filas_nuevas):
+    """
+    Se queda con la versión más reciente del agregado entre la del
+    checkpoint, el último registro nuevo y (si han llegado filas) la vista;
+    a igual '_received_at' gana la vista, como en LectorConRollups.
+    """
+    candidatos = []
+    if registro is not None:
+        cp['registros'][nombre] = max(cp['registros'].get(nombre, ''), registro[0])
+        candidatos.append((registro[0], False, registro[1]))
+    if filas_nuevas:
+        vista = _vista(cp, ruta_datos, nombre)
+        if vista is not None:
+            candidatos.append((vista['_received_at'], True, vista['data']))
+    if not candidatos:
+        return
+    recibido, es_vista, data = max(candidatos, key=lambda c: c[:2])
+    actual = cp['agregados'].get(nombre)
+    if actual is None or (recibido, es_vista) > (actual['recibido'], actual['vista']):
+        cp['agregados'][nombre] = {'recibido': recibido, 'vista': es_vista, 'datos': AGREGADOS[nombre](cp, data)}
+
+
+def _celdas(destino, celdas):
+    for nombres, valor in celdas:
+        destino['|'.join(nombres)] = valor
+
+
+def aplicar_registro(cp, source, data):
+    """
+    Actualiza los estadísticos del checkpoint con un registro del log. Los
+    AGREGADOS y sus filas no pasan por aquí: se eligen al final con _elegir_agregado.
+    """
+    if source in ('ECONOMIC_MATRIX', 'OFFICIAL_PROVINCES_MATRIX'):
+        _celdas(cp['economia' if source == 'ECONOMIC_MATRIX' else 'provincias'], dimensiones.celdas_matriz(data))
+    elif source == 'ECONOMIC_CONTEXT':
+        _celdas(cp['economia'], dimensiones.celdas_economicas(data))
+    elif source.startswith('ECONOMIC_'):
+        _celdas(cp['economia'], dimensiones.celdas_economicas([data]))
+    elif source == 'OFFICIAL_PROVINCES_MULTI':
+        _celdas(cp['provincias'], dimensiones.celdas_provinciales(data))
+    elif source.startswith('PROVINCE_'):
+        _celdas(cp['provincias'], dimensiones.celdas_provinciales([data]))
+    else:
+        cp['ultimos'][source] = data
+
+
+def actualizar(cp, ruta_datos, errores=None):
+    """
+    Lee del almacén solo lo que el checkpoint no ha visto todavía y lo aplica.
+    Devuelve el número de registros nuevos procesados; los que no se pueden
+    aplicar se cuentan en el dict `errores`. Si un segmento conocido ha
+    encogido (log sustituido), se descarta el checkpoint y se relee todo.
+    """
+    errores = {} if errores is None else errores
+    manifiesto = leer_manifiesto(ruta_datos)
+    rutas = rutas_segmentos(ruta_datos, manifiesto)
+    for nombre, ruta in zip(manifiesto['segmentos'], rutas):
+        tam = os.path.getsize(ruta) if os.path.exists(ruta) else 0
+        if cp['offsets'].get(nombre, 0) > tam:
+            vida_media = cp['vida_media']
+            cp.clear()
+            cp.update(checkpoint_vacio(vida_media))
+            break
+
+    marca = cp['recibido']
+    nuevos = 0
+    registros = {}  # agregado -> (recibido, data) de su último registro nuevo
+    filas_nuevas = set()  # agregados con filas nuevas
+    offsets = {}
+    for nombre, ruta in zip(manifiesto['segmentos'], rutas):
+        conocido = nombre in cp['offsets']
+        offset = cp['offsets'].get(nombre, 0)
+        if os.path.exists(ruta):
+            for offset, linea in iterar_lineas(ruta, offset):
+                recibido = recibido_linea(linea)
+                if not conocido and recibido <= marca:
+                    continue  # Ya procesado antes de la compactación
+                cp['recibido'] = max(cp['recibido'], recibido)
+                source = fuente_linea(linea)
+                if not relevante(source):
+                    continue
+                if rollup_de(source) in AGREGADOS:
+                    filas_nuevas.add(rollup_de(source))
+                    nuevos += 1
+                    continue
+                try:
+                    registro = json.loads(linea)
+                    if source in AGREGADOS:
+                        if source not in registros or recibido >= registros[source][0]:
+                            registros[source] = (recibido, registro['data'])
+                    else:
+                        aplicar_registro(cp, source, registro['data'])
+                    nuevos += 1
+                except ValueError:
+                    errores['json'] = errores.get('json', 0) + 1
+                except (KeyError, TypeError, AttributeError):
+                    errores['formato'] = errores.get('formato', 0) + 1
+        offsets[nombre] = offset
+    # Los segmentos que ya no están en el manifiesto se olvidan
+    cp['offsets'] = offsets
+    for nombre in AGREGADOS:
+        try:
+            _elegir_agregado(cp, ruta_datos, nombre, registros.get(nombre), nombre in filas_nuevas)
+        except (KeyError, TypeError, AttributeError, ValueError):
+            errores['formato'] = errores.get('formato', 0) + 1
+    return nuevos
+
+
+def socioeconomico(cp):
+    """Cubos (provincia × indicador, elección × provincia × partido) para la regresión socioeconómica."""
+    return tuple(dimensiones.cubo_desde_celdas(dims, ((k.split('|'), v) for k, v in cp[clave].items()))
+                 for clave, dims in (('economia', dimensiones.DIMS_ECONOMIA),
+                                     ('provincias', dimensiones.DIMS_PROVINCIAS)))
+
+
+def agregado(cp, nombre, defecto=None):
+    """Lo guardado del agregado más reciente (ver AGREGADOS), o `defecto` si no ha llegado."""
+    actual = cp['agregados'].get(nombre)
+    return actual['datos'] if actual is not None else defecto
+
+
+def n_encuestas(cp):
+    return agregado(cp, 'ELECTOMANIA_HISTORICAL', {'n': 0})['n']
+
+
+def rectas(cp):
+    """(partidos, pendientes, ordenadas) a partir de las sumas guardadas."""
+    tendencias = agregado(cp, 'ELECTOMANIA_HISTORICAL')
+    pendientes, ordenadas = recta_desde_sumas(*tendencias['sumas'])
+    return tendencias['partidos'], pendientes, ordenadas
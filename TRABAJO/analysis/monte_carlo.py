@@ -0,0 +1,221 @@
+"""
+Simulación Monte Carlo de la predicción 2027
+
+En vez de una sola estimación por partido, genera muchos escenarios:
+en cada uno se remuestrean (bootstrap) las encuestas de ELECTOMANIA_HISTORICAL
+para ajustar las tendencias y las elecciones con resultado oficial para el
+sesgo del CIS, y se aplica la misma fórmula final que bias_calculator.
+
+Los escenarios se simulan por bloques en un pool de procesos y cada bloque
+se reduce en el momento a un histograma por partido y a contadores (quién
+queda primero, quién supera a quién), de modo que la memoria no depende del
+número de simulaciones. De los histogramas salen los cuantiles.
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import bias_calculator as bc
+from trend_engine import matriz_encuestas, ajustar_tendencias_lote, pesos_recencia
+
+ARCHIVO_SIMULACION = os.path.join(bc.BASE_DIR, '../data/simulation_2027.csv')
+
+SIMULACIONES = 100_000
+TAM_BLOQUE = 20_000
+# Histograma de cada partido: 0-100% en cubos de 0.01pp
+RESOLUCION = 0.01
+N_CUBOS = int(round(100 / RESOLUCION))
+CUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+# Modelo y reductor del proceso actual (se fijan una vez por proceso del pool)
+_modelo = None
+_reductor = None
+
+
+def preparar_modelo(fuentes, ajuste_economico, ajuste_voto_oculto, partidos=bc.PARTIDOS):
+    """Arrays con todo lo que es fijo en todos los escenarios."""
+    electo_hist = fuentes['electo_hist'] or []
+    meses, _, Y = matriz_encuestas(electo_hist, partidos) if electo_hist else (np.zeros(0), partidos, np.zeros((0, len(partidos))))
+    pares = bc.emparejar_cis_oficial(fuentes['cis_historico'], fuentes['oficial'])
+    errores = np.array([[cis.get(p, 0) - real.get(p, 0) for p in partidos] for _, cis, real in pares],
+                       dtype=float).reshape(len(pares), len(partidos))
+    return {
+        'partidos': list(partidos),
+        'meses': meses,
+        'Y': Y,
+        'pesos': (pesos_recencia(meses, bc.VIDA_MEDIA_MESES) if bc.VIDA_MEDIA_MESES and len(meses)
+                  else np.ones(len(meses))),
+        'errores': errores,
+        'economico': np.array([ajuste_economico.get(p, 0) for p in partidos], dtype=float),
+        'ajuste': np.array([ajuste_voto_oculto.get(p, 0) for p in partidos], dtype=float),
+        'electomania': np.array([fuentes['electomania'].get(p, np.nan) for p in partidos], dtype=float),
+    }
+
+
+def simular_escenarios(modelo, n, rng):
+    """Matriz n × partidos con el voto final de cada escenario."""
+    partidos = modelo['partidos']
+    N, E = len(modelo['meses']), len(modelo['errores'])
+
+    # Tendencias: cada escenario reajusta las rectas con un remuestreo de las encuestas
+    if N >= 5:
+        recuentos = rng.multinomial(N, np.full(N, 1 / N), size=n) * modelo['pesos']
+        m, b = ajustar_tendencias_lote(modelo['meses'], modelo['Y'], recuentos)
+        base = m * 18 + b  # Enero 2027 = mes 18
+    else:
+        base = np.zeros((n, len(partidos)))
+
+    # Sesgo del CIS: media de los errores de un remuestreo de las elecciones
+    if E > 0:
+        sesgo = rng.multinomial(E, np.full(E, 1 / E), size=n) @ modelo['errores'] / E
+    else:
+        sesgo = np.zeros((n, len(partidos)))
+
+    final = np.empty((n, len(partidos)))
+    for j in range(len(partidos)):
+        electo = modelo['electomania'][j]
+        electo_val = base[:, j] if np.isnan(electo) else electo
+        _, final[:, j] = bc.combinar_prediccion(base[:, j], sesgo[:, j], modelo['economico'][j],
+                                               modelo['ajuste'][j], electo_val)
+    return final
+
+
+def reducir(final):
+    """Resumen de un bloque de escenarios que se puede sumar con el de otros bloques."""
+    n, P = final.shape
+    cubos = np.clip((final / RESOLUCION).astype(np.int64), 0, N_CUBOS - 1)
+    histograma = np.bincount((cubos + np.arange(P) * N_CUBOS).ravel(), minlength=P * N_CUBOS)
+    return {
+        'n': n,
+        'histograma': histograma.reshape(P, N_CUBOS),
+        'suma': final.sum(axis=0),
+        'suma2': (final * final).sum(axis=0),
+        'primero': np.bincount(final.argmax(axis=1), minlength=P),
+        # supera[i, j] = escenarios en los que el partido i saca más voto que el j
+        'supera': (final[:, :, None] > final[:, None, :]).sum(axis=0),
+    }
+
+
+def _iniciar(modelo, reductor):
+    global _modelo, _reductor
+    _modelo, _reductor = modelo, reductor
+
+
+def _bloque(n, semilla):
+    final = simular_escenarios(_modelo, n, np.random.default_rng(semilla))
+    return _reductor(_modelo, final) if _reductor else reducir(final)
+
+
+def simular(modelo, simulaciones=SIMULACIONES, procesos=None, tam_bloque=TAM_BLOQUE, semilla=0, reductor=None):
+    """
+    Simula `simulaciones` escenarios en bloques de `tam_bloque` repartidos en
+    `procesos` procesos (1 = en este proceso) y acumula sus resúmenes.
+    `reductor(modelo, final)` sustituye a reducir() para resumir otra cosa de
+    cada bloque (p.ej. los escaños, ver dhondt.py); debe devolver un dict de
+    valores sumables.
+    """
+    tamanos = [tam_bloque] * (simulaciones // tam_bloque)
+    if simulaciones % tam_bloque:
+        tamanos.append(simulaciones % tam_bloque)
+    semillas = np.random.SeedSequence(semilla).spawn(len(tamanos))
+
+    if procesos == 1:
+        _iniciar(modelo, reductor)
+        resumenes = map(_bloque, tamanos, semillas)
+        return _acumular(resumenes)
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar, initargs=(modelo, reductor)) as pool:
+        return _acumular(pool.map(_bloque, tamanos, semillas))
+
+
+def _acumular(resumenes):
+    total = None
+    for r in resumenes:
+        if total is None:
+            total = r
+        else:
+            for clave, valor in r.items():
+                total[clave] = total[clave] + valor
+    return total
+
+
+def cuantil(histograma, q):
+    """Cuantil q (0-1) a partir del histograma de un partido (centro del cubo)."""
+    acumulado = np.cumsum(histograma)
+    i = int(np.searchsorted(acumulado, q * acumulado[-1]))
+    return (i + 0.5) * RESOLUCION
+
+
+def resumen_partidos(total, partidos):
+    """Media, desviación, cuantiles y probabilidades de cada partido."""
+    n = total['n']
+    filas = []
+    for i, p in enumerate(partidos):
+        media = total['suma'][i] / n
+        filas.append({
+            'partido': p,
+            'media': media,
+            'std': float(np.sqrt(max(0.0, total['suma2'][i] / n - media * media))),
+            'cuantiles': [cuantil(total['histograma'][i], q) for q in CUANTILES],
+            'prob_primero': total['primero'][i] / n,
+            'prob_supera': {q: total['supera'][i, j] / n for j, q in enumerate(partidos) if q != p},
+        })
+    return sorted(filas, key=lambda f: f['media'], reverse=True)
+
+
+def guardar_simulacion(filas, partidos, ruta=None):
+    ruta = ruta or ARCHIVO_SIMULACION
+    print(f"\nGuardando simulación en {ruta}")
+    with open(ruta, 'w') as f:
+        cabecera = ["Party", "Mean %", "Std"] + [f"P{int(q * 100):02d}" for q in CUANTILES] + ["Prob First"]
+        cabecera += [f"P > {p}" for p in partidos]
+        f.write(",".join(cabecera) + "\n")
+        for fila in filas:
+            valores = [f"{fila['media']:.2f}", f"{fila['std']:.2f}"] + [f"{v:.2f}" for v in fila['cuantiles']]
+            valores.append(f"{fila['prob_primero']:.4f}")
+            valores += [f"{fila['prob_supera'][p]:.4f}" if p in fila['prob_supera'] else "" for p in partidos]
+            f.write(",".join([fila['partido']] + valores) + "\n")
+
+
+def analizar_monte_carlo(simulaciones=SIMULACIONES, procesos=None, tam_bloque=TAM_BLOQUE, semilla=0):
+    """Análisis completo con incertidumbre: pasos fijos de bias_calculator + simulación."""
+    fuentes = bc.cargar_fuentes()
+    print("\n" + "="*50)
+    print("   SIMULACIÓN MONTE CARLO 2027   ")
+    print("="*50 + "\n")
+    ajuste_economico = bc.paso_economia(fuentes['economia'], fuentes['provincias'])
+    ajuste_voto_oculto = bc.paso_voto_oculto(fuentes['tendencias'], fuentes['cis_actual'])
+    modelo = preparar_modelo(fuentes, ajuste_economico, ajuste_voto_oculto)
+
+    print(f"\n--- SIMULANDO {simulaciones} ESCENARIOS ---")
+    print(f"  Bootstrap de {len(modelo['meses'])} encuestas y {len(modelo['errores'])} elecciones con resultado oficial")
+    inicio = time.perf_counter()
+    total = simular(modelo, simulaciones, procesos, tam_bloque, semilla)
+    print(f"  {total['n']} escenarios en {time.perf_counter() - inicio:.2f}s")
+
+    filas = resumen_partidos(total, modelo['partidos'])
+    print("\n" + "="*60)
+    print(f"{'Partido':10} | {'Media':>6} | {'P05':>6} | {'P50':>6} | {'P95':>6} | {'P(1º)':>6}")
+    print("="*60)
+    for fila in filas:
+        c = fila['cuantiles']
+        print(f"{fila['partido']:10} | {fila['media']:6.2f} | {c[0]:6.2f} | {c[2]:6.2f} | {c[4]:6.2f} | {fila['prob_primero']:6.1%}")
+    guardar_simulacion(filas, modelo['partidos'])
+    return filas
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Simulación Monte Carlo de la predicción 2027")
+    parser.add_argument('--simulaciones', type=int, default=SIMULACIONES, help="Escenarios a simular (10^5 - 10^6)")
+    parser.add_argument('--procesos', type=int, default=None, help="Procesos del pool (por defecto, uno por CPU)")
+    parser.add_argument('--bloque', type=int, default=TAM_BLOQUE, help="Escenarios por bloque (acota la memoria)")
+    parser.add_argument('--semilla', type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    analizar_monte_carlo(args.simulaciones, args.procesos, args.bloque, args.semilla)
@@ -0,0 +1,136 @@
+"""
+Predicción 2027 continua contra el servidor de ingesta en marcha
+
+Se suscribe (common/suscripciones.py) a las fuentes que usa bias_calculator y
+mantiene en memoria la última versión de cada una y el resultado de cada paso
+del análisis. Cuando llega un registro nuevo solo se recalculan los pasos que
+dependen de esa fuente y la combinación final, y final_prediction_2027.csv se
+reescribe de forma atómica si la predicción cambia. Los pasos son los mismos
+de analizar(), así que el CSV coincide con el de una ejecución completa sobre
+los mismos datos.
+
+Si el servidor se apaga o corta la suscripción, se vuelve a conectar con
+espera creciente; al reconectar, el estado inicial que manda el servidor solo
+recalcula lo que haya cambiado mientras tanto.
+"""
+
+import argparse
+import contextlib
+import io
+import time
+from datetime import datetime
+
+import bias_calculator as bc
+from common.suscripciones import suscribirse
+
+# Espera entre reconexiones (segundos), doblándose hasta ESPERA_MAX
+ESPERA_INICIAL = 0.5
+ESPERA_MAX = 30
+
+# Pasos del análisis: fuentes de las que dependen y cómo se calculan a partir de fuentes_desde()
+PASOS = {
+    'economia': (('ECONOMIC_MATRIX', 'ECONOMIC_CONTEXT', 'OFFICIAL_PROVINCES_MATRIX'),
+                 lambda f: bc.paso_economia(f['economia'], f['provincias'])),
+    'sesgo': (('CIS_HISTORICAL_MULTI', 'OFFICIAL_MULTI'),
+              lambda f: bc.paso_sesgo(bc.emparejar_cis_oficial(f['cis_historico'], f['oficial']))),
+    'tendencias': (('ELECTOMANIA_HISTORICAL',),
+                   lambda f: bc.paso_tendencias(f['electo_hist'])),
+    'voto_oculto': (('GOOGLE_TRENDS', 'CIS_CURRENT'),
+                    lambda f: bc.paso_voto_oculto(f['tendencias'], f['cis_actual'])),
+}
+
+
+class EstadoEnVivo:
+    """Última versión de cada fuente del análisis y resultado de cada paso."""
+
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+        self.datos = {}
+        self.pasos = {}
+        self.prediccion = None
+
+    def dato(self, source, defecto=None):
+        return self.datos.get(source, defecto)
+
+    def aplicar(self, registros):
+        """
+        Incorpora los registros y recalcula lo que dependa de los que han
+        cambiado. Devuelve los pasos recalculados (vacío si nada cambió).
+        """
+        cambiadas = set()
+        for registro in registros:
+            source = registro['source']
+            if source in bc.FUENTES_ANALISIS and self.datos.get(source) != registro.get('data'):
+                self.datos[source] = registro.get('data')
+                cambiadas.add(source)
+        if not cambiadas and self.prediccion is not None:
+            return []
+        recalcular = [paso for paso, (fuentes, _) in PASOS.items()
+                      if paso not in self.pasos or cambiadas.intersection(fuentes)]
+        # Los pasos imprimen su detalle como en analizar(); sin --verbose se descarta
+        salida = contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(io.StringIO())
+        with salida:
+            f = bc.fuentes_desde(self)
+            for paso in recalcular:
+                self.pasos[paso] = PASOS[paso][1](f)
+            prediccion = bc.paso_prediccion(self.pasos['tendencias'], self.pasos['sesgo'],
+                                            self.pasos['economia'], self.pasos['voto_oculto'],
+                                            f['electomania'])
+            if prediccion != self.prediccion:
+                self.prediccion = prediccion
+                bc.guardar_prediccion(prediccion)
+        return recalcular + ['prediccion']
+
+
+def latencia_ms(registros):
+    """Milisegundos desde que el servidor recibió el registro más reciente del lote."""
+    recibidos = [r['_received_at'] for r in registros if r.get('_received_at')]
+    if not recibidos:
+        return None
+    return (datetime.now() - datetime.fromisoformat(max(recibidos))).total_seconds() * 1000
+
+
+def servir(host, port, verbose=False):
+    """Mantiene la predicción al día hasta Ctrl+C."""
+    estado = EstadoEnVivo(verbose)
+    espera = ESPERA_INICIAL
+    while True:
+        try:
+            for i, registros in enumerate(suscribirse(host, port, fuentes=bc.FUENTES_ANALISIS)):
+                espera = ESPERA_INICIAL
+                inicio = time.perf_counter()
+                pasos = estado.aplicar(registros)
+                if not pasos:
+                    continue
+                calculo = (time.perf_counter() - inicio) * 1000
+                latencia = latencia_ms(registros) if i > 0 else None
+                resumen = ', '.join(f"{p} {v:.2f}%" for p, v in
+                                    sorted(estado.prediccion.items(), key=lambda x: x[1], reverse=True))
+                print(f"[{datetime.now():%H:%M:%S}] {resumen} | pasos: {', '.join(pasos)} | "
+                      f"cálculo {calculo:.1f} ms" + (f", desde la recepción {latencia:.1f} ms" if latencia is not None else ""),
+                      flush=True)
+            print("El servidor ha cerrado la suscripción")
+        except (OSError, RuntimeError) as e:
+            print(f"Suscripción interrumpida: {e}")
+        print(f"Reconectando en {espera:g} s...")
+        time.sleep(espera)
+        espera = min(espera * 2, ESPERA_MAX)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Predicción 2027 actualizada con cada registro nuevo del servidor")
+    parser.add_argument('--servidor', metavar='HOST:PUERTO', default='127.0.0.1:9999',
+                        help="Servidor de ingesta al que suscribirse")
+    parser.add_argument('--salida', default=bc.ARCHIVO_SALIDA, help="CSV de la predicción")
+    parser.add_argument('--verbose', action='store_true', help="Mostrar el detalle de cada paso recalculado")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    bc.ARCHIVO_SALIDA = args.salida
+    host, _, puerto = args.servidor.rpartition(':')
+    try:
+        servir(host or '127.0.0.1', int(puerto), args.verbose)
+    except KeyboardInterrupt:
+        pass
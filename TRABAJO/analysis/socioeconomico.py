@@ -0,0 +1,68 @@
+"""
+Regresión socioeconómica provincial (NumPy)
+
+Construye una sola vez dos arrays unidos por el id de provincia:
+
+- V: elecciones × provincias × partidos, con el voto de OFFICIAL_PROVINCES_MATRIX.
+- X: provincias × indicadores, con los indicadores de ECONOMIC_MATRIX.
+
+y ajusta, para todas las elecciones y partidos en una única llamada a
+np.linalg.lstsq, voto = a + Σ β_k · (indicador_k - media_k). El efecto en la
+predicción de cada partido es el β medio entre elecciones multiplicado por
+la distancia de la media nacional de cada indicador a su nivel de referencia.
+
+Añadir un indicador es añadirlo a INDICADORES (y a REFERENCIA); una elección
+nueva entra sola al aparecer en la tabla de elecciones y en la matriz.
+"""
+
+import numpy as np
+
+from common.dimensiones import ELECCIONES, IDS
+
+# Indicadores del modelo (deben estar en la tabla de common/dimensiones.py)
+INDICADORES = ('unemployment_rate', 'avg_income_eur')
+# Nivel de cada indicador con el que no se corrige nada (situación económica "normal")
+REFERENCIA = {'unemployment_rate': 15.0, 'avg_income_eur': 25000.0}
+
+
+def arrays_provinciales(provincias, economia, partidos, indicadores=INDICADORES):
+    """
+    (elecciones, V, X) a partir de los cubos elección × provincia × partido y
+    provincia × indicador (ver common/dimensiones.py). Los dos comparten el
+    eje de provincias (el id), así que el cruce es directo. Solo se quedan
+    las elecciones con algún dato.
+    """
+    V = provincias[:, :, [IDS['partido'][p] for p in partidos]]
+    con_datos = np.flatnonzero(~np.isnan(V).all(axis=(1, 2)))
+    X = economia[:, [IDS['indicador'][k] for k in indicadores]]
+    return [ELECCIONES[e] for e in con_datos], V[con_datos], X
+
+
+def ajustar(V, X):
+    """
+    Mínimos cuadrados de todas las elecciones y partidos a la vez. Solo
+    cuentan las provincias con todos los datos. Devuelve (ordenadas E × P,
+    coeficientes E × P × indicadores, provincias usadas), o None si no hay
+    provincias suficientes para el ajuste.
+    """
+    E, R, P = V.shape
+    if E == 0:
+        return None
+    validas = ~np.isnan(X).any(axis=1) & ~np.isnan(V).any(axis=(0, 2))
+    if validas.sum() <= X.shape[1] + 1:
+        return None
+    Xv = X[validas]
+    A = np.column_stack([np.ones(len(Xv)), Xv - Xv.mean(axis=0)])
+    # Una columna de B por (elección, partido)
+    B = V[:, validas, :].transpose(1, 0, 2).reshape(len(Xv), E * P)
+    coef = np.linalg.lstsq(A, B, rcond=None)[0].reshape(1 + X.shape[1], E, P)
+    return coef[0], coef[1:].transpose(1, 2, 0), int(validas.sum())
+
+
+def efecto(coeficientes, X, indicadores=INDICADORES, referencia=REFERENCIA):
+    """
+    Corrección (pp) de cada partido: β medio entre elecciones por la distancia
+    de la media nacional de cada indicador a su referencia.
+    """
+    desvio = np.nanmean(X, axis=0) - np.array([referencia[k] for k in indicadores])
+    return coeficientes.mean(axis=0) @ desvio
@@ -0,0 +1,92 @@
+"""
+Motor de tendencias vectorizado (NumPy)
+
+Convierte una lista de encuestas en una matriz encuestas × partidos y ajusta
+la recta de todos los partidos a la vez, con mínimos cuadrados ponderados
+opcionales (por ejemplo, dando más peso a las encuestas recientes).
+"""
+
+import numpy as np
+
+# Julio 2025 = mes 0 (origen de la escala temporal de las proyecciones)
+MES_ORIGEN = np.datetime64('2025-07', 'M')
+
+
+def meses_desde_origen(fechas):
+    """Fechas 'YYYY-MM-DD' -> meses desde julio 2025 (se parsean todas de una vez)."""
+    dias = np.array(fechas, dtype='datetime64[D]')
+    return (dias.astype('datetime64[M]') - MES_ORIGEN).astype(float)
+
+
+def _numerico(valor):
+    # bool es subclase de int, pero no es un porcentaje
+    return isinstance(valor, (int, float)) and not isinstance(valor, bool)
+
+
+def matriz_encuestas(encuestas, partidos=None):
+    """
+    Construye (meses, partidos, Y) a partir de las encuestas.
+    Y es una matriz encuestas × partidos con NaN donde una encuesta no da
+    dato para un partido. Si no se indican partidos se usan todos los que
+    tienen algún valor numérico en los datos, en orden de aparición (así
+    claves como 'source' o 'fecha' no acaban como columnas vacías).
+    """
+    if partidos is None:
+        partidos = list(dict.fromkeys(p for e in encuestas for p, valor in e['data'].items()
+                                      if _numerico(valor)))
+    columnas = {p: j for j, p in enumerate(partidos)}
+    Y = np.full((len(encuestas), len(partidos)), np.nan)
+    for i, encuesta in enumerate(encuestas):
+        for p, valor in encuesta['data'].items():
+            j = columnas.get(p)
+            if j is not None and _numerico(valor):
+                Y[i, j] = valor
+    meses = meses_desde_origen([e['date'] for e in encuestas])
+    return meses, partidos, Y
+
+
+def pesos_recencia(meses, vida_media):
+    """Peso que se reduce a la mitad cada `vida_media` meses hacia atrás."""
+    return 0.5 ** ((meses.max() - meses) / vida_media)
+
+
+def sumas_normales(meses, Y, pesos=None):
+    """
+    Sumas de las ecuaciones normales (Σw, Σwx, Σwx², Σwy, Σwxy) de todos los
+    partidos a la vez. Las celdas NaN no cuentan para su partido.
+    """
+    W = ~np.isnan(Y) * (1.0 if pesos is None else pesos[:, None])
+    Yc = np.nan_to_num(Y)
+    return (W.sum(axis=0), meses @ W, (meses * meses) @ W,
+            (W * Yc).sum(axis=0), meses @ (W * Yc))
+
+
+def recta_desde_sumas(s0, sx, sxx, sy, sxy):
+    """Pendientes y ordenadas (m, b) a partir de las sumas, para todos los partidos."""
+    s0, sx, sxx, sy, sxy = (np.asarray(v, dtype=float) for v in (s0, sx, sxx, sy, sxy))
+    denom = s0 * sxx - sx * sx
+    with np.errstate(divide='ignore', invalid='ignore'):
+        m = np.where(denom != 0, (s0 * sxy - sx * sy) / denom, 0.0)
+        b = np.where(s0 > 0, (sy - m * sx) / s0, 0.0)
+    return m, b
+
+
+def ajustar_tendencias(meses, Y, pesos=None):
+    """
+    Ajusta y = m*x + b para todas las columnas de Y en una sola pasada.
+    Las celdas NaN no cuentan para su partido. Devuelve (m, b) como arrays.
+    """
+    return recta_desde_sumas(*sumas_normales(meses, Y, pesos))
+
+
+def ajustar_tendencias_lote(meses, Y, pesos):
+    """
+    Igual que ajustar_tendencias, pero para S juegos de pesos a la vez
+    (p.ej. recuentos de un bootstrap): `pesos` es S × encuestas y se
+    devuelven (m, b) de forma S × partidos.
+    """
+    M = (~np.isnan(Y)).astype(float)
+    Yc = np.nan_to_num(Y)
+    x = meses[:, None]
+    return recta_desde_sumas(pesos @ M, pesos @ (x * M), pesos @ (x * x * M),
+                             pesos @ Yc, pesos @ (x * Yc))
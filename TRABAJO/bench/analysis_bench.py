@@ -0,0 +1,168 @@
+"""
+Benchmark por fases del análisis (bias_calculator.analizar)
+
+Ejecuta las fases de analizar() por separado sobre un log (real o generado
+con generar_dataset.py) y mide el tiempo de cada una y su pico de memoria
+(tracemalloc). Además mide las rutas de lectura alternativas: la carga
+completa con cargar_datos(), el modo incremental (en frío y sin datos nuevos)
+y, con --archivo, la carga desde el archivo Parquet (common/archivo.py).
+El resultado sale en JSON.
+
+Ejemplo:
+    python3 bench/generar_dataset.py --lineas 1000000 --salida /tmp/atd/raw_data.jsonl
+    python3 bench/analysis_bench.py --datos /tmp/atd/raw_data.jsonl --repeticiones 3
+    python3 common/archivo.py --datos /tmp/atd/raw_data.jsonl --salida /tmp/atd/archivo
+    python3 bench/analysis_bench.py --datos /tmp/atd/raw_data.jsonl --archivo /tmp/atd/archivo
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BASE_DIR, '../analysis'))
+import bias_calculator as bc
+
+
+def fases_analizar():
+    """Las fases de analizar(), en orden, compartiendo el estado entre ellas."""
+    e = {}
+
+    def carga():
+        e['fuentes'] = bc.cargar_fuentes()
+
+    def sesgo():
+        f = e['fuentes']
+        e['economico'] = bc.paso_economia(f['economia'], f['provincias'])
+        e['sesgo'] = bc.paso_sesgo(bc.emparejar_cis_oficial(f['cis_historico'], f['oficial']))
+
+    def regresion():
+        e['proyeccion'] = bc.paso_tendencias(e['fuentes']['electo_hist'])
+
+    def voto_oculto():
+        f = e['fuentes']
+        e['ajuste'] = bc.paso_voto_oculto(f['tendencias'], f['cis_actual'])
+
+    def salida():
+        prediccion = bc.paso_prediccion(e['proyeccion'], e['sesgo'], e['economico'], e['ajuste'],
+                                        e['fuentes']['electomania'])
+        bc.guardar_prediccion(prediccion)
+
+    return [('carga', carga), ('sesgo', sesgo), ('regresion', regresion),
+            ('voto_oculto', voto_oculto), ('salida', salida)]
+
+
+def rutas_alternativas(archivo=None):
+    """Otras formas de leer el log, para comparar con la carga por índice."""
+    def carga_completa():
+        for _ in bc.cargar_datos():
+            pass
+
+    def incremental_frio():
+        bc.analizar_incremental(reiniciar=True)
+
+    def incremental_sin_cambios():
+        bc.analizar_incremental()
+
+    def carga_archivo():
+        bc.ARCHIVO_PARQUET = archivo
+        try:
+            bc.cargar_fuentes()
+        finally:
+            bc.ARCHIVO_PARQUET = None
+
+    rutas = [('carga_completa', carga_completa), ('incremental_frio', incremental_frio),
+             ('incremental_sin_cambios', incremental_sin_cambios)]
+    if archivo:
+        rutas.append(('carga_archivo', carga_archivo))
+    return rutas
+
+
+def medir(fases, repeticiones, memoria):
+    """
+    Ejecuta la lista de fases `repeticiones` veces midiendo tiempos y, si se
+    pide, una vez más con tracemalloc para el pico de memoria de cada fase
+    (tracemalloc ralentiza, así que no se mezcla con los tiempos).
+    """
+    tiempos = {nombre: [] for nombre, _ in fases}
+    for _ in range(repeticiones):
+        for nombre, fase in fases:
+            inicio = time.perf_counter()
+            fase()
+            tiempos[nombre].append(time.perf_counter() - inicio)
+    picos = {}
+    if memoria:
+        tracemalloc.start()
+        for nombre, fase in fases:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            fase()
+            picos[nombre] = (tracemalloc.get_traced_memory()[1] - base) / (1024 * 1024)
+        tracemalloc.stop()
+    return {
+        nombre: {
+            'mediana_s': round(statistics.median(t), 4),
+            'min_s': round(min(t), 4),
+            'pico_mb': round(picos[nombre], 3) if nombre in picos else None,
+        }
+        for nombre, t in tiempos.items()
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark por fases de bias_calculator")
+    parser.add_argument('--datos', default=bc.ARCHIVO_DATOS, help="Log a analizar (raw_data.jsonl)")
+    parser.add_argument('--archivo', help="Archivo Parquet del mismo log, para medir también su carga")
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--sin-memoria', dest='memoria', action='store_false',
+                        help="No medir el pico de memoria con tracemalloc")
+    parser.add_argument('--sin-alternativas', dest='alternativas', action='store_false',
+                        help="Medir solo las fases de analizar()")
+    parser.add_argument('--salida', help="Fichero JSON de resultados (por defecto, stdout)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory(prefix='analysis_bench_') as tmp:
+        # El benchmark no toca los ficheros de salida reales
+        bc.ARCHIVO_DATOS = args.datos
+        bc.ARCHIVO_SALIDA = os.path.join(tmp, 'final_prediction_2027.csv')
+        bc.ARCHIVO_CHECKPOINT = os.path.join(tmp, 'analysis_checkpoint.json')
+        with contextlib.redirect_stdout(io.StringIO()):
+            fases = medir(fases_analizar(), args.repeticiones, args.memoria)
+            alternativas = medir(rutas_alternativas(args.archivo), args.repeticiones, args.memoria) if args.alternativas else {}
+
+    informe = {
+        'datos': {
+            'ruta': args.datos,
+            'bytes': os.path.getsize(args.datos),
+        },
+        'archivo': {
+            'ruta': args.archivo,
+            'bytes': sum(os.path.getsize(os.path.join(d, f)) for d, _, fs in os.walk(args.archivo) for f in fs),
+        } if args.archivo else None,
+        'repeticiones': args.repeticiones,
+        'fases': fases,
+        'total_analizar_s': round(sum(f['mediana_s'] for f in fases.values()), 4),
+        'alternativas': alternativas,
+        'ru_maxrss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    texto = json.dumps(informe, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            f.write(texto + '\n')
+    else:
+        print(texto)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Registros (source, data) con la forma de los que envían los scrapers, para
+los benchmarks y el generador de datasets. Salen del log real o de los
+propios generadores de los scrapers (con las fuentes que usa cada main()).
+"""
+
+import contextlib
+import json
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ARCHIVO_DATOS = os.path.join(BASE_DIR, '../data/raw_data.jsonl')
+
+sys.path.append(os.path.join(BASE_DIR, '../scrapers'))
+
+
+def formas_log(ruta=ARCHIVO_DATOS):
+    """Todos los registros del log (source, data), en el orden en que llegaron."""
+    formas = []
+    with open(ruta, 'r', encoding='utf-8') as f:
+        for linea in f:
+            try:
+                registro = json.loads(linea)
+                formas.append((registro['source'], registro['data']))
+            except (ValueError, KeyError, TypeError):
+                continue
+    return formas
+
+
+def formas_scrapers():
+    """
+    Una ejecución completa de los cinco scrapers: los mismos registros, en el
+    mismo orden y con las mismas fuentes que envía el main() de cada uno.
+    """
+    # Los avisos de los scrapers no deben mezclarse con el JSON de resultados
+    with contextlib.redirect_stdout(sys.stderr):
+        import cis_scraper
+        import electomania_scraper
+        import resultados_scraper
+        import scraper_economia
+        import trends_selenium
+
+        barometros = cis_scraper.obtener_barometros_historicos()
+        demograficos = cis_scraper.obtener_datos_demograficos()
+        regionales = cis_scraper.obtener_datos_regionales()
+        provincial = resultados_scraper.get_provincial_breakdown_multi_year()
+        historico = electomania_scraper.get_electopanel_historical()
+        series = trends_selenium.get_time_series_data()
+        economia = scraper_economia.get_economic_context()
+        formas = [('CIS_CURRENT', cis_scraper.obtener_barometro_actual())]
+        tendencias = trends_selenium.get_trends()
+
+    formas += [(f"CIS_BAROMETER_{i}_{bar['election_id']}", bar) for i, bar in enumerate(barometros, 1)]
+    formas.append(('CIS_HISTORICAL_MULTI', barometros))
+    formas.append(('CIS_LEADERS', {'Sanchez': 4.3, 'Feijoo': 4.5, 'Diaz': 4.7, 'Abascal': 2.9}))
+    formas += [(f"CIS_DEMO_{grupo}", {grupo: demograficos[grupo]}) for grupo in demograficos]
+    formas.append(('CIS_DEMOGRAPHICS', demograficos))
+    formas += [(f"CIS_REGION_{region.replace(' ', '_')}", {region: regionales[region]}) for region in regionales]
+    formas.append(('CIS_REGIONAL_MATRIX', cis_scraper.matriz_regional(regionales)))
+    formas.append(('OFFICIAL_MULTI', resultados_scraper.get_all_official_results()))
+    formas += [(f"PROVINCE_{r['election_id']}_{r['province'].replace(' ', '_')}", r) for r in provincial]
+    formas.append(('OFFICIAL_PROVINCES_MATRIX', resultados_scraper.matriz_provincial(provincial)))
+    formas += [(f"ELECTOMANIA_POLL_{i+1}", poll) for i, poll in enumerate(historico)]
+    formas.append(('ELECTOMANIA_HISTORICAL', historico))
+    formas.append(('ELECTOMANIA', dict(historico[0]['data'], source='Electomania Latest')))
+    formas.append(('GOOGLE_TRENDS', tendencias))
+    formas += [(f"TRENDS_DAY_{p['date']}", p) for p in series]
+    formas.append(('GOOGLE_TRENDS_SERIES', series))
+    formas += [(f"ECONOMIC_{r['province'].replace(' ', '_')}", r) for r in economia]
+    formas.append(('ECONOMIC_MATRIX', scraper_economia.matriz_economica(economia)))
+    return formas
+
+
+def cargar_formas(origen, ruta=ARCHIVO_DATOS):
+    """origen: 'log' (raw_data.jsonl) o 'scrapers' (generadores)."""
+    return formas_log(ruta) if origen == 'log' else formas_scrapers()
@@ -0,0 +1,192 @@
+"""
+Generador de datasets sintéticos (raw_data.jsonl) de tamaño configurable
+
+Simula muchas ejecuciones del pipeline, una cada `horas` horas, con los
+mismos registros y fuentes que envían los scrapers (ver formas.py):
+
+- Lo que no cambia entre ejecuciones (barómetros, resultados provinciales,
+  desgloses regionales, ...) se repite tal cual en cada una, igual que en
+  el log real.
+- Cada ejecución añade una encuesta nueva (paseo aleatorio) y el histórico
+  de Electomanía crece hasta `max_historico` encuestas.
+- La serie de Trends se desplaza con la fecha de la ejecución.
+- El paro provincial y el CIS actual varían un poco.
+- Una fracción de ejecuciones son reenvíos idénticos de la anterior.
+
+Las líneas tienen el mismo formato que escribe el servidor y, por defecto,
+se escribe también el índice .idx.
+
+Ejemplo:
+    python3 bench/generar_dataset.py --lineas 1000000 --salida /tmp/atd/raw_data.jsonl
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BASE_DIR, '..'))
+from common.storage import linea_indice, ruta_indice
+from formas import formas_scrapers
+import scraper_economia
+
+INICIO = datetime(2025, 7, 1)
+PARTIDOS_ENCUESTA = ('PP', 'PSOE', 'VOX', 'SUMAR')
+# Encuestas que se envían también como registros individuales (como el scraper)
+ENCUESTAS_INDIVIDUALES = 15
+
+
+def _grupo(source):
+    """Bloque dinámico al que pertenece una fuente (None si se repite igual en cada ejecución)."""
+    if source == 'CIS_CURRENT':
+        return 'cis_actual'
+    if source.startswith('ELECTOMANIA'):
+        return 'encuestas'
+    if source.startswith('TRENDS_DAY_') or source == 'GOOGLE_TRENDS_SERIES':
+        return 'tendencias'
+    if source.startswith('ECONOMIC_'):
+        return 'economia'
+    return None
+
+
+class Generador:
+    """Produce, ejecución a ejecución, las líneas (source, data en JSON) del log."""
+
+    def __init__(self, semilla=0, horas=6, max_historico=200):
+        random.seed(semilla)  # Los generadores de los scrapers usan el random global
+        self.rnd = random.Random(semilla)
+        self.horas = horas
+        self.max_historico = max_historico
+        plantilla = formas_scrapers()
+        self.cis_actual = dict(plantilla[0][1])
+        self.economia = [d for s, d in plantilla if s.startswith('ECONOMIC_') and s != 'ECONOMIC_MATRIX']
+        ultima = next(d for s, d in plantilla if s == 'ELECTOMANIA_HISTORICAL')[0]['data']
+        self.ultima_encuesta = {p: ultima[p] for p in PARTIDOS_ENCUESTA}
+        self.encuestas = []  # JSON de cada encuesta, de la más antigua a la más reciente
+
+        # Orden de la ejecución: registros fijos (ya codificados) y bloques dinámicos
+        self.orden = []
+        vistos = set()
+        for source, data in plantilla:
+            grupo = _grupo(source)
+            if grupo is None:
+                self.orden.append((source, json.dumps(data)))
+            elif grupo not in vistos:
+                vistos.add(grupo)
+                self.orden.append((grupo, None))
+
+    def fecha(self, k):
+        return INICIO + timedelta(hours=self.horas * k)
+
+    def _cis_actual(self, k):
+        data = {p: round(v + self.rnd.uniform(-0.5, 0.5), 1) if isinstance(v, float) else v
+                for p, v in self.cis_actual.items()}
+        return [('CIS_CURRENT', json.dumps(data))]
+
+    def _encuestas(self, k):
+        self.ultima_encuesta = {p: round(max(0.5, v + self.rnd.gauss(0, 0.4)), 1)
+                                for p, v in self.ultima_encuesta.items()}
+        encuesta = {'date': self.fecha(k).strftime('%Y-%m-%d'), 'pollster': 'Electomania',
+                    'data': self.ultima_encuesta}
+        self.encuestas.append(json.dumps(encuesta))
+        if len(self.encuestas) > self.max_historico:
+            del self.encuestas[:-self.max_historico]
+        recientes = self.encuestas[::-1]
+        lineas = [(f"ELECTOMANIA_POLL_{i+1}", e) for i, e in enumerate(recientes[:ENCUESTAS_INDIVIDUALES])]
+        lineas.append(('ELECTOMANIA_HISTORICAL', '[' + ', '.join(recientes) + ']'))
+        lineas.append(('ELECTOMANIA', json.dumps(dict(self.ultima_encuesta, source='Electomania Latest'))))
+        return lineas
+
+    def _tendencias(self, k):
+        hoy = self.fecha(k)
+        serie = []
+        for i in range(90):
+            ruido = self.rnd.randint(-15, 15)
+            serie.append({
+                'date': (hoy - timedelta(days=i)).strftime('%Y-%m-%d'),
+                'Feijoo': max(0, min(100, 65 + ruido)),
+                'Sanchez': max(0, min(100, 70 + ruido)),
+                'Abascal': max(0, min(100, 45 + ruido)),
+                'Diaz': max(0, min(100, 50 + ruido)),
+            })
+        lineas = [(f"TRENDS_DAY_{p['date']}", json.dumps(p)) for p in serie]
+        lineas.append(('GOOGLE_TRENDS_SERIES', json.dumps(serie)))
+        return lineas
+
+    def _economia(self, k):
+        filas = [dict(r, unemployment_rate=round(max(1.0, r['unemployment_rate'] + self.rnd.uniform(-0.3, 0.3)), 2))
+                 for r in self.economia]
+        self.economia = filas
+        lineas = [(f"ECONOMIC_{r['province'].replace(' ', '_')}", json.dumps(r)) for r in filas]
+        lineas.append(('ECONOMIC_MATRIX', json.dumps(scraper_economia.matriz_economica(filas))))
+        return lineas
+
+    def ejecucion(self, k):
+        """Líneas (source, data en JSON) de la ejecución número k."""
+        lineas = []
+        for source, data in self.orden:
+            if data is not None:
+                lineas.append((source, data))
+            else:
+                lineas.extend(getattr(self, '_' + source)(k))
+        return lineas
+
+
+def generar(ruta, lineas, semilla=0, horas=6, max_historico=200, duplicados=0.1, indice=True):
+    """
+    Escribe `lineas` líneas en `ruta` (y su índice). Devuelve un resumen
+    con las ejecuciones simuladas y el tamaño del fichero.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)) or '.', exist_ok=True)
+    generador = Generador(semilla, horas, max_historico)
+    escritas = 0
+    offset = 0
+    ejecuciones = repetidas = 0
+    anterior = None
+    with open(ruta, 'wb') as datos, (open(ruta_indice(ruta), 'wb') if indice else open(os.devnull, 'wb')) as idx:
+        while escritas < lineas:
+            k = ejecuciones
+            if anterior is not None and generador.rnd.random() < duplicados:
+                actual = anterior  # El scraper reenvía exactamente lo mismo
+                repetidas += 1
+            else:
+                actual = generador.ejecucion(k)
+            recibido = generador.fecha(k)
+            for i, (source, data) in enumerate(actual[:lineas - escritas]):
+                marca = (recibido + timedelta(milliseconds=i)).isoformat(timespec='microseconds')
+                linea = f'{{"source": {json.dumps(source)}, "data": {data}, "_received_at": "{marca}"}}\n'.encode('utf-8')
+                datos.write(linea)
+                idx.write(linea_indice(source, offset, len(linea)))
+                offset += len(linea)
+            escritas += min(len(actual), lineas - escritas)
+            anterior = actual
+            ejecuciones += 1
+    return {'ruta': ruta, 'lineas': escritas, 'bytes': offset, 'ejecuciones': ejecuciones,
+            'ejecuciones_repetidas': repetidas, 'encuestas_historico': len(generador.encuestas)}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Genera un raw_data.jsonl sintético con la forma del real")
+    parser.add_argument('--lineas', type=int, default=10_000, help="Líneas a generar (p.ej. 10^4 a 10^7)")
+    parser.add_argument('--salida', required=True, help="Fichero raw_data.jsonl de destino")
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--horas', type=float, default=6, help="Horas entre ejecuciones simuladas")
+    parser.add_argument('--max-historico', type=int, default=200,
+                        help="Encuestas máximas en ELECTOMANIA_HISTORICAL")
+    parser.add_argument('--duplicados', type=float, default=0.1,
+                        help="Fracción de ejecuciones que reenvían la anterior sin cambios")
+    parser.add_argument('--sin-indice', dest='indice', action='store_false', help="No escribir el .idx")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    inicio = time.perf_counter()
+    resumen = generar(args.salida, args.lineas, args.semilla, args.horas, args.max_historico,
+                      args.duplicados, args.indice)
+    resumen['segundos'] = round(time.perf_counter() - inicio, 2)
+    print(json.dumps(resumen, indent=2, ensure_ascii=False))
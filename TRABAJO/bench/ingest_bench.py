@@ -0,0 +1,296 @@
+"""
+Benchmark de ingesta del servidor de sockets
+
+Simula N scrapers concurrentes (un proceso cada uno) que reenvían registros
+con la forma real (del log o de los generadores de los scrapers) y mide
+throughput, latencia de cada envío hasta su ACK, errores y memoria (RSS) del
+servidor. El resultado sale en JSON para comparar modos del servidor y
+detectar regresiones. Como los mensajes se reutilizan, con la deduplicación
+del servidor casi todos acaban siendo duplicados: para medir la escritura,
+lanzar el servidor con --sin-dedup.
+
+Ejemplos:
+    python3 bench/ingest_bench.py --clientes 16 --duracion 10 --lote 50
+    python3 bench/ingest_bench.py --lanzar-servidor="--async --fsync intervalo" --salida async.json
+    python3 bench/ingest_bench.py --lanzar-servidor="--sin-dedup" --lote 50
+    python3 bench/ingest_bench.py --lanzar-servidor="--sin-dedup --workers 4" --clientes 16 --lote 50
+    python3 bench/ingest_bench.py --legacy --clientes 8      # clientes sin framing, una conexión por mensaje
+    python3 bench/ingest_bench.py --lote 50 --codificacion msgpack --compresion zlib
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BASE_DIR, '..'))
+from common.protocol import (TIPO_REGISTRO, TIPO_LOTE, TIPO_ACK, ErrorProtocolo, empaquetar, leer_frame,
+                             codificar, disponibles)
+from formas import cargar_formas, ARCHIVO_DATOS
+
+HOST = '127.0.0.1'
+PORT = 9999
+# Mensajes distintos que prepara cada cliente antes de empezar (se reutilizan en bucle)
+MENSAJES_PREPARADOS = 64
+
+
+def rellenar(formas, tam):
+    """Añade un campo de relleno a cada registro para que ocupe unos `tam` bytes en JSON."""
+    if tam <= 0:
+        return formas
+    resultado = []
+    for source, data in formas:
+        base = len(json.dumps({'source': source, 'data': data}))
+        if not isinstance(data, dict):
+            data = {'valor': data}
+        resultado.append((source, dict(data, _relleno='x' * max(0, tam - base))))
+    return resultado
+
+
+def preparar_mensajes(formas, lote, legacy, semilla, codificacion='json', compresion=None):
+    """
+    Mensajes ya codificados (frame o JSON sin framing) con `lote` registros
+    cada uno. Los frames se comprimen siempre que se pida compresión.
+    """
+    rnd = random.Random(semilla)
+    mensajes = []
+    for _ in range(MENSAJES_PREPARADOS):
+        registros = [{'source': s, 'data': d} for s, d in (rnd.choice(formas) for _ in range(lote))]
+        if legacy:
+            payload = json.dumps(registros[0]).encode('utf-8')
+            mensajes.append((payload, 1, len(payload)))
+        elif lote == 1:
+            flags, payload = codificar(registros[0], codificacion, compresion)
+            mensajes.append((empaquetar(TIPO_REGISTRO, payload, flags), 1, len(payload)))
+        else:
+            flags, payload = codificar(registros, codificacion, compresion)
+            mensajes.append((empaquetar(TIPO_LOTE, payload, flags), lote, len(payload)))
+    return mensajes
+
+
+def _enviar_legacy(host, port, mensaje):
+    with socket.create_connection((host, port)) as s:
+        s.sendall(mensaje)
+        respuesta = b''
+        while True:
+            trozo = s.recv(16)
+            if not trozo:
+                break
+            respuesta += trozo
+    return respuesta == b'ACK'
+
+
+def cliente(config, formas, semilla):
+    """
+    Un scraper simulado: envía mensajes hasta agotar la duración (o el número
+    de mensajes) y devuelve sus contadores y las latencias de cada envío.
+    """
+    mensajes = preparar_mensajes(formas, config['lote'], config['legacy'], semilla,
+                                 config['codificacion'], config['compresion'])
+    stats = {'mensajes': 0, 'registros': 0, 'bytes': 0, 'err': 0, 'rechazadas': 0, 'otros': 0,
+             'latencias': []}
+    conexion = None
+    fin = time.monotonic() + config['duracion']
+    i = 0
+    while time.monotonic() < fin and (not config['mensajes'] or i < config['mensajes']):
+        mensaje, n, tam = mensajes[i % len(mensajes)]
+        i += 1
+        inicio = time.perf_counter()
+        try:
+            if config['legacy']:
+                ok = _enviar_legacy(config['host'], config['port'], mensaje)
+            else:
+                if conexion is None:
+                    conexion = socket.create_connection((config['host'], config['port']))
+                conexion.sendall(mensaje)
+                respuesta = leer_frame(conexion)
+                if respuesta is None:
+                    raise ConnectionError("El servidor cerró la conexión")
+                ok = respuesta[0] == TIPO_ACK
+                if not config['reutilizar']:
+                    conexion.close()
+                    conexion = None
+        except ConnectionRefusedError:
+            stats['rechazadas'] += 1
+            time.sleep(0.01)
+            continue
+        except (OSError, ErrorProtocolo):
+            stats['otros'] += 1
+            if conexion is not None:
+                conexion.close()
+                conexion = None
+            continue
+        stats['latencias'].append(time.perf_counter() - inicio)
+        if ok:
+            stats['mensajes'] += 1
+            stats['registros'] += n
+            stats['bytes'] += tam
+        else:
+            stats['err'] += 1
+    if conexion is not None:
+        conexion.close()
+    return stats
+
+
+def rss_mb(pid):
+    """(RSS actual, pico de RSS) del proceso en MB, leídos de /proc (None si no se puede)."""
+    valores = {}
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for linea in f:
+                clave, _, resto = linea.partition(':')
+                if clave in ('VmRSS', 'VmHWM'):
+                    valores[clave] = int(resto.split()[0]) / 1024
+    except (OSError, ValueError):
+        return None, None
+    return valores.get('VmRSS'), valores.get('VmHWM')
+
+
+def percentil(ordenadas, q):
+    if not ordenadas:
+        return None
+    return ordenadas[min(len(ordenadas) - 1, int(q / 100 * len(ordenadas)))]
+
+
+def lanzar_servidor(opciones, port, directorio):
+    """Arranca server/server.py sobre un log temporal y espera a que acepte conexiones."""
+    comando = [sys.executable, os.path.join(BASE_DIR, '../server/server.py'),
+               '--port', str(port), '--datos', os.path.join(directorio, 'raw_data.jsonl'),
+               '--metricas-port', '0', *opciones]
+    proceso = subprocess.Popen(comando, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    limite = time.monotonic() + 15
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"El servidor terminó al arrancar (código {proceso.returncode})")
+        try:
+            socket.create_connection((HOST, port), timeout=0.5).close()
+            return proceso
+        except OSError:
+            time.sleep(0.05)
+    proceso.kill()
+    raise RuntimeError("El servidor no acepta conexiones")
+
+
+def ejecutar(config, formas, pid_servidor=None):
+    """Lanza los clientes, mide mientras tanto el RSS del servidor y agrega los resultados."""
+    muestras_rss = []
+    parar = threading.Event()
+
+    def muestrear():
+        while not parar.wait(0.2):
+            actual, _ = rss_mb(pid_servidor)
+            if actual is not None:
+                muestras_rss.append(actual)
+
+    if pid_servidor:
+        threading.Thread(target=muestrear, daemon=True).start()
+    rss_inicio = rss_mb(pid_servidor)[0] if pid_servidor else None
+    inicio = time.perf_counter()
+    with multiprocessing.Pool(config['clientes']) as pool:
+        resultados = pool.starmap(cliente, [(config, formas, semilla) for semilla in range(config['clientes'])])
+    duracion = time.perf_counter() - inicio
+    parar.set()
+
+    total = {clave: sum(r[clave] for r in resultados)
+             for clave in ('mensajes', 'registros', 'bytes', 'err', 'rechazadas', 'otros')}
+    latencias = sorted(l for r in resultados for l in r['latencias'])
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    informe = {
+        'config': {k: v for k, v in config.items() if k not in ('host',)},
+        'duracion_s': round(duracion, 3),
+        'mensajes': total['mensajes'],
+        'registros': total['registros'],
+        'bytes': total['bytes'],
+        'mensajes_s': round(total['mensajes'] / duracion, 1),
+        'registros_s': round(total['registros'] / duracion, 1),
+        'mb_s': round(total['bytes'] / duracion / (1024 * 1024), 3),
+        'latencia_ms': {
+            'p50': ms(percentil(latencias, 50)),
+            'p90': ms(percentil(latencias, 90)),
+            'p99': ms(percentil(latencias, 99)),
+            'max': ms(latencias[-1] if latencias else None),
+            'media': ms(sum(latencias) / len(latencias) if latencias else None),
+        },
+        'errores': {'err': total['err'], 'rechazadas': total['rechazadas'], 'otros': total['otros']},
+    }
+    if pid_servidor:
+        actual, pico = rss_mb(pid_servidor)
+        informe['servidor'] = {
+            'pid': pid_servidor,
+            'rss_inicio_mb': rss_inicio,
+            'rss_final_mb': actual,
+            'rss_max_muestreado_mb': max(muestras_rss, default=actual),
+            'rss_pico_mb': pico,
+        }
+    return informe
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark de ingesta del servidor ATD")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--clientes', type=int, default=8, help="Scrapers simulados concurrentes")
+    parser.add_argument('--duracion', type=float, default=10, help="Segundos de prueba")
+    parser.add_argument('--mensajes', type=int, default=0, help="Mensajes por cliente (0 = sin límite)")
+    parser.add_argument('--lote', type=int, default=1, help="Registros por mensaje (1 = frame REGISTRO)")
+    parser.add_argument('--tam-payload', type=int, default=0,
+                        help="Rellenar cada registro hasta unos N bytes (0 = tamaño real)")
+    parser.add_argument('--sin-reutilizar', dest='reutilizar', action='store_false',
+                        help="Abrir una conexión por mensaje en vez de una persistente")
+    parser.add_argument('--legacy', action='store_true',
+                        help="Enviar JSON sin framing (cliente antiguo, una conexión por registro)")
+    parser.add_argument('--codificacion', choices=disponibles()['codificaciones'], default='json',
+                        help="Codificación de los payloads de los frames")
+    parser.add_argument('--compresion', choices=disponibles()['compresiones'],
+                        help="Comprimir los payloads de los frames (por defecto, sin comprimir)")
+    parser.add_argument('--origen', choices=('log', 'scrapers'), default='log',
+                        help="Formas de registro: del log real o de los generadores de los scrapers")
+    parser.add_argument('--log', default=ARCHIVO_DATOS, help="Log del que sacar las formas con --origen log")
+    parser.add_argument('--pid', type=int, help="PID del servidor ya arrancado, para medir su RSS")
+    parser.add_argument('--lanzar-servidor', metavar='OPCIONES',
+                        help='Arrancar server.py sobre un log temporal con estas opciones, p.ej. --lanzar-servidor="--async"')
+    parser.add_argument('--salida', help="Fichero JSON de resultados (por defecto, stdout)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    formas = rellenar(cargar_formas(args.origen, args.log), args.tam_payload)
+    config = {
+        'host': args.host, 'port': args.port, 'clientes': args.clientes, 'duracion': args.duracion,
+        'mensajes': args.mensajes, 'lote': 1 if args.legacy else args.lote, 'tam_payload': args.tam_payload,
+        'reutilizar': args.reutilizar and not args.legacy, 'legacy': args.legacy, 'origen': args.origen,
+        'codificacion': args.codificacion, 'compresion': args.compresion,
+        'servidor': args.lanzar_servidor,
+    }
+    servidor = None
+    with tempfile.TemporaryDirectory(prefix='ingest_bench_') as directorio:
+        pid = args.pid
+        if args.lanzar_servidor is not None:
+            servidor = lanzar_servidor(args.lanzar_servidor.split(), args.port, directorio)
+            pid = servidor.pid
+        try:
+            informe = ejecutar(config, formas, pid)
+        finally:
+            if servidor is not None:
+                servidor.terminate()
+                servidor.wait(60)
+
+    texto = json.dumps(informe, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            f.write(texto + '\n')
+    else:
+        print(texto)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Código compartido entre scrapers, servidor y análisis."""
@@ -0,0 +1,302 @@
+"""
+Archivo columnar del almacén de ingesta (Parquet)
+
+Exporta los registros del log (raw_data.jsonl y sus segmentos) a ficheros
+Parquet comprimidos con zstd, uno por familia de fuentes:
+
+    archivo/familia=CIS/datos.parquet
+    archivo/familia=PROVINCE/datos.parquet
+    ...
+
+Cada fila es un registro, con tres columnas: `source` (codificada como
+diccionario), `received_at` y `registro` (la línea JSON tal como está en el
+log, sin volver a serializarla). Las claves repetidas de cada línea las
+absorbe la compresión. Para saber qué fuentes hay basta con leer la columna
+`source` de las familias que interesan; el JSON de un registro solo se lee
+y decodifica cuando se pide.
+
+La exportación va en streaming (grupos de FILAS_GRUPO filas, que son también
+la unidad de lectura de los registros sueltos) y cada fichero
+se sustituye de forma atómica, así que se puede relanzar sobre el mismo
+directorio mientras se lee. Con `versiones` conserva solo las últimas
+versiones de cada fuente, como la compactación del log. Los agregados que
+materializa el servidor (raw_data.rollups.json) se copian junto al archivo
+como rollups.json.
+
+Uso:
+    python3 common/archivo.py --datos data/raw_data.jsonl --salida data/archivo
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+
+try:
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # El archivo es opcional: sin pyarrow se sigue leyendo el log
+    pa = pq = None
+
+if __name__ == "__main__":
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.storage import LectorAlmacen, _fuente_rapida, recibido_linea
+from common.rollups import ruta_rollups
+
+# Familia -> prefijos de las fuentes que contiene
+FAMILIAS = {
+    'CIS': ('CIS_',),
+    'PROVINCE': ('PROVINCE_', 'OFFICIAL_'),
+    'TRENDS': ('TRENDS_', 'GOOGLE_TRENDS'),
+    'ECONOMIC': ('ECONOMIC_',),
+    'ELECTOMANIA': ('ELECTOMANIA',),
+}
+# Fuentes que no encajan en ninguna familia
+OTRAS = 'OTRAS'
+
+NOMBRE_FICHERO = 'datos.parquet'
+FILAS_GRUPO = 16 * 1024
+COMPRESION = 'zstd'
+
+
+def _requiere_pyarrow():
+    if pq is None:
+        raise RuntimeError("El archivo Parquet necesita pyarrow (pip install pyarrow)")
+
+
+def familia(source):
+    """Familia (partición) a la que pertenece una fuente."""
+    for nombre, prefijos in FAMILIAS.items():
+        if source.startswith(prefijos):
+            return nombre
+    return OTRAS
+
+
+def familias_prefijo(prefijo):
+    """Familias que pueden contener fuentes que empiezan por `prefijo`."""
+    # OTRAS puede contener cualquier fuente que no sea de una familia
+    return [nombre for nombre, prefijos in FAMILIAS.items()
+            if any(p.startswith(prefijo) or prefijo.startswith(p) for p in prefijos)] + [OTRAS]
+
+
+def ruta_particion(directorio, nombre):
+    return os.path.join(directorio, f'familia={nombre}', NOMBRE_FICHERO)
+
+
+def ruta_rollups_archivo(directorio):
+    """Copia de los rollups del servidor (common/rollups.py) que acompaña al archivo."""
+    return os.path.join(directorio, 'rollups.json')
+
+
+ESQUEMA = None if pa is None else pa.schema([
+    ('source', pa.dictionary(pa.int32(), pa.string())),
+    ('received_at', pa.string()),
+    ('registro', pa.string()),
+])
+
+
+class _Particion:
+    """Escritor en streaming de una familia: acumula filas y las escribe por grupos."""
+
+    def __init__(self, directorio, nombre):
+        self.destino = ruta_particion(directorio, nombre)
+        os.makedirs(os.path.dirname(self.destino), exist_ok=True)
+        self.tmp = self.destino + '.tmp'
+        self.escritor = pq.ParquetWriter(self.tmp, ESQUEMA, compression=COMPRESION)
+        self.columnas = ([], [], [])
+        self.filas = 0
+
+    def añadir(self, source, recibido, registro):
+        for columna, valor in zip(self.columnas, (source, recibido, registro)):
+            columna.append(valor)
+        if len(self.columnas[0]) >= FILAS_GRUPO:
+            self.volcar()
+
+    def volcar(self):
+        if self.columnas[0]:
+            self.escritor.write_table(pa.Table.from_arrays(
+                [pa.array(c).cast(t) for c, t in zip(self.columnas, ESQUEMA.types)], schema=ESQUEMA))
+            self.filas += len(self.columnas[0])
+            self.columnas = ([], [], [])
+
+    def cerrar(self):
+        self.volcar()
+        self.escritor.close()
+        os.replace(self.tmp, self.destino)
+
+    def descartar(self):
+        self.escritor.close()
+        os.remove(self.tmp)
+
+
+def exportar(ruta, directorio, versiones=None):
+    """
+    Exporta el almacén `ruta` a `directorio`, una partición por familia.
+    Devuelve {familia: filas escritas}. Las familias que se quedan sin filas
+    pierden su fichero.
+    """
+    _requiere_pyarrow()
+    particiones = {}
+    # Una foto del almacén: la misma para elegir versiones y para leer, aunque se compacte entre medias
+    lector = LectorAlmacen(ruta)
+    conservar = None
+    if versiones:
+        conservar = {(id(l), o) for posiciones in lector.indice.values() for l, o, _ in posiciones[-versiones:]}
+    try:
+        for segmento in lector.segmentos:
+            if segmento._fichero is None:
+                continue
+            segmento._fichero.seek(0)
+            offset = 0
+            for linea in segmento._fichero:
+                if not linea.endswith(b'\n'):
+                    break  # Línea a medio escribir
+                posicion, offset = offset, offset + len(linea)
+                if conservar is not None and (id(segmento), posicion) not in conservar:
+                    continue
+                source = _fuente_rapida(linea)
+                if source is None or '\\' in source:
+                    # Sin la forma habitual o con escapes (\u00f1): se decodifica la línea
+                    try:
+                        source = json.loads(linea).get('source')
+                    except (ValueError, AttributeError):
+                        source = None
+                if not isinstance(source, str):
+                    continue
+                nombre = familia(source)
+                if nombre not in particiones:
+                    particiones[nombre] = _Particion(directorio, nombre)
+                particiones[nombre].añadir(source, recibido_linea(linea),
+                                           linea[:-1].decode('utf-8', 'replace'))
+    except BaseException:
+        for p in particiones.values():
+            p.descartar()
+        raise
+    finally:
+        lector.cerrar()
+
+    for p in particiones.values():
+        p.cerrar()
+    for nombre in list(FAMILIAS) + [OTRAS]:
+        if nombre not in particiones and os.path.exists(ruta_particion(directorio, nombre)):
+            os.remove(ruta_particion(directorio, nombre))
+    if os.path.exists(ruta_rollups(ruta)):
+        os.makedirs(directorio, exist_ok=True)
+        shutil.copyfile(ruta_rollups(ruta), ruta_rollups_archivo(directorio) + '.tmp')
+        os.replace(ruta_rollups_archivo(directorio) + '.tmp', ruta_rollups_archivo(directorio))
+    return {nombre: p.filas for nombre, p in particiones.items()}
+
+
+def leer_archivo(directorio, familias=None, columnas=('source', 'received_at', 'registro'), fuentes=()):
+    """
+    Tabla Arrow con las `columnas` pedidas de las `familias` pedidas (todas
+    si es None), opcionalmente solo con las filas de `fuentes`.
+    """
+    _requiere_pyarrow()
+    tablas = []
+    for nombre in familias or list(FAMILIAS) + [OTRAS]:
+        ruta = ruta_particion(directorio, nombre)
+        if os.path.exists(ruta):
+            filtro = [('source', 'in', list(fuentes))] if fuentes else None
+            tablas.append(pq.read_table(ruta, columns=list(columnas), filters=filtro))
+    if not tablas:
+        return pa.table({c: pa.array([], ESQUEMA.field(c).type) for c in columnas})
+    return pa.concat_tables(tablas, promote_options='permissive')
+
+
+class LectorArchivo:
+    """
+    Misma interfaz de consulta que LectorAlmacen (fuentes, ultimo, historial,
+    dato) sobre el archivo Parquet. Cada familia se carga la primera vez que
+    se consulta una de sus fuentes: primero la columna `source` y, solo si se
+    pide algún registro, la columna `registro` del grupo de filas que lo
+    contiene.
+    """
+
+    def __init__(self, directorio):
+        _requiere_pyarrow()
+        self.directorio = directorio
+        self._ficheros = {}   # familia -> (ParquetFile, primera fila de cada grupo)
+        self._filas = {}      # familia -> {source: array de filas}
+        self._registros = {}  # (familia, grupo) -> columna 'registro' del grupo
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+    def cerrar(self):
+        for fichero, _ in self._ficheros.values():
+            fichero.close()
+        self._ficheros.clear()
+        self._filas.clear()
+        self._registros.clear()
+
+    def _indice(self, nombre):
+        if nombre not in self._filas:
+            ruta = ruta_particion(self.directorio, nombre)
+            filas = {}
+            if os.path.exists(ruta):
+                fichero = pq.ParquetFile(ruta)
+                grupos = [fichero.metadata.row_group(g).num_rows for g in range(fichero.num_row_groups)]
+                self._ficheros[nombre] = (fichero, np.cumsum([0] + grupos))
+                columna = fichero.read(columns=['source']).unify_dictionaries()['source']
+                if columna.num_chunks:
+                    # Filas de cada fuente agrupando los ids del diccionario, sin pasar por Python
+                    ids = np.concatenate([c.indices.to_numpy(zero_copy_only=False) for c in columna.chunks])
+                    orden = np.argsort(ids, kind='stable')
+                    cortes = np.cumsum(np.bincount(ids, minlength=len(columna.chunks[0].dictionary)))
+                    for source, inicio, fin in zip(columna.chunks[0].dictionary.to_pylist(),
+                                                   np.concatenate([[0], cortes[:-1]]), cortes):
+                        if fin > inicio:
+                            filas[source] = orden[inicio:fin]
+            self._filas[nombre] = filas
+        return self._filas[nombre]
+
+    def _leer(self, nombre, fila):
+        fichero, inicios = self._ficheros[nombre]
+        grupo = int(np.searchsorted(inicios, fila, side='right')) - 1
+        if (nombre, grupo) not in self._registros:
+            self._registros[nombre, grupo] = fichero.read_row_group(grupo, columns=['registro'])['registro']
+        return json.loads(self._registros[nombre, grupo][int(fila - inicios[grupo])].as_py())
+
+    def fuentes(self, prefijo=''):
+        """Fuentes archivadas (opcionalmente solo las que empiezan por `prefijo`)."""
+        return sorted(s for nombre in familias_prefijo(prefijo) for s in self._indice(nombre)
+                      if s.startswith(prefijo))
+
+    def ultimo(self, source):
+        """Registro completo más reciente de la fuente, o None si no existe."""
+        nombre = familia(source)
+        filas = self._indice(nombre).get(source)
+        return self._leer(nombre, filas[-1]) if filas is not None else None
+
+    def historial(self, source):
+        """Todas las versiones de la fuente, de la más antigua a la más reciente."""
+        nombre = familia(source)
+        return [self._leer(nombre, fila) for fila in self._indice(nombre).get(source, [])]
+
+    def dato(self, source, defecto=None):
+        """Campo 'data' del registro más reciente de la fuente (o `defecto`)."""
+        registro = self.ultimo(source)
+        return registro['data'] if registro is not None else defecto
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Exporta el log de ingesta a un archivo Parquet por familias")
+    parser.add_argument('--datos', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                        '../data/raw_data.jsonl'),
+                        help="Log a exportar (raw_data.jsonl)")
+    parser.add_argument('--salida', required=True, help="Directorio del archivo")
+    parser.add_argument('--versiones', type=int, default=None,
+                        help="Conservar solo las últimas N versiones de cada fuente (por defecto, todas)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    for nombre, filas in sorted(exportar(args.datos, args.salida, args.versiones).items()):
+        print(f"{nombre}: {filas} registros -> {ruta_particion(args.salida, nombre)}")
@@ -0,0 +1,142 @@
+"""
+Deduplicación por contenido en la ingesta
+
+Cada ejecución de los scrapers reenvía idénticas las fuentes estáticas
+(histórico del CIS, resultados oficiales, encuestas de Electomanía). El
+servidor guarda, por fuente, la huella (blake2b de 16 bytes) de su última
+versión escrita: un registro cuyo contenido coincide con esa huella se
+responde con ACK sin escribirlo. La huella es de la forma canónica de source
+y data (claves ordenadas, sin espacios), así que el orden de las claves, el
+formato del envío (JSON o msgpack) o el `_received_at` no la cambian. Solo se compara con la última
+versión, así que volver a un contenido anterior (A, B, A) sí se guarda. La
+huella se calcula donde se prepara la línea (en el worker, con --workers) y
+viaja con ella hasta el escritor, que solo la compara y la anota.
+
+La memoria está acotada: se conservan las MAX_FUENTES fuentes usadas más
+recientemente (LRU); una fuente olvidada simplemente se vuelve a escribir.
+Las huellas se actualizan con cada lote ya escrito y antes de su ACK
+(callback del escritor), así que tras el ACK de B un A vuelve a escribirse.
+Se guardan al apagar en raw_data.dedup.json junto con el tamaño de cada
+segmento; al arrancar solo se usan si el log no ha cambiado desde entonces,
+y si no se reconstruyen desde la última versión de cada fuente del log.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from common.storage import rutas_segmentos
+
+MAX_FUENTES = 100_000
+
+# Versión de la huella en raw_data.dedup.json: las guardadas con otra se recalculan
+FORMATO = 2
+
+
+def ruta_dedup(ruta):
+    """raw_data.jsonl -> raw_data.dedup.json"""
+    return os.path.splitext(ruta)[0] + '.dedup.json'
+
+
+def huella(registro):
+    """Huella de un registro ya decodificado: solo cuentan source y data, en forma canónica."""
+    canonico = json.dumps([registro.get('source'), registro.get('data')], sort_keys=True, separators=(',', ':'))
+    return hashlib.blake2b(canonico.encode('utf-8'), digest_size=16).digest()
+
+
+def huella_linea(linea):
+    """Huella de una línea del log (la decodifica); una línea que no es JSON se compara tal cual."""
+    try:
+        registro = json.loads(linea)
+    except ValueError:
+        registro = None
+    if not isinstance(registro, dict):
+        return hashlib.blake2b(linea, digest_size=16).digest()
+    return huella(registro)
+
+
+def _firma(ruta):
+    """Segmentos del log y su tamaño: si cambian, las huellas guardadas ya no valen."""
+    return [[os.path.basename(seg), os.path.getsize(seg)]
+            for seg in rutas_segmentos(ruta) if os.path.exists(seg)]
+
+
+class Deduplicador:
+    """Huella de la última versión escrita de cada fuente, con tamaño acotado."""
+
+    def __init__(self, ruta=None, max_fuentes=MAX_FUENTES):
+        self.ruta = ruta
+        self.max_fuentes = max_fuentes
+        self._huellas = OrderedDict()  # source -> huella, de la menos a la más usada
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._huellas)
+
+    def _anotar(self, source, h):
+        self._huellas[source] = h
+        self._huellas.move_to_end(source)
+        if len(self._huellas) > self.max_fuentes:
+            self._huellas.popitem(last=False)
+
+    def filtrar(self, lineas, huellas=None):
+        """
+        Posiciones de las (source, línea) que no repiten la última versión de
+        su fuente. Un mismo lote también se compara consigo mismo. `huellas`
+        son las ya calculadas de cada línea (None donde falte).
+        """
+        nuevas = []
+        en_lote = {}
+        with self._lock:
+            for i, (source, linea) in enumerate(lineas):
+                h = huellas[i] if huellas and huellas[i] is not None else huella_linea(linea)
+                anterior = en_lote[source] if source in en_lote else self._huellas.get(source)
+                if anterior == h:
+                    if source in self._huellas:
+                        self._huellas.move_to_end(source)
+                    continue
+                en_lote[source] = h
+                nuevas.append(i)
+        return nuevas
+
+    def aplicar_lineas(self, lineas, huellas=None):
+        """Callback del escritor: (source, línea) ya escritas, en el orden del log, y sus huellas si las hay."""
+        with self._lock:
+            for i, (source, linea) in enumerate(lineas):
+                h = huellas[i] if huellas and huellas[i] is not None else huella_linea(linea)
+                self._anotar(source, h)
+
+    def cargar(self, lector):
+        """Reconstruye las huellas con la línea más reciente de cada fuente del almacén."""
+        with self._lock:
+            for source in lector.fuentes():
+                linea = lector.linea(source)
+                if linea is not None:
+                    self._anotar(source, huella_linea(linea))
+        return self
+
+    def abrir(self, lector):
+        """Carga las huellas guardadas si siguen valiendo para el log; si no, las reconstruye."""
+        try:
+            with open(ruta_dedup(self.ruta), 'r', encoding='utf-8') as f:
+                guardado = json.load(f)
+            if guardado.get('formato') == FORMATO and guardado.get('firma') == _firma(self.ruta):
+                with self._lock:
+                    for source, h in guardado['huellas']:
+                        self._anotar(source, bytes.fromhex(h))
+                return self
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return self.cargar(lector)
+
+    def guardar(self):
+        """Escribe las huellas de forma atómica. Solo con el escritor parado (la firma debe cuadrar)."""
+        destino = ruta_dedup(self.ruta)
+        with self._lock:
+            guardado = {'formato': FORMATO, 'firma': _firma(self.ruta),
+                        'huellas': [[s, h.hex()] for s, h in self._huellas.items()]}
+        with open(destino + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(guardado, f)
+        os.replace(destino + '.tmp', destino)
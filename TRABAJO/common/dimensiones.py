@@ -0,0 +1,172 @@
+"""
+Tablas de dimensiones compartidas con ids enteros estables
+
+Provincias, regiones, partidos, elecciones e indicadores económicos tienen
+un id que es su posición en la tabla. Solo se añaden valores al final (nunca
+se reordena ni se borra), así que los registros ya guardados siguen siendo
+válidos.
+
+Los datos tabulares viajan como registros matriz: los ids de cada dimensión
+y los valores en float64 (little-endian, base64), en vez de diccionarios
+anidados que repiten los nombres en cada celda:
+
+    {"dims": ["provincia", "indicador"], "ids": [[0, 1, ...], [0, 1]], "tipo": "f8", "valores": "AAAAAAB4QQ..."}
+
+Los valores van en orden C (la última dimensión es la que varía más rápido)
+y NaN significa "sin dato". float64 conserva exactos los recuentos enteros
+(votos); los registros sin "tipo" son de antes y van en float32.
+"""
+
+import base64
+import itertools
+import math
+import sys
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # Los scrapers solo construyen matrices; los cubos del análisis necesitan NumPy
+    np = None
+
+PROVINCIAS = (
+    'Alava', 'Albacete', 'Alicante', 'Almeria', 'Asturias', 'Avila', 'Badajoz', 'Barcelona', 'Burgos', 'Caceres',
+    'Cadiz', 'Cantabria', 'Castellon', 'Ciudad Real', 'Cordoba', 'Coruña', 'Cuenca', 'Girona', 'Granada', 'Guadalajara',
+    'Guipuzcoa', 'Huelva', 'Huesca', 'Jaen', 'Leon', 'Lleida', 'Lugo', 'Madrid', 'Malaga', 'Murcia', 'Navarra',
+    'Ourense', 'Palencia', 'Las Palmas', 'Pontevedra', 'La Rioja', 'Salamanca', 'Segovia', 'Sevilla', 'Soria',
+    'Tarragona', 'Teruel', 'Toledo', 'Valencia', 'Valladolid', 'Vizcaya', 'Zamora', 'Zaragoza', 'Ceuta', 'Melilla',
+    'Baleares', 'Santa Cruz de Tenerife',
+)
+
+REGIONES = (
+    'Andalucia', 'Aragon', 'Asturias', 'Baleares', 'Canarias', 'Cantabria',
+    'Castilla y Leon', 'Castilla-La Mancha', 'Cataluña', 'Valencia',
+    'Extremadura', 'Galicia', 'Madrid', 'Murcia', 'Navarra', 'Pais Vasco', 'Rioja',
+)
+
+PARTIDOS = ('PSOE', 'PP', 'VOX', 'SUMAR', 'PODEMOS', 'ERC', 'JUNTS', 'PNV', 'BILDU')
+
+# En orden cronológico
+ELECCIONES = ('28A-2019', '10N-2019', '23J-2023')
+
+INDICADORES = ('unemployment_rate', 'avg_income_eur')
+
+TABLAS = {
+    'provincia': PROVINCIAS,
+    'region': REGIONES,
+    'partido': PARTIDOS,
+    'eleccion': ELECCIONES,
+    'indicador': INDICADORES,
+}
+IDS = {dim: {nombre: i for i, nombre in enumerate(tabla)} for dim, tabla in TABLAS.items()}
+
+# Dimensiones de las matrices que envían los scrapers
+DIMS_PROVINCIAS = ('eleccion', 'provincia', 'partido')
+DIMS_ECONOMIA = ('provincia', 'indicador')
+DIMS_REGIONES = ('region', 'partido')
+
+# "tipo" de los valores de un registro matriz -> código de array
+TIPOS = {'f4': 'f', 'f8': 'd'}
+
+
+def matriz(dims, nombres, valores):
+    """
+    Registro matriz a partir de los nombres de cada dimensión y los valores
+    aplanados en orden C (None = sin dato). Los nombres que no están en su
+    tabla se avisan y se descartan con sus valores: para guardarlos hay que
+    añadirlos antes a la tabla.
+    """
+    valores = list(valores)
+    forma = [len(ns) for ns in nombres]
+    if len(valores) != math.prod(forma):
+        raise ValueError(f"La matriz {list(dims)} tiene {len(valores)} valores para la forma {forma}")
+    conocidos = []
+    for d, ns in zip(dims, nombres):
+        desconocidos = [n for n in ns if n not in IDS[d]]
+        if desconocidos:
+            print(f"Aviso: {d} sin id en common/dimensiones.py, se descarta de la matriz: {desconocidos}")
+        conocidos.append([i for i, n in enumerate(ns) if n in IDS[d]])
+    if any(len(c) < f for c, f in zip(conocidos, forma)):
+        # Salto en la lista aplanada de cada dimensión (orden C)
+        pasos = [math.prod(forma[k + 1:]) for k in range(len(forma))]
+        valores = [valores[sum(i * p for i, p in zip(celda, pasos))] for celda in itertools.product(*conocidos)]
+    ids = [[IDS[d][ns[i]] for i in c] for d, ns, c in zip(dims, nombres, conocidos)]
+    datos = array(TIPOS['f8'], (math.nan if v is None else v for v in valores))
+    if sys.byteorder == 'big':
+        datos.byteswap()
+    return {'dims': list(dims), 'ids': ids, 'tipo': 'f8',
+            'valores': base64.b64encode(datos.tobytes()).decode('ascii')}
+
+
+def matriz_desde_celdas(dims, celdas):
+    """Registro matriz a partir de pares (nombres, valor); cada dimensión lleva solo los ids que aparecen."""
+    celdas = {tuple(nombres): valor for nombres, valor in celdas}
+    nombres = [list(dict.fromkeys(c[i] for c in celdas)) for i in range(len(dims))]
+    return matriz(dims, nombres, [celdas.get(c) for c in itertools.product(*nombres)])
+
+
+def _valores(data):
+    datos = array(TIPOS[data.get('tipo', 'f4')])
+    datos.frombytes(base64.b64decode(data['valores']))
+    if sys.byteorder == 'big':
+        datos.byteswap()
+    return datos
+
+
+def celdas_matriz(data):
+    """Pares (nombres, valor) de un registro matriz, sin las celdas vacías."""
+    nombres = [[TABLAS[d][i] for i in ids] for d, ids in zip(data['dims'], data['ids'])]
+    for clave, valor in zip(itertools.product(*nombres), _valores(data)):
+        if not math.isnan(valor):
+            yield clave, valor
+
+
+def cubo_vacio(dims):
+    """Array NumPy sobre las tablas completas de `dims`, todo a NaN."""
+    return np.full([len(TABLAS[d]) for d in dims], np.nan)
+
+
+def cubo_desde_matriz(data, dims):
+    """
+    Registro matriz -> array denso sobre las tablas completas de `dims`
+    (el índice de cada eje es el id), para cruzar matrices por id sin
+    comparar nombres.
+    """
+    if list(data['dims']) != list(dims):
+        raise ValueError(f"Se esperaba una matriz {list(dims)} y llegó {data['dims']}")
+    valores = np.frombuffer(base64.b64decode(data['valores']), dtype='<' + data.get('tipo', 'f4')).astype(float)
+    cubo = cubo_vacio(dims)
+    cubo[np.ix_(*data['ids'])] = valores.reshape([len(i) for i in data['ids']])
+    return cubo
+
+
+def cubo_desde_celdas(dims, celdas):
+    """Como cubo_desde_matriz, a partir de pares (nombres, valor). Los nombres desconocidos se ignoran."""
+    cubo = cubo_vacio(dims)
+    for nombres, valor in celdas:
+        try:
+            cubo[tuple(IDS[d][n] for d, n in zip(dims, nombres))] = valor
+        except KeyError:
+            continue
+    return cubo
+
+
+def celdas_provinciales(filas):
+    """Celdas (elección, provincia, partido) de los resultados por filas (PROVINCE_*)."""
+    for r in filas:
+        for partido, valor in r['results'].items():
+            yield (r['election_id'], r['province'], partido), valor
+
+
+def celdas_economicas(filas):
+    """Celdas (provincia, indicador) de los indicadores por filas (ECONOMIC_*)."""
+    for r in filas:
+        for indicador in INDICADORES:
+            if indicador in r:
+                yield (r['province'], indicador), r[indicador]
+
+
+def celdas_regionales(regionales):
+    """Celdas (región, partido) del desglose regional {región: {partido: valor}}."""
+    for region, datos in regionales.items():
+        for partido, valor in datos.items():
+            yield (region, partido), valor
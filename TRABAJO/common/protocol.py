@@ -0,0 +1,353 @@
+"""
+Protocolo de mensajes entre scrapers y servidor.
+
+Cada mensaje va en un frame con cabecera fija:
+    MAGIC (1 byte) | tipo (1 byte) | flags (1 byte) | longitud (4 bytes, big-endian)
+seguida de `longitud` bytes de payload.
+
+Los clientes antiguos envían el JSON "a pelo" (empieza por '{'), así que el
+servidor distingue ambos formatos mirando el primer byte. Como esos clientes
+no cierran el socket hasta recibir la respuesta, el fin del mensaje se detecta
+siguiendo la estructura del JSON a medida que llegan los trozos.
+
+El byte de flags indica cómo va el payload: codificación en los bits 0-1
+(JSON o msgpack) y compresión en los bits 2-3 (ninguna, zlib o zstd). Al
+conectar, el cliente propone con un frame HOLA lo que sabe usar y el
+servidor responde con lo que ha elegido; un servidor antiguo responde ERR y
+el cliente se queda en JSON sin comprimir.
+"""
+
+import json
+import re
+import struct
+import zlib
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = 0xA7
+CABECERA = struct.Struct('!BBBI')
+
+# Tipos de mensaje
+TIPO_REGISTRO = 1   # Un registro {'source', 'data'}
+TIPO_LOTE = 2       # Lista de registros, un único ACK para todos
+TIPO_ACK = 3        # Respuesta: payload {"n": registros aceptados}
+TIPO_ERR = 4        # Respuesta: payload con el mensaje de error (utf-8)
+TIPO_HOLA = 5       # Negociación: el cliente propone, el servidor responde lo elegido (JSON)
+TIPO_CONSULTA = 6   # Consulta del último registro (o del historial) de fuentes: {"op": "get"|"mget"|"list"|"historial", ...}
+TIPO_RESULTADO = 7  # Respuesta a una consulta (JSON, comprimido si la consulta lo pide)
+TIPO_SUSCRIBIR = 8  # Suscripción: {"prefijos": [...], "fuentes": [...]}; la conexión pasa a recibir EVENTOs
+TIPO_EVENTO = 9     # Registros nuevos de una suscripción (lista JSON), enviados por el servidor
+
+# Codificación del payload (bits 0-1 de flags)
+CODIFICACIONES = {'json': 0, 'msgpack': 1}
+MASCARA_CODIFICACION = 0x03
+# Compresión del payload (bits 2-3 de flags)
+COMPRESIONES = {None: 0, 'zlib': 1 << 2, 'zstd': 2 << 2}
+MASCARA_COMPRESION = 0x0C
+NIVEL_ZLIB = 6
+NIVEL_ZSTD = 3
+
+# Tamaño de cada lectura del socket al recibir mensajes sin framing
+TAM_TROZO = 64 * 1024
+
+
+class ErrorProtocolo(Exception):
+    """Frame mal formado o que excede los límites permitidos."""
+
+
+def empaquetar(tipo, payload, flags=0):
+    """Devuelve el frame (cabecera + payload) listo para enviar."""
+    return CABECERA.pack(MAGIC, tipo, flags, len(payload)) + payload
+
+
+def desempaquetar_cabecera(cabecera, max_longitud=None):
+    """Valida la cabecera y devuelve (tipo, flags, longitud)."""
+    magic, tipo, flags, longitud = CABECERA.unpack(cabecera)
+    if magic != MAGIC:
+        raise ErrorProtocolo(f"Magic inválido: {magic:#x}")
+    if max_longitud is not None and longitud > max_longitud:
+        raise ErrorProtocolo(f"Frame de {longitud} bytes excede el máximo ({max_longitud})")
+    return tipo, flags, longitud
+
+
+class DetectorFinJSON:
+    """
+    Sigue la estructura de un valor JSON trozo a trozo (llaves, corchetes y
+    cadenas) para saber cuándo ha llegado completo, sin decodificarlo.
+    Así el mensaje se acumula en un único buffer y se parsea una sola vez.
+    """
+    # Tramo sin cambios de profundidad: texto normal y cadenas completas
+    _TRAMO = re.compile(rb'(?:[^"{}\[\]]+|"(?:[^"\\]|\\.)*")*', re.DOTALL)
+    # Interior de una cadena hasta la comilla de cierre o un escape
+    _CADENA = re.compile(rb'(?:[^"\\]|\\.)*', re.DOTALL)
+
+    def __init__(self):
+        self.profundidad = 0
+        self.en_cadena = False
+        self.escape = False
+        self.completo = False
+
+    def alimentar(self, trozo):
+        """Procesa un trozo más. Devuelve True cuando el valor JSON se ha cerrado."""
+        i, n = 0, len(trozo)
+        while i < n and not self.completo:
+            if self.escape:
+                # El carácter escapado llega al principio del trozo siguiente
+                self.escape = False
+                i += 1
+            elif self.en_cadena:
+                # Cadena que empezó en un trozo anterior
+                i = self._CADENA.match(trozo, i).end()
+                if i < n:
+                    self.escape = trozo[i] == 0x5C  # '\\' al final del trozo
+                    self.en_cadena = self.escape
+                    i += 1
+            else:
+                i = self._TRAMO.match(trozo, i).end()
+                if i < n:
+                    c = trozo[i]
+                    i += 1
+                    if c == 0x22:  # '"' sin cerrar dentro de este trozo
+                        self.en_cadena = True
+                    elif c in (0x7B, 0x5B):  # '{', '['
+                        self.profundidad += 1
+                    else:
+                        self.profundidad -= 1
+                        self.completo = self.profundidad == 0
+        return self.completo
+
+
+def recv_exacto(sock, n):
+    """Lee exactamente n bytes del socket. Devuelve None si se cierra antes."""
+    buf = bytearray(n)
+    vista = memoryview(buf)
+    leidos = 0
+    while leidos < n:
+        r = sock.recv_into(vista[leidos:], n - leidos)
+        if r == 0:
+            return None
+        leidos += r
+    return buf
+
+
+def recibir_json(sock, inicial=b'', max_longitud=None):
+    """
+    Recibe un JSON sin framing (cliente antiguo) leyendo hasta que el valor
+    está completo o el cliente cierra. Devuelve el buffer (bytearray).
+    """
+    buf = bytearray(inicial)
+    detector = DetectorFinJSON()
+    detector.alimentar(buf)
+    while not detector.completo:
+        trozo = sock.recv(TAM_TROZO)
+        if not trozo:
+            break
+        buf += trozo
+        if max_longitud is not None and len(buf) > max_longitud:
+            raise ErrorProtocolo(f"Mensaje de más de {max_longitud} bytes")
+        detector.alimentar(trozo)
+    return buf
+
+
+async def recibir_json_async(reader, inicial=b'', max_longitud=None, timeout=None):
+    """
+    Equivalente asyncio de recibir_json. `timeout` limita la espera de cada
+    trozo (el socket bloqueante usa settimeout para lo mismo).
+    """
+    import asyncio
+    buf = bytearray(inicial)
+    detector = DetectorFinJSON()
+    detector.alimentar(buf)
+    while not detector.completo:
+        trozo = await asyncio.wait_for(reader.read(TAM_TROZO), timeout)
+        if not trozo:
+            break
+        buf += trozo
+        if max_longitud is not None and len(buf) > max_longitud:
+            raise ErrorProtocolo(f"Mensaje de más de {max_longitud} bytes")
+        detector.alimentar(trozo)
+    return buf
+
+
+def leer_frame(sock, max_longitud=None, cabecera=None):
+    """
+    Lee un frame completo de un socket bloqueante.
+    Devuelve (tipo, flags, payload) o None si el otro extremo cerró la conexión.
+    `cabecera` permite pasar bytes de cabecera ya leídos.
+    """
+    cabecera = cabecera or b''
+    if len(cabecera) < CABECERA.size:
+        resto = recv_exacto(sock, CABECERA.size - len(cabecera))
+        if resto is None:
+            return None
+        cabecera += resto
+    tipo, flags, longitud = desempaquetar_cabecera(cabecera, max_longitud)
+    payload = recv_exacto(sock, longitud) if longitud else b''
+    if payload is None:
+        raise ErrorProtocolo("Conexión cerrada a mitad de frame")
+    return tipo, flags, payload
+
+
+async def leer_frame_async(reader, max_longitud=None, cabecera=None):
+    """Equivalente asyncio de leer_frame (usa un asyncio.StreamReader)."""
+    import asyncio
+    cabecera = cabecera or b''
+    try:
+        if len(cabecera) < CABECERA.size:
+            cabecera += await reader.readexactly(CABECERA.size - len(cabecera))
+    except asyncio.IncompleteReadError as e:
+        if not e.partial and not cabecera:
+            return None
+        raise ErrorProtocolo("Conexión cerrada a mitad de cabecera")
+    tipo, flags, longitud = desempaquetar_cabecera(cabecera, max_longitud)
+    try:
+        payload = await reader.readexactly(longitud) if longitud else b''
+    except asyncio.IncompleteReadError:
+        raise ErrorProtocolo("Conexión cerrada a mitad de frame")
+    return tipo, flags, payload
+
+
+def disponibles():
+    """Codificaciones y compresiones que este proceso sabe usar, por orden de preferencia."""
+    return {
+        'codificaciones': ['msgpack', 'json'] if msgpack is not None else ['json'],
+        'compresiones': (['zstd'] if zstandard is not None else []) + ['zlib'],
+    }
+
+
+def negociar(propuesta):
+    """Lo que responde el servidor a un HOLA: la primera opción del cliente que también soporta."""
+    propias = disponibles()
+    codificacion = next((c for c in propuesta.get('codificaciones', []) if c in propias['codificaciones']), 'json')
+    compresion = next((c for c in propuesta.get('compresiones', []) if c in propias['compresiones']), None)
+    return {'codificacion': codificacion, 'compresion': compresion}
+
+
+def flags_formato(codificacion='json', compresion=None):
+    return CODIFICACIONES[codificacion] | COMPRESIONES[compresion]
+
+
+def codificar(obj, codificacion='json', compresion=None, min_comprimir=0):
+    """
+    Serializa `obj` y devuelve (flags, payload). Solo se comprime si el
+    payload ocupa al menos `min_comprimir` bytes.
+    """
+    if codificacion == 'msgpack':
+        payload = msgpack.packb(obj, use_bin_type=True)
+    else:
+        payload = json.dumps(obj).encode('utf-8')
+    return comprimir(payload, codificacion, compresion, min_comprimir)
+
+
+def comprimir(payload, codificacion='json', compresion=None, min_comprimir=0):
+    """(flags, payload) de un payload ya serializado, comprimido si ocupa al menos `min_comprimir` bytes."""
+    if compresion is None or len(payload) < min_comprimir:
+        return flags_formato(codificacion), payload
+    if compresion == 'zstd':
+        payload = zstandard.ZstdCompressor(level=NIVEL_ZSTD).compress(payload)
+    else:
+        payload = zlib.compress(payload, NIVEL_ZLIB)
+    return flags_formato(codificacion, compresion), payload
+
+
+def descomprimir(payload, flags, max_longitud=None):
+    """Payload sin comprimir según los flags; se corta si pasa de `max_longitud` (bombas de compresión)."""
+    compresion = flags & MASCARA_COMPRESION
+    limite = max_longitud or 0
+    if compresion == 0:
+        return payload
+    if compresion == COMPRESIONES['zlib']:
+        d = zlib.decompressobj()
+        datos = d.decompress(payload, limite)
+        if d.unconsumed_tail:
+            raise ErrorProtocolo(f"Payload descomprimido de más de {max_longitud} bytes")
+        if not d.eof:
+            raise ErrorProtocolo("Payload zlib truncado")
+        return datos
+    if compresion == COMPRESIONES['zstd'] and zstandard is not None:
+        try:
+            return zstandard.ZstdDecompressor().decompress(payload, max_output_size=limite or 2 ** 31)
+        except zstandard.ZstdError as e:
+            raise ErrorProtocolo(f"Payload zstd inválido: {e}")
+    raise ErrorProtocolo(f"Compresión no soportada (flags {flags:#x})")
+
+
+def es_json(flags):
+    return flags & MASCARA_CODIFICACION == CODIFICACIONES['json']
+
+
+def decodificar(payload, flags):
+    """Objeto de un payload ya descomprimido."""
+    codificacion = flags & MASCARA_CODIFICACION
+    if codificacion == CODIFICACIONES['json']:
+        return json.loads(payload)
+    if codificacion == CODIFICACIONES['msgpack'] and msgpack is not None:
+        return msgpack.unpackb(payload, raw=False)
+    raise ErrorProtocolo(f"Codificación no soportada (flags {flags:#x})")
+
+
+_DECODIFICADOR = json.JSONDecoder()
+_ESPACIOS = re.compile(r'[ \t\n\r]*')
+
+
+def registros_json(tipo, payload):
+    """
+    Decodifica un payload JSON de REGISTRO (un objeto) o LOTE (una lista) y
+    devuelve pares (registro, texto JSON del registro tal como llegó), para
+    poder guardarlo sin volver a serializarlo.
+    """
+    texto = bytes(payload).decode('utf-8')
+    if tipo == TIPO_REGISTRO:
+        return [(json.loads(texto), texto.strip())]
+    i = _ESPACIOS.match(texto).end()
+    if texto[i:i + 1] != '[':
+        raise ValueError("El payload de un lote debe ser una lista")
+    i = _ESPACIOS.match(texto, i + 1).end()
+    pares = []
+    if texto[i:i + 1] != ']':
+        while True:
+            obj, fin = _DECODIFICADOR.raw_decode(texto, i)
+            pares.append((obj, texto[i:fin]))
+            i = _ESPACIOS.match(texto, fin).end()
+            if texto[i:i + 1] == ',':
+                i = _ESPACIOS.match(texto, i + 1).end()
+            elif texto[i:i + 1] == ']':
+                break
+            else:
+                raise ValueError(f"Lote mal formado en la posición {i}")
+    if texto[i + 1:].strip():
+        raise ValueError("Datos sobrantes después del lote")
+    return pares
+
+
+def frame_hola(datos):
+    return empaquetar(TIPO_HOLA, json.dumps(datos).encode('utf-8'))
+
+
+def frame_resultado(texto, compresion=None, min_comprimir=4096, tipo=TIPO_RESULTADO):
+    """Respuesta a una consulta: `texto` JSON ya serializado (bytes)."""
+    if compresion not in disponibles()['compresiones']:
+        compresion = None
+    flags, payload = comprimir(texto, 'json', compresion, min_comprimir)
+    return empaquetar(tipo, payload, flags)
+
+
+def frame_evento(lineas, compresion=None, min_comprimir=4096):
+    """Frame EVENTO con una lista de líneas JSON del log (bytes, sin el salto de línea)."""
+    return frame_resultado(b'[' + b', '.join(lineas) + b']', compresion, min_comprimir, TIPO_EVENTO)
+
+
+def frame_ack(n):
+    return empaquetar(TIPO_ACK, json.dumps({'n': n}).encode('utf-8'))
+
+
+def frame_err(mensaje):
+    return empaquetar(TIPO_ERR, str(mensaje).encode('utf-8'))
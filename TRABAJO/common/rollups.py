@@ -0,0 +1,290 @@
+"""
+Agregados materializados (rollups)
+
+Los scrapers envían cada fila como un registro propio (PROVINCE_*,
+ECONOMIC_*, TRENDS_DAY_*, ...). En vez de enviar además la lista completa
+como agregado, el servidor mantiene aquí esos agregados a partir de las
+filas según llegan. Cada rollup declara:
+
+- prefijo: las fuentes que son filas suyas,
+- clave: el grupo de cada fila (dos filas con la misma clave son la misma
+  fila y gana la más reciente),
+- vista: cómo se construye el agregado con las filas ya agrupadas; tiene la
+  misma forma que el agregado que enviaban los scrapers,
+- ventana (opcional): cuántos grupos entran en el agregado, los de clave
+  más alta, como la ventana del propio scraper; las filas más antiguas se
+  olvidan, así que el estado no crece con cada día nuevo.
+
+El estado es la última versión de cada fuente-fila, así que reconstruirlo
+desde el índice del log al arrancar da exactamente lo mismo que haberlo ido
+actualizando. Cada vista se construye una vez y se reutiliza (consultas,
+suscripciones, guardado) hasta que cambia alguna de sus filas. El servidor guarda las vistas en raw_data.rollups.json (de
+forma atómica, como mucho cada GUARDAR_CADA segundos y al apagar) y el
+análisis las lee de ahí con LectorConRollups.
+"""
+
+import json
+import os
+import re
+import threading
+
+from common import dimensiones
+
+GUARDAR_CADA = 1.0  # segundos
+
+
+def ruta_rollups(ruta):
+    """raw_data.jsonl -> raw_data.rollups.json"""
+    return os.path.splitext(ruta)[0] + '.rollups.json'
+
+
+def _posicion(source):
+    """Número de orden que el scraper pone en la fuente (CIS_BAROMETER_3_... -> 3)."""
+    numero = re.search(r'_(\d+)(?:_|$)', source)
+    return int(numero.group(1)) if numero else 0
+
+
+def _fusionar(filas):
+    """Un solo dict con las claves de todas las filas."""
+    resultado = {}
+    for _, data in filas:
+        resultado.update(data)
+    return resultado
+
+
+def _matriz(dims, celdas):
+    """Registro matriz sin las celdas que no son números o cuyos nombres no están en las tablas."""
+    return dimensiones.matriz_desde_celdas(dims, [
+        (nombres, valor) for nombres, valor in celdas
+        if isinstance(valor, (int, float)) and all(n in dimensiones.IDS[d] for d, n in zip(dims, nombres))])
+
+
+# Agregado -> declaración. Las vistas reciben [(source, data)] ya agrupadas por clave.
+ROLLUPS = {
+    'CIS_HISTORICAL_MULTI': {
+        'prefijo': 'CIS_BAROMETER_',
+        'clave': lambda source, data: data['election_id'],
+        'vista': lambda filas: [d for s, d in sorted(filas, key=lambda f: _posicion(f[0]))],
+    },
+    'CIS_DEMOGRAPHICS': {
+        'prefijo': 'CIS_DEMO_',
+        'clave': lambda source, data: tuple(data),
+        'vista': _fusionar,
+    },
+    'CIS_REGIONAL_MATRIX': {
+        'prefijo': 'CIS_REGION_',
+        'clave': lambda source, data: tuple(data),
+        'vista': lambda filas: _matriz(dimensiones.DIMS_REGIONES, dimensiones.celdas_regionales(_fusionar(filas))),
+    },
+    'ELECTOMANIA_HISTORICAL': {
+        'prefijo': 'ELECTOMANIA_POLL_',
+        'clave': lambda source, data: (data['date'], data.get('pollster')),
+        # Como el scraper: de la más reciente a la más antigua
+        'vista': lambda filas: [d for s, d in sorted(filas, key=lambda f: f[1]['date'], reverse=True)],
+    },
+    'GOOGLE_TRENDS_SERIES': {
+        'prefijo': 'TRENDS_DAY_',
+        'clave': lambda source, data: data['date'],
+        # También de la más reciente a la más antigua, y solo los 90 días que da el scraper
+        'vista': lambda filas: [d for s, d in sorted(filas, key=lambda f: f[1]['date'], reverse=True)],
+        'ventana': 90,
+    },
+    'OFFICIAL_PROVINCES_MATRIX': {
+        'prefijo': 'PROVINCE_',
+        'clave': lambda source, data: (data['election_id'], data['province']),
+        'vista': lambda filas: _matriz(dimensiones.DIMS_PROVINCIAS,
+                                       dimensiones.celdas_provinciales(d for _, d in filas)),
+    },
+    'ECONOMIC_MATRIX': {
+        'prefijo': 'ECONOMIC_',
+        'clave': lambda source, data: data['province'],
+        'vista': lambda filas: _matriz(dimensiones.DIMS_ECONOMIA,
+                                       dimensiones.celdas_economicas(d for _, d in filas)),
+    },
+}
+
+# Agregados antiguos que comparten prefijo con las filas y no lo son
+_NO_FILAS = frozenset(ROLLUPS) | {'ECONOMIC_CONTEXT'}
+
+
+def rollup_de(source):
+    """Rollup del que es fila la fuente, o None."""
+    if source in _NO_FILAS:
+        return None
+    for nombre, rollup in ROLLUPS.items():
+        if source.startswith(rollup['prefijo']):
+            return nombre
+    return None
+
+
+class Rollups:
+    """Estado de todos los rollups: la última versión de cada fuente-fila."""
+
+    def __init__(self, ruta=None):
+        self.ruta = ruta_rollups(ruta) if ruta else None
+        self._filas = {nombre: {} for nombre in ROLLUPS}  # rollup -> {source: (recibido, data)}
+        self._cambios = {nombre: 0 for nombre in ROLLUPS}
+        self._construidas = {}  # rollup -> (cambios, vista) de la última vista construida
+        self._lock = threading.Lock()
+        self._sucio = False
+
+    def aplicar(self, source, registro):
+        """Incorpora un registro si es fila de algún rollup. Las filas sin la clave se ignoran."""
+        nombre = rollup_de(source)
+        if nombre is None:
+            return False
+        data = registro.get('data')
+        try:
+            ROLLUPS[nombre]['clave'](source, data)
+        except (KeyError, TypeError, AttributeError):
+            return False
+        with self._lock:
+            filas = self._filas[nombre]
+            filas[source] = (registro.get('_received_at', ''), data)
+            self._cambios[nombre] += 1
+            self._sucio = True
+            ventana = ROLLUPS[nombre].get('ventana')
+            if ventana and len(filas) > 2 * ventana:
+                # Se recorta de vez en cuando, no con cada fila
+                self._filas[nombre] = dict(self._en_ventana(nombre, filas.items()))
+        return True
+
+    @staticmethod
+    def _en_ventana(nombre, filas):
+        """Las (source, (recibido, data)) cuya clave está entre las `ventana` más altas del rollup."""
+        rollup = ROLLUPS[nombre]
+        filas = list(filas)
+        if not rollup.get('ventana'):
+            return filas
+        claves = sorted({rollup['clave'](source, data) for source, (_, data) in filas}, reverse=True)
+        if len(claves) <= rollup['ventana']:
+            return filas
+        minima = claves[rollup['ventana'] - 1]
+        return [(source, fila) for source, fila in filas if rollup['clave'](source, fila[1]) >= minima]
+
+    def aplicar_lineas(self, lineas, registros=None):
+        """
+        Callback del escritor: (source, línea) ya escritas. `registros` son
+        las filas ya decodificadas ({'data', '_received_at'}, None donde
+        falte); si no, solo se decodifican las líneas que son filas.
+        """
+        for i, (source, linea) in enumerate(lineas):
+            if rollup_de(source) is None:
+                continue
+            registro = registros[i] if registros else None
+            if registro is None:
+                try:
+                    registro = json.loads(linea)
+                except ValueError:
+                    continue
+            self.aplicar(source, registro)
+
+    def cargar(self, lector, nombres=None):
+        """Reconstruye el estado con la última versión de cada fila del almacén."""
+        for nombre in nombres or ROLLUPS:
+            for source in lector.fuentes(ROLLUPS[nombre]['prefijo']):
+                if rollup_de(source) == nombre:
+                    self.aplicar(source, lector.ultimo(source))
+        return self
+
+    def vista(self, nombre):
+        """
+        {'data': agregado, '_received_at': fila más reciente, 'filas': grupos},
+        o None sin filas. Es la misma vista mientras no cambie ninguna fila: no
+        hay que modificarla.
+        """
+        rollup = ROLLUPS[nombre]
+        with self._lock:
+            cambios = self._cambios[nombre]
+            construida = self._construidas.get(nombre)
+            if construida is not None and construida[0] == cambios:
+                return construida[1]
+            filas = list(self._filas[nombre].items())
+        filas = sorted(self._en_ventana(nombre, filas), key=lambda f: f[1][0])
+        vista = None
+        if filas:
+            grupos = {}
+            for source, (_, data) in filas:
+                clave = rollup['clave'](source, data)
+                grupos.pop(clave, None)
+                grupos[clave] = (source, data)
+            vista = {'data': rollup['vista'](list(grupos.values())), '_received_at': filas[-1][1][0],
+                     'filas': len(grupos)}
+        with self._lock:
+            # Si ha cambiado algo mientras se construía, la siguiente llamada la vuelve a construir
+            if self._cambios[nombre] == cambios:
+                self._construidas[nombre] = (cambios, vista)
+        return vista
+
+    def vistas(self):
+        resultado = {}
+        for nombre in ROLLUPS:
+            try:
+                vista = self.vista(nombre)
+            except Exception as e:
+                print(f"Error construyendo el rollup {nombre}: {e}")
+                continue
+            if vista is not None:
+                resultado[nombre] = vista
+        return resultado
+
+    def guardar(self):
+        """Escribe las vistas de forma atómica (tmp + rename) si ha cambiado algo."""
+        with self._lock:
+            if not self._sucio:
+                return False
+            self._sucio = False
+        tmp = self.ruta + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.vistas(), f)
+        os.replace(tmp, self.ruta)
+        return True
+
+    def guardar_periodicamente(self, intervalo=GUARDAR_CADA, parar=None):
+        """Bucle de guardado en segundo plano (pensado para un hilo daemon)."""
+        parar = parar or threading.Event()
+        while not parar.wait(intervalo):
+            try:
+                self.guardar()
+            except Exception as e:
+                print(f"Error guardando los rollups: {e}")
+
+
+def leer_rollups(ruta):
+    """Vistas guardadas por el servidor ({} si no hay fichero o está dañado)."""
+    try:
+        with open(ruta, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class LectorConRollups:
+    """
+    Envuelve un lector (LectorAlmacen o LectorArchivo) para que los agregados
+    se lean de los rollups. Entre la vista guardada y un agregado enviado por
+    un scraper antiguo gana el más reciente; si no hay ninguno de los dos, el
+    rollup se construye con las filas del propio lector.
+    """
+
+    def __init__(self, lector, vistas):
+        self._lector = lector
+        self._vistas = dict(vistas)
+
+    def __getattr__(self, nombre):
+        return getattr(self._lector, nombre)
+
+    def ultimo(self, source):
+        registro = self._lector.ultimo(source)
+        if source in ROLLUPS and source not in self._vistas and registro is None:
+            vista = Rollups().cargar(self._lector, [source]).vista(source)
+            if vista is not None:
+                self._vistas[source] = vista
+        vista = self._vistas.get(source)
+        if vista is not None and (registro is None or vista['_received_at'] >= registro.get('_received_at', '')):
+            return {'source': source, 'data': vista['data'], '_received_at': vista['_received_at']}
+        return registro
+
+    def dato(self, source, defecto=None):
+        registro = self.ultimo(source)
+        return registro['data'] if registro is not None else defecto
@@ -0,0 +1,747 @@
+"""
+Almacenamiento del log de ingesta (raw_data.jsonl).
+
+Un único hilo escritor mantiene el fichero abierto y recibe las líneas de
+todos los handlers a través de una cola. Escribe por lotes ("group commit"):
+junta lo que haya pendiente (hasta `max_lote` registros o `max_espera`
+segundos), hace un solo write + flush (+ fsync según la política) y solo
+entonces resuelve los futures, de modo que el ACK sale cuando el lote es
+duradero y nunca se mezclan líneas de dos clientes. Lo que se deriva del lote
+(los callbacks al_escribir) se hace después de resolver los futures, para
+que no retrase los ACK ni el siguiente lote; antes solo va al_confirmar, que
+debe ser barato.
+
+Junto a cada fichero de log se mantiene un índice (.idx) con una línea por
+registro: {"s": source, "o": offset, "n": bytes}. Se escribe en el mismo lote,
+justo después de los datos, y permite ir directamente al registro más
+reciente (o a cualquier versión anterior) de una fuente sin recorrer el log.
+
+El log está dividido en segmentos. El manifiesto (raw_data.manifest.json)
+lista los segmentos en orden; el último es el activo, en el que escribe el
+servidor, y los demás están sellados. Cuando el activo supera `max_segmento`
+bytes se abre uno nuevo (raw_data.000001.jsonl, ...). La compactación junta
+los segmentos sellados en uno solo conservando las últimas `versiones` de
+cada fuente y sustituye el manifiesto de forma atómica. El raw_data.jsonl de
+instalaciones anteriores es simplemente el primer segmento.
+"""
+
+import fcntl
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+# Políticas de fsync
+FSYNC_LOTE = 'lote'            # fsync tras cada lote (máxima durabilidad)
+FSYNC_INTERVALO = 'intervalo'  # como mucho un fsync cada `fsync_intervalo` segundos
+FSYNC_NUNCA = 'nunca'          # solo flush al sistema operativo
+POLITICAS_FSYNC = (FSYNC_LOTE, FSYNC_INTERVALO, FSYNC_NUNCA)
+
+# Tamaño a partir del cual se sella el segmento activo
+MAX_SEGMENTO = 16 * 1024 * 1024
+
+_FIN = object()
+
+
+def ruta_indice(ruta):
+    """raw_data.jsonl -> raw_data.idx"""
+    return os.path.splitext(ruta)[0] + '.idx'
+
+
+def ruta_manifiesto(ruta):
+    """raw_data.jsonl -> raw_data.manifest.json"""
+    return os.path.splitext(ruta)[0] + '.manifest.json'
+
+
+def nombre_segmento(ruta, numero):
+    """raw_data.jsonl, 3 -> raw_data.000003.jsonl"""
+    base, ext = os.path.splitext(os.path.basename(ruta))
+    return f"{base}.{numero:06d}{ext}"
+
+
+def leer_manifiesto(ruta):
+    """
+    Devuelve el manifiesto del almacén. Si no existe (log de un solo fichero)
+    se devuelve uno equivalente con raw_data.jsonl como único segmento.
+    """
+    try:
+        with open(ruta_manifiesto(ruta), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'segmentos': [os.path.basename(ruta)], 'siguiente': 1, 'compactados': []}
+
+
+def _escribir_manifiesto(ruta, manifiesto):
+    """Sustituye el manifiesto de forma atómica (tmp + fsync + rename)."""
+    destino = ruta_manifiesto(ruta)
+    tmp = destino + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifiesto, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, destino)
+
+
+@contextmanager
+def bloqueo_manifiesto(ruta):
+    """Serializa los cambios de manifiesto (rotación y compactación)."""
+    with open(os.path.splitext(ruta)[0] + '.lock', 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def rutas_segmentos(ruta, manifiesto=None):
+    """Rutas absolutas de los segmentos, del más antiguo al activo."""
+    manifiesto = manifiesto or leer_manifiesto(ruta)
+    directorio = os.path.dirname(os.path.abspath(ruta))
+    return [os.path.join(directorio, nombre) for nombre in manifiesto['segmentos']]
+
+
+def _leer_entradas_indice(ruta_idx):
+    """Devuelve las entradas (source, offset, n) del índice, ignorando líneas rotas."""
+    entradas = []
+    if not os.path.exists(ruta_idx):
+        return entradas
+    with open(ruta_idx, 'rb') as f:
+        for linea in f:
+            try:
+                e = json.loads(linea)
+                entradas.append((e['s'], e['o'], e['n']))
+            except (ValueError, KeyError):
+                continue  # Línea a medio escribir tras una caída
+    return entradas
+
+
+def _leer_cola_indice(ruta_idx, desde):
+    """
+    Entradas (source, offset, n) del índice a partir del byte `desde` y
+    posición hasta la que se ha leído. Una línea a medio escribir se deja
+    para la siguiente lectura.
+    """
+    entradas = []
+    try:
+        f = open(ruta_idx, 'rb')
+    except FileNotFoundError:
+        return entradas, desde
+    with f:
+        f.seek(desde)
+        for linea in f:
+            if not linea.endswith(b'\n'):
+                break
+            desde += len(linea)
+            try:
+                e = json.loads(linea)
+                entradas.append((e['s'], e['o'], e['n']))
+            except (ValueError, KeyError):
+                continue
+    return entradas, desde
+
+
+def _escanear_log(f, desde, hasta=None):
+    """
+    Recorre el log (fichero abierto en binario) desde el offset `desde` y
+    devuelve las entradas de índice de las líneas completas que encuentre.
+    """
+    entradas = []
+    f.seek(desde)
+    offset = desde
+    for linea in f:
+        if not linea.endswith(b'\n') or (hasta is not None and offset + len(linea) > hasta):
+            break  # Última línea incompleta
+        try:
+            entradas.append((json.loads(linea)['source'], offset, len(linea)))
+        except (ValueError, KeyError, TypeError):
+            pass
+        offset += len(linea)
+    return entradas
+
+
+def _entradas_validas(ruta, tam):
+    """
+    Entradas del índice y offset hasta el que cubren el log. Si el índice
+    apunta más allá del final del log (log borrado o sustituido) se descarta.
+    """
+    entradas = _leer_entradas_indice(ruta_indice(ruta))
+    fin = max((o + n for _, o, n in entradas), default=0)
+    if fin > tam:
+        return [], 0
+    return entradas, fin
+
+
+def cargar_indice(ruta, f=None):
+    """
+    Construye {source: [(offset, n), ...]} (de más antiguo a más reciente)
+    a partir del índice y, si el log tiene registros posteriores al último
+    indexado, escaneando solo esa cola. `f` es el log ya abierto, si lo está.
+    """
+    propio = f is None
+    if propio:
+        if not os.path.exists(ruta):
+            return {}
+        f = open(ruta, 'rb')
+    try:
+        tam = os.fstat(f.fileno()).st_size
+        entradas, fin = _entradas_validas(ruta, tam)
+        if tam > fin:
+            entradas += _escanear_log(f, fin, tam)
+    finally:
+        if propio:
+            f.close()
+    indice = {}
+    for source, offset, n in entradas:
+        indice.setdefault(source, []).append((offset, n))
+    return indice
+
+
+def sincronizar_indice(ruta):
+    """
+    Deja log e índice coherentes antes de empezar a escribir: completa la
+    última línea del log si quedó cortada, descarta una línea de índice a
+    medias e indexa los registros que se escribieron sin índice.
+    """
+    ruta_idx = ruta_indice(ruta)
+    for fichero in (ruta, ruta_idx):
+        if os.path.exists(fichero) and os.path.getsize(fichero) > 0:
+            with open(fichero, 'rb+') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    if fichero == ruta:
+                        f.write(b'\n')
+                    else:
+                        f.seek(0)
+                        contenido = f.read()
+                        f.truncate(contenido.rfind(b'\n') + 1)
+    tam = os.path.getsize(ruta) if os.path.exists(ruta) else 0
+    entradas, fin = _entradas_validas(ruta, tam)
+    if not entradas and os.path.exists(ruta_idx):
+        # Índice vacío o que no corresponde a este log: se reconstruye entero
+        os.remove(ruta_idx)
+    if tam > fin:
+        with open(ruta, 'rb') as log, open(ruta_idx, 'ab') as f:
+            for source, offset, n in _escanear_log(log, fin):
+                f.write(linea_indice(source, offset, n))
+
+
+def linea_indice(source, offset, n):
+    """Línea del índice (.idx) para un registro de `n` bytes en `offset`."""
+    return (json.dumps({'s': source, 'o': offset, 'n': n}, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+class EscritorLog:
+    """Escritor único con group commit sobre el segmento activo del log."""
+
+    def __init__(self, ruta, max_lote=1024, max_espera=0.002,
+                 fsync=FSYNC_LOTE, fsync_intervalo=1.0, max_segmento=MAX_SEGMENTO, al_escribir=None,
+                 al_confirmar=None):
+        if fsync not in POLITICAS_FSYNC:
+            raise ValueError(f"Política de fsync desconocida: {fsync}")
+        self.ruta = ruta
+        self.max_lote = max_lote
+        self.max_espera = max_espera
+        self.fsync = fsync
+        self.fsync_intervalo = fsync_intervalo
+        self.max_segmento = max_segmento
+        # Se llaman con las (source, línea) de cada lote escrito, en el orden del log, y lo que
+        # se preparó para cada una al enviarla (None si nada): al_confirmar antes de resolver los
+        # futures (lo que debe verse ya al recibir el ACK) y al_escribir después
+        self.al_escribir = al_escribir
+        self.al_confirmar = al_confirmar
+        self._cola = queue.Queue()
+        self._hilo = None
+        self._ultimo_fsync = 0.0
+
+    def iniciar(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.ruta)), exist_ok=True)
+        with bloqueo_manifiesto(self.ruta):
+            manifiesto = leer_manifiesto(self.ruta)
+            if not os.path.exists(ruta_manifiesto(self.ruta)):
+                _escribir_manifiesto(self.ruta, manifiesto)
+        self._abrir_segmento(rutas_segmentos(self.ruta, manifiesto)[-1])
+        self._hilo = threading.Thread(target=self._bucle, name='escritor-log', daemon=True)
+        self._hilo.start()
+        return self
+
+    def _abrir_segmento(self, ruta_activa):
+        sincronizar_indice(ruta_activa)
+        self.ruta_activa = ruta_activa
+        self._fichero = open(ruta_activa, 'ab')
+        self._indice = open(ruta_indice(ruta_activa), 'ab')
+        self._posicion = self._fichero.seek(0, os.SEEK_END)
+
+    def _cerrar_segmento(self):
+        self._fichero.flush()
+        os.fsync(self._fichero.fileno())
+        os.fsync(self._indice.fileno())
+        self._fichero.close()
+        self._indice.close()
+
+    def _rotar(self):
+        """Sella el segmento activo y abre uno nuevo."""
+        self._cerrar_segmento()
+        with bloqueo_manifiesto(self.ruta):
+            manifiesto = leer_manifiesto(self.ruta)
+            manifiesto['segmentos'].append(nombre_segmento(self.ruta, manifiesto['siguiente']))
+            manifiesto['siguiente'] += 1
+            _escribir_manifiesto(self.ruta, manifiesto)
+        self._abrir_segmento(rutas_segmentos(self.ruta, manifiesto)[-1])
+
+    def enviar(self, lineas, preparadas=None):
+        """
+        Encola los registros de un mensaje: lista de (source, línea), con la
+        línea en bytes terminada en '\\n'. `preparadas` (una por línea) se
+        pasa tal cual a los callbacks.
+        Devuelve un Future que se resuelve con el número de líneas cuando su
+        lote está escrito, o con la excepción si la escritura falla.
+        """
+        futuro = Future()
+        self._cola.put((lineas, futuro, preparadas or [None] * len(lineas)))
+        return futuro
+
+    def pendientes(self):
+        """Mensajes en cola esperando a ser escritos."""
+        return self._cola.qsize()
+
+    def cerrar(self):
+        """Escribe lo pendiente y cierra el fichero."""
+        if self._hilo is not None:
+            self._cola.put(_FIN)
+            self._hilo.join()
+            self._hilo = None
+
+    def _recoger_lote(self, primero):
+        """Junta lo que ya está en cola y espera hasta `max_espera` por más."""
+        lote = [primero]
+        n = len(primero[0])
+        limite = time.monotonic() + self.max_espera
+        while n < self.max_lote:
+            try:
+                item = self._cola.get_nowait()
+            except queue.Empty:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    item = self._cola.get(timeout=restante)
+                except queue.Empty:
+                    break
+            if item is _FIN:
+                return lote, True
+            lote.append(item)
+            n += len(item[0])
+        return lote, False
+
+    def _bucle(self):
+        terminar = False
+        while not terminar:
+            item = self._cola.get()
+            if item is _FIN:
+                break
+            lote, terminar = self._recoger_lote(item)
+            try:
+                self._escribir(lote)
+            except Exception as e:
+                for _, futuro, _ in lote:
+                    futuro.set_exception(e)
+                continue
+            escritas = [par for lineas, _, _ in lote for par in lineas]
+            preparadas = [p for _, _, lista in lote for p in lista]
+            self._avisar(self.al_confirmar, escritas, preparadas)
+            for lineas, futuro, _ in lote:
+                futuro.set_result(len(lineas))
+            self._avisar(self.al_escribir, escritas, preparadas)
+            if self._posicion >= self.max_segmento:
+                try:
+                    self._rotar()
+                except Exception as e:
+                    print(f"Error rotando el segmento activo: {e}")
+        self._cerrar_segmento()
+
+    @staticmethod
+    def _avisar(callback, lineas, preparadas):
+        if callback is not None:
+            try:
+                callback(lineas, preparadas)
+            except Exception as e:
+                print(f"Error tras escribir el lote: {e}")
+
+    def _escribir(self, lote):
+        datos, indice = [], []
+        posicion = self._posicion
+        for lineas, _, _ in lote:
+            for source, linea in lineas:
+                datos.append(linea)
+                indice.append(linea_indice(source, posicion, len(linea)))
+                posicion += len(linea)
+        # Primero los datos y después el índice: nunca hay entradas que apunten a nada
+        self._fichero.write(b''.join(datos))
+        self._fichero.flush()
+        self._indice.write(b''.join(indice))
+        self._indice.flush()
+        self._posicion = posicion
+        ahora = time.monotonic()
+        if self.fsync == FSYNC_LOTE or (
+                self.fsync == FSYNC_INTERVALO and ahora - self._ultimo_fsync >= self.fsync_intervalo):
+            os.fsync(self._fichero.fileno())
+            os.fsync(self._indice.fileno())
+            self._ultimo_fsync = ahora
+
+
+def compactar(ruta, versiones=1):
+    """
+    Junta todos los segmentos sellados en uno nuevo que conserva, para cada
+    fuente, solo sus `versiones` registros más recientes del almacén (si el
+    segmento activo ya tiene esas versiones, las copias selladas sobran).
+    Devuelve (registros leídos, registros conservados), o None si no hay
+    nada que compactar.
+    """
+    manifiesto = leer_manifiesto(ruta)
+    sellados = rutas_segmentos(ruta, manifiesto)[:-1]
+    nombres_sellados = manifiesto['segmentos'][:-1]
+    if not sellados or nombres_sellados == manifiesto.get('compactados'):
+        return None
+
+    # Versiones que ya aporta el segmento activo
+    activo = rutas_segmentos(ruta, manifiesto)[-1]
+    en_activo = {s: len(pos) for s, pos in cargar_indice(activo).items()}
+    indices = [cargar_indice(seg) for seg in sellados]
+    restantes = {}
+    conservar = []
+    # Del segmento más nuevo al más antiguo, quedándose con las últimas versiones
+    for i in range(len(sellados) - 1, -1, -1):
+        for source, posiciones in indices[i].items():
+            quedan = restantes.setdefault(source, max(0, versiones - en_activo.get(source, 0)))
+            elegidas = posiciones[-quedan:] if quedan else []
+            restantes[source] = quedan - len(elegidas)
+            conservar.extend((i, o, n, source) for o, n in elegidas)
+    # Se mantiene el orden original de llegada
+    conservar.sort()
+
+    with bloqueo_manifiesto(ruta):
+        manifiesto = leer_manifiesto(ruta)
+        nuevo = nombre_segmento(ruta, manifiesto['siguiente'])
+        manifiesto['siguiente'] += 1
+        _escribir_manifiesto(ruta, manifiesto)
+    ruta_nueva = os.path.join(os.path.dirname(os.path.abspath(ruta)), nuevo)
+    ficheros = [open(seg, 'rb') for seg in sellados]
+    try:
+        with open(ruta_nueva, 'wb') as datos, open(ruta_indice(ruta_nueva), 'wb') as idx:
+            posicion = 0
+            for i, o, n, source in conservar:
+                ficheros[i].seek(o)
+                datos.write(ficheros[i].read(n))
+                idx.write(linea_indice(source, posicion, n))
+                posicion += n
+            datos.flush()
+            idx.flush()
+            os.fsync(datos.fileno())
+            os.fsync(idx.fileno())
+    finally:
+        for f in ficheros:
+            f.close()
+
+    # Cambio atómico de manifiesto: los lectores ven el conjunto antiguo o el nuevo
+    with bloqueo_manifiesto(ruta):
+        manifiesto = leer_manifiesto(ruta)
+        primero = manifiesto['segmentos'].index(nombres_sellados[0])
+        manifiesto['segmentos'] = (manifiesto['segmentos'][:primero] + [nuevo] +
+                                   [s for s in manifiesto['segmentos'][primero:] if s not in nombres_sellados])
+        manifiesto['compactados'] = [nuevo]
+        _escribir_manifiesto(ruta, manifiesto)
+    # Los lectores que ya tenían abiertos los segmentos antiguos siguen leyéndolos sin problema
+    for seg in sellados:
+        for fichero in (seg, ruta_indice(seg)):
+            if os.path.exists(fichero):
+                os.remove(fichero)
+    return sum(len(p) for indice in indices for p in indice.values()), len(conservar)
+
+
+def compactar_periodicamente(ruta, intervalo, versiones=1, parar=None):
+    """Bucle de compactación en segundo plano (pensado para un hilo daemon)."""
+    parar = parar or threading.Event()
+    while not parar.wait(intervalo):
+        try:
+            resultado = compactar(ruta, versiones)
+            if resultado:
+                print(f"Compactación: {resultado[0]} registros -> {resultado[1]}")
+        except Exception as e:
+            print(f"Error en la compactación: {e}")
+
+
+def iterar_lineas(ruta, desde=0):
+    """
+    Recorre las líneas completas del log a partir del offset `desde`.
+    Devuelve (offset del final de la línea, línea en bytes).
+    """
+    with open(ruta, 'rb') as f:
+        f.seek(desde)
+        offset = desde
+        for linea in f:
+            if not linea.endswith(b'\n'):
+                break  # Línea a medio escribir
+            offset += len(linea)
+            yield offset, linea
+
+
+_PREFIJO_SOURCE = b'{"source": "'
+_CLAVE_RECIBIDO = b'"_received_at": "'
+
+
+def _fuente_rapida(linea):
+    """'source' leído del principio de la línea, o None si no tiene la forma habitual."""
+    if linea.startswith(_PREFIJO_SOURCE):
+        fin = linea.find(b'"', len(_PREFIJO_SOURCE))
+        if fin > 0 and linea[fin - 1] != 0x5C:
+            return linea[len(_PREFIJO_SOURCE):fin].decode('utf-8', 'replace')
+    return None
+
+
+def fuente_linea(linea):
+    """
+    Fuente de una línea del log sin decodificar todo el JSON: el servidor
+    siempre escribe 'source' como primera clave. None si no se puede saber.
+    """
+    source = _fuente_rapida(linea)
+    if source is not None:
+        return source
+    try:
+        return json.loads(linea).get('source')
+    except (ValueError, AttributeError):
+        return None
+
+
+def recibido_linea(linea):
+    """Timestamp '_received_at' de una línea (la última clave que escribe el servidor)."""
+    pos = linea.rfind(_CLAVE_RECIBIDO)
+    if pos < 0:
+        return ''
+    inicio = pos + len(_CLAVE_RECIBIDO)
+    return linea[inicio:linea.find(b'"', inicio)].decode('ascii', 'replace')
+
+
+def _filtro_fuentes(fuentes, prefijos):
+    fuentes, prefijos = frozenset(fuentes or ()), tuple(prefijos or ())
+    if not fuentes and not prefijos:
+        return lambda source: True
+    return lambda source: source in fuentes or source.startswith(prefijos)
+
+
+def _abrir_segmentos(ruta, intentos=5):
+    """
+    Abre los segmentos de una foto del manifiesto. Si una compactación borra
+    alguno entre medias, se reintenta con el manifiesto nuevo.
+    """
+    for intento in range(intentos):
+        abiertos = []
+        try:
+            segmentos = rutas_segmentos(ruta)
+            for seg in segmentos[:-1]:
+                abiertos.append(open(seg, 'rb'))
+            # El activo puede no existir todavía (recién rotado)
+            if os.path.exists(segmentos[-1]):
+                abiertos.append(open(segmentos[-1], 'rb'))
+            return abiertos
+        except FileNotFoundError:
+            for f in abiertos:
+                f.close()
+            if intento == intentos - 1:
+                raise
+
+
+def leer_registros(ruta, fuentes=(), prefijos=(), errores=None):
+    """
+    Generador de los registros del almacén, del más antiguo al más reciente,
+    cuya fuente está en `fuentes` o empieza por alguno de `prefijos` (sin
+    filtros, todos). La fuente se mira en los primeros bytes de cada línea y
+    solo se decodifican las que interesan. Las líneas mal formadas se cuentan
+    en el dict `errores` ('json': no es JSON válido, 'source': no tiene fuente).
+    """
+    interesa = _filtro_fuentes(fuentes, prefijos)
+    errores = {} if errores is None else errores
+    ficheros = _abrir_segmentos(ruta)
+    try:
+        for f in ficheros:
+            for linea in f:
+                if not linea.endswith(b'\n'):
+                    break  # Línea a medio escribir
+                source = _fuente_rapida(linea)
+                if source is not None and not interesa(source):
+                    continue
+                try:
+                    registro = json.loads(linea)
+                except ValueError:
+                    errores['json'] = errores.get('json', 0) + 1
+                    continue
+                if not isinstance(registro, dict) or not isinstance(registro.get('source'), str):
+                    errores['source'] = errores.get('source', 0) + 1
+                    continue
+                if source is None and not interesa(registro['source']):
+                    continue
+                yield registro
+    finally:
+        for f in ficheros:
+            f.close()
+
+
+class LectorLog:
+    """
+    Lectura de un fichero de log a través de su índice: cada consulta es un
+    seek + read del registro pedido, sin recorrer el resto del fichero.
+    El fichero se abre al crear el lector, así que sigue siendo legible
+    aunque una compactación lo borre después. refrescar() añade lo escrito
+    después leyendo solo la cola del índice (y del log, si va por delante).
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._fichero = None
+        self.indice = {}
+        self._leido_idx = 0  # Bytes del .idx ya incorporados
+        self._fin = 0        # Offset del log hasta el que llega self.indice
+        self.refrescar()
+
+    def refrescar(self):
+        """Incorpora los registros escritos desde la última vez y los devuelve como (source, offset, n)."""
+        if self._fichero is None:
+            if not os.path.exists(self.ruta):
+                return []
+            self._fichero = open(self.ruta, 'rb')
+        tam = os.fstat(self._fichero.fileno()).st_size
+        inicial = self._leido_idx == 0
+        entradas, self._leido_idx = _leer_cola_indice(ruta_indice(self.ruta), self._leido_idx)
+        if inicial and any(o + n > tam for _, o, n in entradas):
+            entradas = []  # Índice de otro log (borrado o sustituido): se indexa escaneando
+        # Lo ya indexado escaneando la cola del log vuelve a aparecer en el índice después
+        nuevas = [(s, o, n) for s, o, n in entradas if o >= self._fin and o + n <= tam]
+        if nuevas:
+            self._fin = nuevas[-1][1] + nuevas[-1][2]
+        if tam > self._fin:
+            cola = _escanear_log(self._fichero, self._fin, tam)
+            if cola:
+                self._fin = cola[-1][1] + cola[-1][2]
+            nuevas += cola
+        for source, offset, n in nuevas:
+            self.indice.setdefault(source, []).append((offset, n))
+        return nuevas
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+    def cerrar(self):
+        if self._fichero is not None:
+            self._fichero.close()
+            self._fichero = None
+
+    def _leer_linea(self, offset, n):
+        self._fichero.seek(offset)
+        return self._fichero.read(n)
+
+    def _leer(self, *posicion):
+        return json.loads(self._leer_linea(*posicion))
+
+    def fuentes(self, prefijo=''):
+        """Fuentes indexadas (opcionalmente solo las que empiezan por `prefijo`)."""
+        return sorted(s for s in self.indice if s.startswith(prefijo))
+
+    def ultimo(self, source):
+        """Registro completo más reciente de la fuente, o None si no existe."""
+        posiciones = self.indice.get(source)
+        if not posiciones:
+            return None
+        return self._leer(*posiciones[-1])
+
+    def historial(self, source):
+        """Todas las versiones de la fuente, de la más antigua a la más reciente."""
+        return [self._leer(*pos) for pos in self.indice.get(source, [])]
+
+    def lineas_historial(self, source):
+        """Como historial(), pero las líneas sin decodificar."""
+        return [self._leer_linea(*pos) for pos in self.indice.get(source, [])]
+
+    def linea(self, source):
+        """Línea (bytes, sin decodificar) del registro más reciente de la fuente, o None."""
+        posiciones = self.indice.get(source)
+        return self._leer_linea(*posiciones[-1]) if posiciones else None
+
+    def dato(self, source, defecto=None):
+        """Campo 'data' del registro más reciente de la fuente (o `defecto`)."""
+        registro = self.ultimo(source)
+        return registro['data'] if registro is not None else defecto
+
+
+class LectorAlmacen(LectorLog):
+    """
+    Lector de todo el almacén segmentado. Toma una foto del manifiesto y abre
+    todos sus segmentos a la vez, de modo que una compactación en marcha no
+    cambia lo que ve (si un segmento desaparece entre medias, se reintenta).
+    """
+
+    def __init__(self, ruta, intentos=5):
+        self.ruta = ruta
+        self._intentos = intentos
+        self._abrir()
+
+    def _abrir(self):
+        self.segmentos = []
+        for intento in range(self._intentos):
+            try:
+                segmentos = rutas_segmentos(self.ruta)
+                for seg in segmentos[:-1]:
+                    self.segmentos.append(LectorLog(seg))
+                    if self.segmentos[-1]._fichero is None:
+                        raise FileNotFoundError(seg)
+                # El activo puede no existir todavía (recién rotado)
+                self.segmentos.append(LectorLog(segmentos[-1]))
+                break
+            except FileNotFoundError:
+                self.cerrar()
+                if intento == self._intentos - 1:
+                    raise
+        # Índice combinado: cada posición lleva el segmento al que pertenece
+        self.indice = {}
+        for lector in self.segmentos:
+            for source, posiciones in lector.indice.items():
+                self.indice.setdefault(source, []).extend((lector, o, n) for o, n in posiciones)
+
+    def refrescar(self):
+        """
+        Pone al día un lector de larga duración. Del segmento activo solo se
+        lee lo nuevo y, si se ha rotado, se abren los segmentos que siguen;
+        si una compactación ha cambiado los sellados, se vuelve a abrir todo.
+        """
+        segmentos = rutas_segmentos(self.ruta)
+        abiertos = [lector.ruta for lector in self.segmentos]
+        if segmentos[:len(abiertos)] != abiertos:
+            self.cerrar()
+            self._abrir()
+            return
+        try:
+            nuevos = [LectorLog(seg) for seg in segmentos[len(abiertos):]]
+        except FileNotFoundError:
+            self.cerrar()
+            self._abrir()
+            return
+        # Lo que le quedaba por escribir al activo antes de rotar va antes que los segmentos nuevos
+        activo = self.segmentos[-1]
+        for source, o, n in activo.refrescar():
+            self.indice.setdefault(source, []).append((activo, o, n))
+        for lector in nuevos:
+            self.segmentos.append(lector)
+            for source, posiciones in lector.indice.items():
+                self.indice.setdefault(source, []).extend((lector, o, n) for o, n in posiciones)
+
+    def cerrar(self):
+        for lector in self.segmentos:
+            lector.cerrar()
+        self.segmentos = []
+
+    def _leer_linea(self, lector, offset, n):
+        return lector._leer_linea(offset, n)
@@ -0,0 +1,193 @@
+"""
+Suscripciones a los registros nuevos del servidor de ingesta
+
+Un consumidor manda un frame SUSCRIBIR con las fuentes que le interesan
+(nombres exactos y/o prefijos) y la conexión pasa a recibir frames EVENTO
+con las líneas de cada lote escrito que encajan, en el orden del log. Los
+agregados que materializa el servidor (rollups) se publican también, con la
+vista nueva, cuando cambia alguna de sus filas. Con "inicial": true la
+primera respuesta es un RESULTADO con el último registro de cada fuente que
+encaja (la misma forma que un mget), así que el consumidor no necesita leer
+el log para empezar.
+
+Contrapresión: cada suscriptor tiene sus pendientes, y un consumidor lento
+no frena la ingesta. Mientras el envío anterior no ha salido, las líneas
+nuevas de una fuente sustituyen a las pendientes de la misma fuente (se
+conserva solo la última versión, que es lo que interesa para "el último
+registro de cada fuente"). Si aun así lo pendiente pasa de MAX_PENDIENTE
+bytes, se corta la suscripción con un ERR y el consumidor se vuelve a
+suscribir con "inicial".
+
+Con --workers, cada worker avisa al proceso principal de la unión de lo que
+piden sus suscriptores; el principal le reenvía por el Pipe las líneas que
+encajan (con la misma contrapresión) y el worker las reparte.
+
+suscribirse() es el cliente: un generador de listas de registros.
+"""
+
+import json
+import socket
+import threading
+from collections import OrderedDict
+
+from common.protocol import (TIPO_SUSCRIBIR, TIPO_EVENTO, TIPO_RESULTADO, TIPO_ACK, TIPO_ERR,
+                             empaquetar, leer_frame, descomprimir)
+
+MAX_PENDIENTE = 16 * 1024 * 1024  # bytes por suscriptor
+
+
+class ConsumidorLento(Exception):
+    """Lo pendiente de un suscriptor ha pasado de MAX_PENDIENTE."""
+
+
+class Suscriptor:
+    """Líneas pendientes de enviar a un consumidor, conservando solo la última versión de cada fuente."""
+
+    def __init__(self, fuentes=(), prefijos=(), max_pendiente=MAX_PENDIENTE):
+        self.fuentes = frozenset(fuentes)
+        self.prefijos = tuple(prefijos)
+        self.max_pendiente = max_pendiente
+        self._pendientes = OrderedDict()  # source -> línea
+        self._bytes = 0
+        self._cambio = threading.Condition()
+        self._cerrada = None  # Motivo del cierre
+        # Se llama (desde el hilo del escritor) cuando hay algo nuevo: despierta a un consumidor asyncio
+        self.avisar = None
+        self.enviadas = 0
+        self.sustituidas = 0
+
+    def interesa(self, source):
+        return source in self.fuentes or source.startswith(self.prefijos)
+
+    def anotar(self, lineas):
+        with self._cambio:
+            if self._cerrada is not None:
+                return
+            nuevas = 0
+            for source, linea in lineas:
+                if not self.interesa(source):
+                    continue
+                nuevas += 1
+                anterior = self._pendientes.pop(source, None)
+                if anterior is not None:
+                    self._bytes -= len(anterior)
+                    self.sustituidas += 1
+                self._pendientes[source] = linea
+                self._bytes += len(linea)
+            if self._bytes > self.max_pendiente:
+                self._cerrada = ConsumidorLento(f"Consumidor demasiado lento: más de {self.max_pendiente} "
+                                                f"bytes pendientes, vuelve a suscribirte")
+                self._pendientes.clear()
+            elif not nuevas:
+                return
+            self._cambio.notify_all()
+        if self.avisar is not None:
+            self.avisar()
+
+    def esperar(self, timeout=None):
+        """
+        Pares (source, línea) pendientes, que saca de la cola, o [] si no
+        llega nada en `timeout`. Lanza el motivo si la suscripción se ha cerrado.
+        """
+        with self._cambio:
+            self._cambio.wait_for(lambda: self._pendientes or self._cerrada is not None, timeout)
+            if self._cerrada is not None:
+                raise self._cerrada
+            pares = list(self._pendientes.items())
+            self._pendientes.clear()
+            self._bytes = 0
+            self.enviadas += len(pares)
+            return pares
+
+    def cerrar(self, motivo=None):
+        with self._cambio:
+            if self._cerrada is not None:
+                return
+            self._cerrada = motivo or ConnectionAbortedError("Suscripción cerrada")
+            self._cambio.notify_all()
+        if self.avisar is not None:
+            self.avisar()
+
+
+class Suscripciones:
+    """Suscriptores activos del servidor; publicar() se llama con cada lote escrito."""
+
+    def __init__(self):
+        self._suscriptores = []
+        self._lock = threading.Lock()
+        # Se llama con el registro cada vez que cambian los suscriptores (lo usan los workers)
+        self.al_cambiar = None
+
+    def __bool__(self):
+        return bool(self._suscriptores)
+
+    def suscribir(self, fuentes=(), prefijos=()):
+        suscriptor = Suscriptor(fuentes, prefijos)
+        with self._lock:
+            self._suscriptores = self._suscriptores + [suscriptor]
+            self._cambiado()
+        return suscriptor
+
+    def cancelar(self, suscriptor):
+        suscriptor.cerrar()
+        with self._lock:
+            if suscriptor not in self._suscriptores:
+                return
+            self._suscriptores = [s for s in self._suscriptores if s is not suscriptor]
+            self._cambiado()
+
+    def _cambiado(self):
+        # Con el lock tomado: los avisos salen en el mismo orden que los cambios
+        if self.al_cambiar is not None:
+            self.al_cambiar(self)
+
+    def interesa(self, source):
+        return any(s.interesa(source) for s in self._suscriptores)
+
+    def interes(self):
+        """(fuentes, prefijos) que piden entre todos los suscriptores."""
+        suscriptores = self._suscriptores
+        return (sorted(set().union(*(s.fuentes for s in suscriptores))),
+                sorted(set().union(*(s.prefijos for s in suscriptores))))
+
+    def publicar(self, lineas):
+        for suscriptor in self._suscriptores:
+            suscriptor.anotar(lineas)
+
+    def cerrar(self, motivo=None):
+        """Corta todas las suscripciones (al apagar el servidor, con ConnectionAbortedError)."""
+        for suscriptor in self._suscriptores:
+            suscriptor.cerrar(motivo or ConnectionAbortedError("Servidor apagándose"))
+
+    def estadisticas(self):
+        suscriptores = self._suscriptores
+        return {'suscriptores': len(suscriptores),
+                'enviadas': sum(s.enviadas for s in suscriptores),
+                'sustituidas': sum(s.sustituidas for s in suscriptores)}
+
+
+def suscribirse(host, port, fuentes=(), prefijos=(), inicial=True, compresion='zlib', timeout=None):
+    """
+    Generador de listas de registros: primero (con `inicial`) el último de
+    cada fuente que encaja y después los de cada EVENTO según se escriben.
+    Termina cuando el servidor cierra la conexión; un ERR se lanza como
+    RuntimeError.
+    """
+    with socket.create_connection((host, port), timeout=timeout) as s:
+        peticion = {'fuentes': list(fuentes), 'prefijos': list(prefijos), 'inicial': inicial,
+                    'compresion': compresion}
+        s.sendall(empaquetar(TIPO_SUSCRIBIR, json.dumps(peticion).encode('utf-8')))
+        while True:
+            frame = leer_frame(s)
+            if frame is None:
+                return
+            tipo, flags, payload = frame
+            if tipo == TIPO_ERR:
+                raise RuntimeError(bytes(payload).decode('utf-8', 'replace'))
+            if tipo == TIPO_RESULTADO:
+                registros = json.loads(descomprimir(payload, flags))['registros']
+                yield [r for r in registros.values() if r is not None]
+            elif tipo == TIPO_EVENTO:
+                yield json.loads(descomprimir(payload, flags))
+            elif tipo != TIPO_ACK:
+                raise RuntimeError(f"Frame inesperado en la suscripción (tipo {tipo})")
@@ -0,0 +1,222 @@
+"""
+Último registro de cada fuente en memoria del servidor
+
+El servidor mantiene, a partir de cada lote escrito, la línea más reciente de
+cada fuente y la lista ordenada de fuentes, y las sirve con frames CONSULTA
+por el mismo socket de ingesta (ver common/protocol.py):
+
+    {"op": "get",  "source": "CIS_CURRENT"}             -> {"registros": {source: registro | null}}
+    {"op": "mget", "sources": ["CIS_CURRENT", ...]}     -> {"registros": {...}}
+    {"op": "mget", "prefijos": ["PROVINCE_"]}           -> {"registros": {...}}  (todas las que empiezan así)
+    {"op": "list", "prefijo": "PROVINCE_"}              -> {"fuentes": [...]}
+    {"op": "historial", "source": "CIS_CURRENT"}        -> {"registros": [registro, ...]}  (de más antiguo a más reciente)
+
+Con "compresion": "zlib" (o "zstd") en la consulta, la respuesta grande va
+comprimida. Las líneas se sirven tal como están en el log, sin volver a
+serializarlas.
+
+La memoria de las líneas está acotada a MAX_BYTES. Se expulsan primero las
+menos consultadas: una fuente nueva entra como la más fría, así que las filas
+que escriben los scrapers (PROVINCE_*, TRENDS_DAY_*, ...) y nadie pide no
+desplazan a los agregados que consulta el análisis. Los nombres no se
+expulsan nunca; la línea de una fuente expulsada se vuelve a leer del log
+(con el índice) la siguiente vez que se pide, con un lector que se abre una
+vez y en cada fallo solo incorpora lo escrito desde el anterior.
+
+El historial se lee del log (lo que haya dejado la compactación) con el
+mismo lector que los fallos.
+
+LectorServidor es el cliente: la misma interfaz que LectorAlmacen (fuentes,
+ultimo, historial, dato) contra el servidor en marcha, con precargar() para traer todas
+las fuentes que se van a usar en un solo round trip.
+"""
+
+import bisect
+import json
+import socket
+import threading
+from collections import OrderedDict
+
+from common.protocol import (TIPO_CONSULTA, TIPO_RESULTADO, TIPO_ERR, empaquetar, leer_frame, descomprimir)
+from common.storage import LectorAlmacen
+
+MAX_BYTES = 64 * 1024 * 1024
+
+
+class CacheUltimos:
+    """Línea más reciente de cada fuente (LRU por consultas, acotada en bytes) y nombres ordenados."""
+
+    def __init__(self, ruta, max_bytes=MAX_BYTES):
+        self.ruta = ruta
+        self.max_bytes = max_bytes
+        self._lineas = OrderedDict()  # source -> línea, de la menos a la más consultada
+        self._nombres = []            # Todas las fuentes conocidas, ordenadas
+        self._conocidas = set()
+        self._lock = threading.Lock()
+        # Lector del almacén para los fallos: se abre con el primero y después solo se refresca
+        self._lector = None
+        self._lock_lector = threading.Lock()
+        self.bytes = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsadas = 0
+
+    def _anotar(self, source, linea, consultada):
+        if source not in self._conocidas:
+            self._conocidas.add(source)
+            bisect.insort(self._nombres, source)
+        if source in self._lineas:
+            # Una versión nueva conserva el puesto de la anterior
+            self.bytes += len(linea) - len(self._lineas[source])
+            self._lineas[source] = linea
+            if consultada:
+                self._lineas.move_to_end(source)
+        else:
+            self._lineas[source] = linea
+            self.bytes += len(linea)
+            if not consultada:
+                self._lineas.move_to_end(source, last=False)
+        while self.bytes > self.max_bytes and self._lineas:
+            _, expulsada = self._lineas.popitem(last=False)
+            self.bytes -= len(expulsada)
+            self.expulsadas += 1
+
+    def aplicar_lineas(self, lineas):
+        """Callback del escritor: (source, línea) ya escritas, en el orden del log."""
+        with self._lock:
+            for source, linea in lineas:
+                self._anotar(source, linea, False)
+
+    def cargar(self, lector):
+        """Nombres de todas las fuentes del almacén y sus líneas mientras quepan."""
+        with self._lock:
+            for source in lector.fuentes():
+                if self.bytes < self.max_bytes:
+                    self._anotar(source, lector.linea(source), False)
+                elif source not in self._conocidas:
+                    self._conocidas.add(source)
+                    bisect.insort(self._nombres, source)
+        return self
+
+    def fuentes(self, prefijo=''):
+        """Fuentes conocidas que empiezan por `prefijo`, ordenadas."""
+        with self._lock:
+            inicio = bisect.bisect_left(self._nombres, prefijo)
+            fin = len(self._nombres)
+            if prefijo:
+                # El primer nombre que ya no empieza por el prefijo
+                fin = bisect.bisect_left(self._nombres, prefijo[:-1] + chr(ord(prefijo[-1]) + 1), inicio)
+            return self._nombres[inicio:fin]
+
+    def lineas(self, fuentes):
+        """{source: línea o None}. Las expulsadas se leen del log en una sola pasada por el índice."""
+        resultado = {}
+        faltan = []
+        with self._lock:
+            for source in fuentes:
+                if source in self._lineas:
+                    self._lineas.move_to_end(source)
+                    resultado[source] = self._lineas[source]
+                    self.aciertos += 1
+                elif source in self._conocidas:
+                    faltan.append(source)
+                    self.fallos += 1
+                else:
+                    resultado[source] = None
+        if faltan:
+            with self._lock_lector:
+                leidas = {source: self._lector_al_dia().linea(source) for source in faltan}
+            with self._lock:
+                for source, linea in leidas.items():
+                    if source in self._lineas:
+                        linea = self._lineas[source]  # Se ha escrito una versión nueva entre medias
+                    elif linea is not None:
+                        self._anotar(source, linea, True)
+                    resultado[source] = linea
+        return resultado
+
+    def _lector_al_dia(self):
+        # Con _lock_lector tomado
+        if self._lector is None:
+            self._lector = LectorAlmacen(self.ruta)
+        else:
+            self._lector.refrescar()
+        return self._lector
+
+    def historial(self, source):
+        """Líneas de todas las versiones de la fuente que quedan en el log, de la más antigua a la más reciente."""
+        with self._lock_lector:
+            return self._lector_al_dia().lineas_historial(source)
+
+    def cerrar(self):
+        """Cierra el lector de los fallos (al apagar el servidor)."""
+        with self._lock_lector:
+            if self._lector is not None:
+                self._lector.cerrar()
+                self._lector = None
+
+    def estadisticas(self):
+        with self._lock:
+            return {'fuentes': len(self._nombres), 'en_memoria': len(self._lineas), 'bytes': self.bytes,
+                    'max_bytes': self.max_bytes, 'aciertos': self.aciertos, 'fallos': self.fallos,
+                    'expulsadas': self.expulsadas}
+
+
+class LectorServidor:
+    """
+    Interfaz de consulta de LectorAlmacen (fuentes, ultimo, historial, dato)
+    contra el servidor de ingesta en marcha.
+    """
+
+    def __init__(self, host, port, compresion='zlib', timeout=30):
+        self._socket = socket.create_connection((host, port), timeout=timeout)
+        self._compresion = compresion
+        self._registros = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+    def cerrar(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def _consultar(self, peticion):
+        peticion = dict(peticion, compresion=self._compresion)
+        self._socket.sendall(empaquetar(TIPO_CONSULTA, json.dumps(peticion).encode('utf-8')))
+        respuesta = leer_frame(self._socket)
+        if respuesta is None:
+            raise ConnectionError("El servidor cerró la conexión")
+        tipo, flags, payload = respuesta
+        if tipo == TIPO_ERR:
+            raise RuntimeError(f"Consulta rechazada: {bytes(payload).decode('utf-8', 'replace')}")
+        if tipo != TIPO_RESULTADO:
+            raise RuntimeError(f"Respuesta inesperada del servidor (tipo {tipo})")
+        return json.loads(descomprimir(payload, flags))
+
+    def precargar(self, fuentes):
+        """Trae el último registro de todas las `fuentes` en una sola consulta."""
+        self._registros.update(self._consultar({'op': 'mget', 'sources': list(fuentes)})['registros'])
+        return self
+
+    def fuentes(self, prefijo=''):
+        """Fuentes que conoce el servidor (opcionalmente solo las que empiezan por `prefijo`)."""
+        return self._consultar({'op': 'list', 'prefijo': prefijo})['fuentes']
+
+    def ultimo(self, source):
+        """Registro completo más reciente de la fuente, o None si no existe."""
+        if source not in self._registros:
+            self._registros.update(self._consultar({'op': 'get', 'source': source})['registros'])
+        return self._registros[source]
+
+    def historial(self, source):
+        """Todas las versiones de la fuente que conserva el servidor, de la más antigua a la más reciente."""
+        return self._consultar({'op': 'historial', 'source': source})['registros']
+
+    def dato(self, source, defecto=None):
+        """Campo 'data' del registro más reciente de la fuente (o `defecto`)."""
+        registro = self.ultimo(source)
+        return registro['data'] if registro is not None else defecto
@@ -0,0 +1,255 @@
+"""
+Orquestador del pipeline ATD
+
+Arranca el servidor, espera a que acepte conexiones, lanza los scrapers en
+paralelo (cada uno en su propio proceso), apaga el servidor con SIGTERM para
+que vacíe el escritor antes de salir y ejecuta el análisis y la visualización.
+Al final muestra cuánto ha tardado cada etapa.
+
+--port y --metricas-port cambian los puertos del servidor; se le pasan a él,
+a los scrapers (variable de entorno ATD_PORT, que lee client_sender.py), a
+las comprobaciones de salud y al análisis de --en-vivo.
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+HOST = '127.0.0.1'
+PORT = 9999
+METRICAS_PORT = 9998
+SERVER_LOG = os.path.join(BASE_DIR, 'server_log.txt')
+
+# (nombre, script) de cada scraper; son independientes entre sí
+SCRAPERS = [
+    ('CIS', 'scrapers/cis_scraper.py'),
+    ('InfoElectoral', 'scrapers/resultados_scraper.py'),
+    ('Electomania', 'scrapers/electomania_scraper.py'),
+    ('Google Trends', 'scrapers/trends_selenium.py'),
+    ('Contexto Económico', 'scrapers/scraper_economia.py'),
+]
+
+TIMEOUT_ARRANQUE = 15    # segundos hasta que el servidor acepta conexiones
+TIMEOUT_SCRAPER = 600    # segundos máximos por scraper
+TIMEOUT_APAGADO = 60     # segundos para que el servidor vacíe el escritor y salga
+
+# (etapa, segundos) en orden de ejecución
+tiempos = []
+
+
+@contextmanager
+def etapa(nombre):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        tiempos.append((nombre, time.perf_counter() - inicio))
+
+
+def ejecutar(script, *args, timeout=None, capturar=False):
+    """Ejecuta un script del proyecto con el mismo intérprete, desde TRABAJO/."""
+    return subprocess.run([sys.executable, script, *args], cwd=BASE_DIR, timeout=timeout,
+                          capture_output=capturar, text=True, env=dict(os.environ, ATD_PORT=str(PORT)))
+
+
+def arrancar_servidor(args_servidor):
+    log = open(SERVER_LOG, 'w')
+    proceso = subprocess.Popen([sys.executable, '-u', 'server/server.py', '--port', str(PORT),
+                                '--metricas-port', str(METRICAS_PORT), *args_servidor],
+                               cwd=BASE_DIR, stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+    return proceso
+
+
+def consultar_metricas(ruta='/metrics'):
+    """GET al servidor de métricas. Devuelve (código HTTP, JSON) o None si no responde (o están desactivadas)."""
+    if not METRICAS_PORT:
+        return None
+    try:
+        with urllib.request.urlopen(f"http://{HOST}:{METRICAS_PORT}{ruta}", timeout=1) as r:
+            return r.status, json.load(r)
+    except urllib.error.HTTPError as e:
+        return e.code, None
+    except (OSError, ValueError):
+        return None
+
+
+def _listo():
+    """Listo según /health; si las métricas están desactivadas, basta con que acepte conexiones."""
+    salud = consultar_metricas('/health')
+    if salud is not None:
+        return salud[0] == 200
+    try:
+        socket.create_connection((HOST, PORT), timeout=0.5).close()
+        return True
+    except OSError:
+        return False
+
+
+def esperar_servidor(proceso, timeout=TIMEOUT_ARRANQUE):
+    """Sondea la salud del servidor hasta que está listo (en vez de un sleep fijo)."""
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"El servidor terminó al arrancar (código {proceso.returncode}), ver {SERVER_LOG}")
+        if _listo():
+            return
+        time.sleep(0.05)
+    raise RuntimeError(f"El servidor no está listo tras {timeout}s")
+
+
+def mostrar_metricas():
+    respuesta = consultar_metricas()
+    if respuesta is None or respuesta[1] is None:
+        return
+    m = respuesta[1]
+    lat = m['latencia_ms']
+    print(f"Servidor: {m['registros']} registros ({m['bytes'] / 1024:.1f} KB) en {m['mensajes']} mensajes, "
+          f"latencia p50 {lat['p50']} ms / p99 {lat['p99']} ms, errores {m['errores']}")
+
+
+def _scraper(nombre, script):
+    inicio = time.perf_counter()
+    try:
+        resultado = ejecutar(script, timeout=TIMEOUT_SCRAPER, capturar=True)
+        codigo, salida = resultado.returncode, resultado.stdout + resultado.stderr
+    except subprocess.TimeoutExpired:
+        codigo, salida = None, f"Timeout tras {TIMEOUT_SCRAPER}s\n"
+    return nombre, codigo, salida, time.perf_counter() - inicio
+
+
+def ejecutar_scrapers(paralelos):
+    """
+    Lanza los scrapers a la vez (hasta `paralelos` procesos) y muestra la
+    salida de cada uno entera cuando termina, para que no se mezclen.
+    Devuelve los nombres de los que fallaron.
+    """
+    fallidos = []
+    with ThreadPoolExecutor(max_workers=paralelos) as pool:
+        futuros = [pool.submit(_scraper, nombre, script) for nombre, script in SCRAPERS]
+        for futuro in as_completed(futuros):
+            nombre, codigo, salida, segundos = futuro.result()
+            estado = "OK" if codigo == 0 else f"FALLO ({'timeout' if codigo is None else codigo})"
+            print(f"\n[{nombre}] {estado} en {segundos:.2f}s")
+            print(salida.rstrip())
+            tiempos.append((f"  scraper {nombre}", segundos))
+            if codigo != 0:
+                fallidos.append(nombre)
+    return fallidos
+
+
+def apagar_servidor(proceso, timeout=TIMEOUT_APAGADO):
+    """
+    SIGTERM y espera: el servidor deja de aceptar conexiones, termina las que
+    tenga abiertas y vacía el escritor, así que todo lo confirmado con ACK
+    está en disco cuando sale. Solo si no termina a tiempo se mata.
+    """
+    if proceso.poll() is not None:
+        return proceso.returncode
+    proceso.send_signal(signal.SIGTERM)
+    try:
+        return proceso.wait(timeout)
+    except subprocess.TimeoutExpired:
+        print(f"⚠️  El servidor no terminó en {timeout}s, se fuerza la salida")
+        proceso.kill()
+        return proceso.wait()
+
+
+def mostrar_tiempos():
+    print("\n--- TIEMPOS POR ETAPA ---")
+    for nombre, segundos in tiempos:
+        print(f"{nombre:32} {segundos:8.2f}s")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Pipeline completo ATD: servidor, scrapers, análisis y gráfico")
+    parser.add_argument('--paralelos', type=int, default=len(SCRAPERS),
+                        help="Scrapers que se ejecutan a la vez")
+    modo = parser.add_mutually_exclusive_group()
+    modo.add_argument('--incremental', action='store_true',
+                      help="Ejecutar el análisis en modo incremental (ver bias_calculator.py)")
+    modo.add_argument('--en-vivo', action='store_true',
+                      help="Ejecutar el análisis consultando al servidor antes de apagarlo, sin leer el log")
+    parser.add_argument('--port', type=int, default=PORT,
+                        help="Puerto TCP de ingesta del servidor")
+    parser.add_argument('--metricas-port', type=int, default=METRICAS_PORT,
+                        help="Puerto HTTP de /metrics y /health del servidor (0 = desactivado)")
+    parser.add_argument('--servidor', default='',
+                        help='Opciones extra para server/server.py, p.ej. --servidor="--async --fsync intervalo"')
+    return parser.parse_args()
+
+
+def main():
+    global PORT, METRICAS_PORT
+    args = parse_args()
+    PORT, METRICAS_PORT = args.port, args.metricas_port
+    # Que nuestras líneas no se desordenen con la salida de los subprocesos
+    sys.stdout.reconfigure(line_buffering=True)
+    inicio = time.perf_counter()
+    print("--- STARTING PIPELINE ---")
+
+    print("[1/4] Starting Server...")
+    with etapa("arranque servidor"):
+        servidor = arrancar_servidor(args.servidor.split())
+        try:
+            esperar_servidor(servidor)
+        except RuntimeError as e:
+            apagar_servidor(servidor)
+            print(f"❌ {e}")
+            return 1
+
+    print(f"[2/4] Running {len(SCRAPERS)} scrapers in parallel...")
+    try:
+        with etapa("scrapers (total)"):
+            fallidos = ejecutar_scrapers(args.paralelos)
+        if args.en_vivo:
+            print("\n--- RUNNING ANALYSIS (live server) ---")
+            with etapa("análisis"):
+                analisis = ejecutar('analysis/bias_calculator.py', '--servidor', f'{HOST}:{PORT}')
+    finally:
+        mostrar_metricas()
+        print("\n[3/4] Stopping Server (draining writer)...")
+        with etapa("apagado servidor"):
+            codigo = apagar_servidor(servidor)
+    if fallidos:
+        print(f"⚠️  Scrapers con errores: {', '.join(fallidos)}")
+    if codigo != 0:
+        print(f"⚠️  El servidor salió con código {codigo}, ver {SERVER_LOG}")
+
+    if not args.en_vivo:
+        print("\n--- RUNNING ANALYSIS ---")
+        with etapa("análisis"):
+            analisis = ejecutar('analysis/bias_calculator.py', *(['--incremental'] if args.incremental else []))
+    if analisis.returncode != 0:
+        mostrar_tiempos()
+        return analisis.returncode
+
+    print("\n--- GENERATING VISUALIZATION ---")
+    with etapa("visualización"):
+        grafico = ejecutar('analysis/visualizer.py', capturar=True)
+    if grafico.returncode == 0:
+        print(grafico.stdout.rstrip())
+    else:
+        print("⚠️  Skipped: matplotlib not installed (pip3 install matplotlib)")
+
+    tiempos.append(("TOTAL", time.perf_counter() - inicio))
+    mostrar_tiempos()
+
+    print("\n✅ PIPELINE COMPLETE!")
+    print("   📊 Prediction: data/final_prediction_2027.csv")
+    print("   📈 Chart: docs/prediction_chart.png (if matplotlib installed)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
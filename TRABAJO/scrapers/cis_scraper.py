@@ -7,12 +7,16 @@ En un proyecto real se usaría BeautifulSoup + requests para scrapear
 de verdad desde cis.es
 """
 
+import os
 import sys
+# common/ está en la raíz del proyecto (como en analysis/)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 try:
-    from client_sender import send_data
+    from client_sender import send_data, send_batch, send_aggregate, session
 except ImportError:
     sys.path.append('.')
-    from client_sender import send_data
+    from client_sender import send_data, send_batch, send_aggregate, session
+from common.dimensiones import REGIONES, DIMS_REGIONES, matriz_desde_celdas, celdas_regionales
 
 CIS_URL = "https://www.cis.es/cis/opencms/ES/index.html"
 
@@ -76,11 +80,7 @@ def obtener_datos_demograficos():
 def obtener_datos_regionales():
     """Desglose por comunidades autónomas"""
     import random
-    regiones = [
-        'Andalucia', 'Aragon', 'Asturias', 'Baleares', 'Canarias', 'Cantabria',
-        'Castilla y Leon', 'Castilla-La Mancha', 'Cataluña', 'Valencia',
-        'Extremadura', 'Galicia', 'Madrid', 'Murcia', 'Navarra', 'Pais Vasco', 'Rioja'
-    ]
+    regiones = REGIONES
     
     datos_regionales = {}
     for region in regiones:
@@ -94,6 +94,10 @@ def obtener_datos_regionales():
     
     return datos_regionales
 
+def matriz_regional(regionales):
+    """Desglose regional como registro matriz región × partido."""
+    return matriz_desde_celdas(DIMS_REGIONES, celdas_regionales(regionales))
+
 def main():
     print("--- Iniciando Scraper CIS ---")
     print("Scrapeando última encuesta del CIS...")
@@ -103,15 +107,14 @@ def main():
     print(f"Últimos datos (9 partidos): {barometro_actual}")
     send_data("CIS_CURRENT", barometro_actual)
     
-    # 2. Barómetros históricos (enviamos cada uno individualmente)
+    # 2. Barómetros históricos (cada uno como registro individual, en un solo lote)
     barometros = obtener_barometros_historicos()
-    for i, bar in enumerate(barometros, 1):
-        send_data(f"CIS_BAROMETER_{i}_{bar['election_id']}", bar)
+    send_batch([(f"CIS_BAROMETER_{i}_{bar['election_id']}", bar) for i, bar in enumerate(barometros, 1)])
     
     print(f"✅ Enviados {len(barometros)} barómetros individuales")
     
-    # También lo enviamos agregado
-    send_data("CIS_HISTORICAL_MULTI", barometros)
+    # Agregado (si el servidor no lo construye él mismo con los barómetros individuales)
+    send_aggregate("CIS_HISTORICAL_MULTI", barometros)
     
     # 3. Valoración de líderes
     lideres = {'Sanchez': 4.3, 'Feijoo': 4.5, 'Diaz': 4.7, 'Abascal': 2.9}
@@ -119,21 +122,21 @@ def main():
     
     # 4. Datos demográficos (por grupo de edad)
     demograficos = obtener_datos_demograficos()
-    for grupo in demograficos:
-        send_data(f"CIS_DEMO_{grupo}", {grupo: demograficos[grupo]})
+    send_batch([(f"CIS_DEMO_{grupo}", {grupo: demograficos[grupo]}) for grupo in demograficos])
     
     print(f"✅ Enviados {len(demograficos)} desgloses demográficos")
-    send_data("CIS_DEMOGRAPHICS", demograficos)
+    send_aggregate("CIS_DEMOGRAPHICS", demograficos)
     
     # 5. Datos regionales (por comunidad autónoma)
     regionales = obtener_datos_regionales()
-    for region in regionales:
-        send_data(f"CIS_REGION_{region.replace(' ', '_')}", {region: regionales[region]})
+    send_batch([(f"CIS_REGION_{region.replace(' ', '_')}", {region: regionales[region]}) for region in regionales])
     
     print(f"✅ Enviados {len(regionales)} desgloses regionales")
-    send_data("CIS_REGIONAL", regionales)
+    # Agregado como matriz región × partido (ids de common/dimensiones.py), si el servidor no lo materializa
+    send_aggregate("CIS_REGIONAL_MATRIX", matriz_regional(regionales))
     
     print("--- Scraper CIS Finalizado ---")
 
 if __name__ == "__main__":
-    main()
+    with session():
+        main()
@@ -1,30 +1,504 @@
+"""
+Cliente de envío de los scrapers.
+
+Por defecto el envío es asíncrono: send_data/send_batch/send_aggregate
+encolan los registros y vuelven al momento, y un hilo en segundo plano los
+junta en lotes (hasta LOTE_MAX registros o LOTE_ESPERA segundos), los envía
+por la conexión persistente y reintenta con espera exponencial si el
+servidor no responde. Lo que no se puede enviar (reintentos agotados) va a
+un spool en disco (SPOOL_DIR, un .jsonl por proceso) que se reenvía en
+bloque en cuanto el servidor vuelve a aceptar lotes, también desde otro
+proceso (ver "Spool en disco" más abajo). flush() o salir de `with session():`
+esperan (como mucho TIMEOUT_FLUSH segundos) a que todo esté confirmado o en
+el spool; al terminar el proceso se hace solo, y lo que no haya dado tiempo
+a enviar se guarda en el spool.
+
+Cada registro se serializa a JSON al llamar a send_*: uno que no se puede
+serializar lanza TypeError/ValueError a quien lo envía y no llega a la cola.
+
+El servidor trata la última escritura de cada fuente como su versión
+actual, así que nada nuevo se envía mientras quede spool por reenviar:
+hasta que el reenvío termina, los lotes nuevos van al spool detrás de los
+antiguos, y con la cola llena send_* espera en vez de saltarse la cola.
+"""
+
+import atexit
+import glob
+import os
+import queue
 import socket
 import json
 import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.protocol import (TIPO_REGISTRO, TIPO_LOTE, TIPO_ACK, TIPO_HOLA, ErrorProtocolo, empaquetar,
+                             leer_frame, codificar, disponibles)
 
 HOST = '127.0.0.1'
-PORT = 9999
+# run_pipeline.py --port lo pasa a los scrapers en ATD_PORT
+PORT = int(os.environ.get('ATD_PORT', 9999))
 
-def send_data(source_name, data_dict):
+# Formato preferido de los payloads; se negocia con el servidor al conectar.
+# JSON es lo que el servidor guarda sin volver a serializar; 'msgpack' ahorra
+# CPU en el cliente a cambio de recodificar en el servidor.
+CODIFICACION = 'json'
+# 'zlib', 'zstd' (si está instalado) o None
+COMPRESION = 'zlib'
+# Los payloads más pequeños no se comprimen (no compensa)
+MIN_COMPRIMIR = 4096
+
+# Envío en segundo plano (False = cada envío espera su ACK, como antes)
+ASINCRONO = True
+COLA_MAX = 10000        # registros en memoria; con la cola llena, send_* espera a que haya sitio
+LOTE_MAX = 500          # registros por frame
+LOTE_ESPERA = 0.05      # segundos que se espera a juntar más registros
+REINTENTOS = 5          # intentos por lote antes de mandarlo al spool
+ESPERA_INICIAL = 0.1    # segundos; se dobla en cada reintento
+ESPERA_MAX = 5.0
+TIMEOUT = 10.0          # segundos para conectar y para cada respuesta; agotado, se reintenta como un fallo de conexión
+TIMEOUT_FLUSH = 120.0   # segundos que espera flush() por defecto (y al salir) a que se vacíe la cola
+SPOOL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../data/spool')
+
+# Conexión persistente: se abre con el primer envío y se reutiliza
+_conexion = None
+# Formato acordado en la conexión actual y agregados que materializa el servidor
+_formato = {'codificacion': 'json', 'compresion': None, 'rollups': []}
+
+def _conectar():
+    global _conexion
+    if _conexion is None:
+        _conexion = socket.create_connection((HOST, PORT), timeout=TIMEOUT)
+        _negociar(_conexion)
+    return _conexion
+
+def _negociar(s):
     """
-    Sends a dictionary as JSON to the socket server.
+    Propone CODIFICACION/COMPRESION con un frame HOLA. La respuesta dice
+    también qué agregados construye el propio servidor (rollups). Un servidor
+    antiguo responde ERR y se sigue en JSON sin comprimir.
     """
-    payload = {
-        'source': source_name,
-        'data': data_dict
+    global _formato
+    propias = disponibles()
+    propuesta = {
+        'codificaciones': [c for c in (CODIFICACION, 'json') if c in propias['codificaciones']],
+        'compresiones': [COMPRESION] if COMPRESION in propias['compresiones'] else [],
     }
-    
+    s.sendall(empaquetar(TIPO_HOLA, json.dumps(propuesta).encode('utf-8')))
+    respuesta = leer_frame(s)
+    if respuesta is None:
+        raise ConnectionError("El servidor cerró la conexión")
+    tipo, _, payload = respuesta
+    _formato = {'codificacion': 'json', 'compresion': None, 'rollups': []}
+    if tipo == TIPO_HOLA:
+        _formato.update(json.loads(payload))
+
+def close():
+    """Cierra la conexión persistente con el servidor (si está abierta)."""
+    global _conexion
+    if _conexion is not None:
+        try:
+            _conexion.close()
+        finally:
+            _conexion = None
+
+def _enviar_frame(tipo, obj):
+    """
+    Codifica `obj` en el formato acordado, lo envía por la conexión
+    persistente y espera la respuesta.
+    Si la conexión se había caído, reconecta una vez y reintenta.
+    """
+    for intento in range(2):
+        try:
+            s = _conectar()
+            flags, payload = codificar(obj, _formato['codificacion'], _formato['compresion'], MIN_COMPRIMIR)
+            s.sendall(empaquetar(tipo, payload, flags))
+            respuesta = leer_frame(s)
+            if respuesta is None:
+                raise ConnectionError("El servidor cerró la conexión")
+            return respuesta
+        except OSError:
+            close()
+            if intento == 1:
+                raise
+
+def _enviar_registros(registros):
+    """
+    Envía registros {'source', 'data'} en un frame y espera la respuesta.
+    Si el servidor rechaza un lote (se valida entero), se reenvían uno a uno
+    para no perder los buenos. Devuelve cuántos se aceptaron; los errores de
+    conexión se propagan.
+    """
+    if len(registros) == 1:
+        tipo, _, respuesta = _enviar_frame(TIPO_REGISTRO, registros[0])
+    else:
+        tipo, _, respuesta = _enviar_frame(TIPO_LOTE, registros)
+    if tipo == TIPO_ACK:
+        print(f"Server response: ACK ({len(registros)} records)")
+        _estadisticas['sent'] += len(registros)
+        return len(registros)
+    print(f"Server response: ERR {bytes(respuesta).decode('utf-8', 'replace')}")
+    if len(registros) == 1:
+        _estadisticas['rejected'] += 1
+        return 0
+    return sum(_enviar_registros([r]) for r in registros)
+
+def _sin_materializados(items):
+    """Registros del lote, sin los agregados que el servidor construye él mismo (rollups)."""
+    registros = []
+    for registro, agregado in items:
+        if agregado and registro['source'] in _formato.get('rollups', []):
+            print(f"Server response: {registro['source']} materialized by the server, not sent")
+        else:
+            registros.append(registro)
+    return registros
+
+def _enviar_lote(items):
+    """
+    Envía una lista de (registro, es_agregado) reintentando con espera
+    exponencial; si no hay manera, la deja en el spool. Devuelve cuántos
+    aceptó el servidor (los agregados que materializa él cuentan como
+    aceptados), o None si el lote ha ido al spool.
+    """
+    for intento in range(REINTENTOS):
+        try:
+            _conectar()
+            registros = _sin_materializados(items)
+            aceptados = _enviar_registros(registros) if registros else 0
+            return len(items) - len(registros) + aceptados
+        except (OSError, ErrorProtocolo) as e:
+            close()
+            if intento < REINTENTOS - 1:
+                _estadisticas['retries'] += 1
+                time.sleep(min(ESPERA_MAX, ESPERA_INICIAL * 2 ** intento))
+            else:
+                print(f"Failed to send data to server: {e}")
+    _al_spool(items)
+    return None
+
+# --- Spool en disco ---
+#
+# Cada proceso añade a su <pid>.jsonl. Para reenviar, un proceso reclama los
+# ficheros renombrándolos a <su pid>-<ns>-<origen>.reenvio (ns = cuándo se
+# reclamaron, para reenviarlos del más antiguo al más nuevo). Añadir,
+# reclamar y reescribir se hace con un flock sobre SPOOL_DIR/.lock, así que
+# ninguna línea se añade a un fichero ya reclamado. Un .reenvio de un proceso
+# que ya no existe (murió a medias) lo reclama el siguiente que reenvía.
+
+_lock_spool = threading.Lock()
+
+@contextmanager
+def _bloqueo_spool():
+    """Exclusión entre hilos y entre procesos (flock) sobre los ficheros del spool."""
+    with _lock_spool:
+        os.makedirs(SPOOL_DIR, exist_ok=True)
+        with open(os.path.join(SPOOL_DIR, '.lock'), 'a') as cerrojo:
+            if fcntl is not None:
+                fcntl.flock(cerrojo, fcntl.LOCK_EX)  # Se suelta al cerrar
+            yield
+
+def _ruta_spool():
+    return os.path.join(SPOOL_DIR, f'{os.getpid()}.jsonl')
+
+def _al_spool(items, nuevos=True):
+    """Guarda (registro, es_agregado) en el spool de este proceso; lo que no es JSON se rechaza."""
+    lineas = []
+    for registro, agregado in items:
+        try:
+            lineas.append(json.dumps(dict(registro, _agregado=agregado)) + '\n')
+        except (TypeError, ValueError) as e:
+            print(f"Record {registro.get('source')} rejected: {e}")
+            _estadisticas['rejected'] += 1
+    with _bloqueo_spool():
+        with open(_ruta_spool(), 'a', encoding='utf-8') as f:
+            f.writelines(lineas)
+    if nuevos:
+        _estadisticas['spooled'] += len(lineas)
+    print(f"Spooled {len(lineas)} records to {_ruta_spool()}")
+
+def _hay_spool():
+    return bool(glob.glob(os.path.join(SPOOL_DIR, '*.jsonl')) or glob.glob(os.path.join(SPOOL_DIR, '*.reenvio')))
+
+def _vivo(pid):
     try:
-        json_str = json.dumps(payload)
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.connect((HOST, PORT))
-            s.sendall(json_str.encode('utf-8'))
-            response = s.recv(1024)
-            print(f"Server response: {response.decode()}")
-            if response == b"ACK":
-                return True
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _reclamar_spools():
+    """
+    Reclama los spools pendientes y los reenvíos a medias de procesos que ya
+    no existen. Devuelve los .reenvio de este proceso, del más antiguo al más nuevo.
+    """
+    yo = os.getpid()
+    propios = []
+    with _bloqueo_spool():
+        for ruta in glob.glob(os.path.join(SPOOL_DIR, '*.reenvio')):
+            try:
+                pid, ns, origen = os.path.basename(ruta)[:-len('.reenvio')].split('-', 2)
+                pid, ns = int(pid), int(ns)
+            except ValueError:
+                continue
+            if pid != yo:
+                if _vivo(pid):
+                    continue  # Lo está reenviando otro proceso
+                nueva = os.path.join(SPOOL_DIR, f'{yo}-{ns}-{origen}.reenvio')
+                os.replace(ruta, nueva)
+                ruta = nueva
+            propios.append((ns, ruta))
+        ahora = time.time_ns()
+        for ruta in glob.glob(os.path.join(SPOOL_DIR, '*.jsonl')):
+            origen = os.path.basename(ruta)[:-len('.jsonl')]
+            reclamado = os.path.join(SPOOL_DIR, f'{yo}-{ahora}-{origen}.reenvio')
+            os.replace(ruta, reclamado)
+            propios.append((ahora, reclamado))
+    return [ruta for _, ruta in sorted(propios)]
+
+def _reenviar_fichero(ruta):
+    """
+    Reenvía un .reenvio en lotes de LOTE_MAX. Si el servidor vuelve a
+    fallar, el fichero se reescribe con lo que queda y devuelve False.
+    """
+    with open(ruta, 'r', encoding='utf-8') as f:
+        items = []
+        for linea in f:
+            try:
+                registro = json.loads(linea)
+            except ValueError:
+                continue  # Línea a medio escribir
+            items.append((registro, registro.pop('_agregado', False)))
+    for i in range(0, len(items), LOTE_MAX):
+        try:
+            _conectar()
+            registros = _sin_materializados(items[i:i + LOTE_MAX])
+            if registros:
+                _enviar_registros(registros)
+            _estadisticas['replayed'] += len(items[i:i + LOTE_MAX])
+        except (OSError, ErrorProtocolo):
+            close()
+            with open(ruta + '.tmp', 'w', encoding='utf-8') as f:
+                for registro, agregado in items[i:]:
+                    f.write(json.dumps(dict(registro, _agregado=agregado)) + '\n')
+            os.replace(ruta + '.tmp', ruta)
+            return False
+    os.remove(ruta)
+    return True
+
+def _reenviar_spool():
+    """
+    Reenvía los spools pendientes (de este o de otros procesos), del más
+    antiguo al más nuevo. Devuelve True si no queda nada por reenviar.
+    """
+    try:
+        _conectar()
+    except (OSError, ErrorProtocolo):
+        close()
+        return False  # El servidor sigue sin responder: el spool se queda como está
+    for ruta in _reclamar_spools():
+        if not _reenviar_fichero(ruta):
+            return False
+    return True
+
+# --- Envío en segundo plano ---
+
+_FIN = object()
+_REENVIO = object()
+_cola = queue.Queue(maxsize=COLA_MAX)
+_hilo = None
+_pendientes = 0
+_cambio = threading.Condition()
+_estadisticas = {'sent': 0, 'rejected': 0, 'retries': 0, 'spooled': 0, 'replayed': 0}
+
+def _terminado(n=1):
+    global _pendientes
+    with _cambio:
+        _pendientes -= n
+        _cambio.notify_all()
+
+def _recoger_lote(primero):
+    """
+    Junta lo que ya está en cola y espera hasta LOTE_ESPERA por más (como el
+    escritor del servidor). Devuelve (lote, aviso): el aviso (_FIN/_REENVIO)
+    que haya cortado el lote, o None. No se vuelve a encolar: con la cola
+    llena, el hilo se quedaría esperando a sí mismo.
+    """
+    lote = [primero]
+    limite = time.monotonic() + LOTE_ESPERA
+    while len(lote) < LOTE_MAX:
+        try:
+            item = _cola.get(timeout=max(0, limite - time.monotonic()))
+        except queue.Empty:
+            break
+        if item is _FIN or item is _REENVIO:
+            return lote, item
+        lote.append(item)
+    return lote, None
+
+def _bucle():
+    # Lo que quedó en el spool de ejecuciones anteriores se reenvía antes que nada nuevo
+    hay_spool = _hay_spool()
+    proximo_reenvio = 0.0  # Con el servidor caído, los reenvíos se espacian (espera exponencial)
+    espera = ESPERA_INICIAL
+    aviso = None
+    while True:
+        if aviso is not None:
+            item, aviso = aviso, None  # El aviso que cortó el lote anterior
+        else:
+            item = _cola.get()
+        if item is _FIN:
+            _terminado()
+            return
+        if item is _REENVIO:
+            hay_spool = _hay_spool()
+            proximo_reenvio = 0.0  # flush() siempre lo intenta
+        if hay_spool and time.monotonic() >= proximo_reenvio:
+            try:
+                hay_spool = not _reenviar_spool()
+            except Exception as e:
+                print(f"Failed to replay the spool: {e}")
+            if hay_spool:
+                proximo_reenvio = time.monotonic() + espera
+                espera = min(espera * 2, ESPERA_MAX)
             else:
-                return False
-    except Exception as e:
-        print(f"Failed to send data to server: {e}")
+                espera = ESPERA_INICIAL
+        if item is _REENVIO:
+            _terminado()
+            continue
+        lote, aviso = _recoger_lote(item)
+        try:
+            if hay_spool:
+                # Queda spool sin reenviar: el lote va detrás, para que el servidor reciba las versiones en orden
+                _al_spool(lote)
+            else:
+                hay_spool = _enviar_lote(lote) is None
+        except Exception as e:
+            # Un error inesperado no puede parar el hilo (flush() esperaría para siempre)
+            print(f"Failed to send batch: {e}")
+            hay_spool = _enviar_uno_a_uno(lote, hay_spool)
+        finally:
+            _terminado(len(lote))
+
+def _enviar_uno_a_uno(lote, hay_spool):
+    """Tras un error inesperado con el lote, cada registro por separado; el que vuelve a fallar se rechaza."""
+    for item in lote:
+        try:
+            if hay_spool:
+                _al_spool([item])
+            else:
+                hay_spool = _enviar_lote([item]) is None
+        except Exception as e:
+            print(f"Record {item[0].get('source')} rejected: {e}")
+            _estadisticas['rejected'] += 1
+    return hay_spool
+
+def _serializable(item):
+    """
+    Copia de (registro, es_agregado) pasada por JSON: quien llama puede seguir
+    modificando sus diccionarios después de send_*, y un registro que no se
+    puede serializar falla aquí (TypeError/ValueError) y no en el hilo de envío.
+    """
+    registro, agregado = item
+    return json.loads(json.dumps(registro)), agregado
+
+def _encolar(item):
+    """Encola un registro (o un aviso para el hilo); con la cola llena, espera a que haya sitio."""
+    global _hilo, _pendientes
+    with _cambio:
+        if _hilo is None or not _hilo.is_alive():
+            _hilo = threading.Thread(target=_bucle, name='client-sender', daemon=True)
+            _hilo.start()
+        _pendientes += 1
+    # Sin saltarse la cola (p. ej. directo al spool): los registros llegan al servidor en orden
+    _cola.put(item)
+
+def _enviar(items):
+    # Todos validados antes de encolar o enviar ninguno
+    items = [_serializable(item) for item in items]
+    if ASINCRONO:
+        for item in items:
+            _encolar(item)
+        return True
+    # Síncrono: True solo si el servidor ha aceptado todos (ACK), como antes del envío en segundo plano
+    if _hay_spool() and not _reenviar_spool():
+        _al_spool(items)  # Detrás de lo que aún no se ha podido reenviar
         return False
+    return _enviar_lote(items) == len(items)
+
+def flush(timeout=TIMEOUT_FLUSH):
+    """
+    Espera a que todo lo encolado esté confirmado por el servidor o guardado
+    en el spool (y a que se haya intentado reenviar el spool).
+    Devuelve False si se agota `timeout` (None = sin límite) con la cola sin vaciar.
+    """
+    if _hilo is None:
+        return True
+    _encolar(_REENVIO)
+    with _cambio:
+        vacia = _cambio.wait_for(lambda: _pendientes == 0, timeout)
+    if not vacia:
+        print(f"Warning: {_pendientes} records still queued after {timeout}s")
+    return vacia
+
+@contextmanager
+def session():
+    """`with session():` garantiza un flush() al salir."""
+    try:
+        yield
+    finally:
+        flush()
+
+def stats():
+    """Contadores del envío: sent, rejected, retries, spooled, replayed."""
+    return dict(_estadisticas)
+
+def _vaciar_cola_al_spool():
+    """Lo que sigue en la cola (flush() agotado al salir) se guarda en el spool para la próxima ejecución."""
+    items = []
+    while True:
+        try:
+            item = _cola.get_nowait()
+        except queue.Empty:
+            break
+        if isinstance(item, tuple):
+            items.append(item)
+    if items:
+        _al_spool(items)
+
+def _al_salir():
+    if not flush():
+        _vaciar_cola_al_spool()
+    close()
+
+atexit.register(_al_salir)
+
+def send_data(source_name, data_dict):
+    """
+    Queues a dictionary to be sent as JSON to the socket server (sent right
+    away, waiting for the ACK, when ASINCRONO is False).
+    """
+    return _enviar([({'source': source_name, 'data': data_dict}, False)])
+
+def send_batch(records):
+    """
+    Queues several records; the background sender coalesces them into frames
+    with one ACK each. `records` is a list of (source_name, data_dict) tuples.
+    """
+    return _enviar([({'source': source_name, 'data': data_dict}, False) for source_name, data_dict in records])
+
+def send_aggregate(source_name, data_dict):
+    """
+    Queues an aggregate of rows already sent one by one. It is dropped at
+    send time if the server builds it itself from those rows (rollup
+    announced in the HOLA reply).
+    """
+    return _enviar([({'source': source_name, 'data': data_dict}, True)])
@@ -5,10 +5,10 @@ import sys
 from datetime import datetime, timedelta
 
 try:
-    from client_sender import send_data
+    from client_sender import send_data, send_batch, send_aggregate, session
 except ImportError:
     sys.path.append('.')
-    from client_sender import send_data
+    from client_sender import send_data, send_batch, send_aggregate, session
 
 ELECTOMANIA_URL = "https://electomania.es"
 
@@ -138,11 +138,10 @@ def main():
     historical = get_electopanel_historical()
     
     # CRÍTICO: Enviar CADA encuesta como registro individual para volumen máximo de datos
-    for i, poll in enumerate(historical):
-        send_data(f"ELECTOMANIA_POLL_{i+1}", poll)
+    send_batch([(f"ELECTOMANIA_POLL_{i+1}", poll) for i, poll in enumerate(historical)])
     
-    # También enviamos todo el histórico junto para análisis de tendencias
-    send_data("ELECTOMANIA_HISTORICAL", historical)
+    # El histórico junto para análisis de tendencias (si el servidor no lo materializa)
+    send_aggregate("ELECTOMANIA_HISTORICAL", historical)
     
     # Enviar la última como actual
     if historical:
@@ -150,7 +149,8 @@ def main():
         latest['source'] = 'Electomania Latest'
         send_data("ELECTOMANIA", latest)
     
-    print(f"✅ Enviadas {len(historical)} encuestas individuales + 2 registros agregados")
+    print(f"✅ Enviadas {len(historical)} encuestas individuales + la última como actual")
 
 if __name__ == "__main__":
-    main()
+    with session():
+        main()
@@ -1,9 +1,13 @@
+import os
 import sys
+# common/ está en la raíz del proyecto (como en analysis/)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 try:
-    from client_sender import send_data
+    from client_sender import send_data, send_batch, send_aggregate, session
 except ImportError:
     sys.path.append('.')
-    from client_sender import send_data
+    from client_sender import send_data, send_batch, send_aggregate, session
+from common.dimensiones import PROVINCIAS, DIMS_PROVINCIAS, matriz_desde_celdas, celdas_provinciales
 
 def get_all_official_results():
     """
@@ -40,13 +44,7 @@ def get_provincial_breakdown_multi_year():
     Genera un dataset MASIVO: Resultados por provincia para 3 elecciones.
     (52 provincias * 3 elecciones = 156 registros granulares).
     """
-    provinces = [
-        'Alava', 'Albacete', 'Alicante', 'Almeria', 'Asturias', 'Avila', 'Badajoz', 'Barcelona', 'Burgos', 'Caceres',
-        'Cadiz', 'Cantabria', 'Castellon', 'Ciudad Real', 'Cordoba', 'Coruña', 'Cuenca', 'Girona', 'Granada', 'Guadalajara',
-        'Guipuzcoa', 'Huelva', 'Huesca', 'Jaen', 'Leon', 'Lleida', 'Lugo', 'Madrid', 'Malaga', 'Murcia', 'Navarra',
-        'Ourense', 'Palencia', 'Las Palmas', 'Pontevedra', 'La Rioja', 'Salamanca', 'Segovia', 'Sevilla', 'Soria',
-        'Tarragona', 'Teruel', 'Toledo', 'Valencia', 'Valladolid', 'Vizcaya', 'Zamora', 'Zaragoza', 'Ceuta', 'Melilla'
-    ]
+    provinces = PROVINCIAS
     
     elections = ['23J-2023', '10N-2019', '28A-2019']
     
@@ -87,19 +85,26 @@ def get_provincial_breakdown_multi_year():
         
     return data
 
+def matriz_provincial(provincial):
+    """Resultados provinciales como registro matriz elección × provincia × partido."""
+    return matriz_desde_celdas(DIMS_PROVINCIAS, celdas_provinciales(provincial))
+
 def main():
     # Datos multi-anuales
     multi_year = get_all_official_results()
     send_data("OFFICIAL_MULTI", multi_year)
     
-    # MASIVO: Enviar CADA resultado provincial individualmente (150 registros)
+    # MASIVO: CADA resultado provincial es un registro individual (150 registros),
+    # pero viajan juntos en un único lote con un solo ACK
     provincial = get_provincial_breakdown_multi_year()
-    for i, record in enumerate(provincial):
-       send_data(f"PROVINCE_{record['election_id']}_{record['province'].replace(' ', '_')}", record)
+    send_batch([(f"PROVINCE_{record['election_id']}_{record['province'].replace(' ', '_')}", record)
+                for record in provincial])
     
     print(f"Generados Puntos de Datos Provinciales: {len(provincial)} registros provinciales")
-    # También enviamos el agregado  
-    send_data("OFFICIAL_PROVINCES_MULTI", provincial)
+    # Agregado como matriz elección × provincia × partido (ids de common/dimensiones.py),
+    # solo si el servidor no lo construye él mismo con los registros provinciales
+    send_aggregate("OFFICIAL_PROVINCES_MATRIX", matriz_provincial(provincial))
 
 if __name__ == "__main__":
-    main()
+    with session():
+        main()
@@ -1,11 +1,15 @@
+import os
 import sys
 import random
 
+# common/ está en la raíz del proyecto (como en analysis/)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 try:
-    from client_sender import send_data
+    from client_sender import send_data, send_batch, send_aggregate, session
 except ImportError:
     sys.path.append('.')
-    from client_sender import send_data
+    from client_sender import send_data, send_batch, send_aggregate, session
+from common.dimensiones import PROVINCIAS, DIMS_ECONOMIA, matriz_desde_celdas, celdas_economicas
 
 INE_URL = "https://www.ine.es/"
 
@@ -13,13 +17,7 @@ def get_economic_context():
     """
     Genera Indicadores Económicos para las 52 provincias para permitir Correlación Socioeconómica.
     """
-    provinces = [
-        'Alava', 'Albacete', 'Alicante', 'Almeria', 'Asturias', 'Avila', 'Badajoz', 'Barcelona', 'Burgos', 'Caceres',
-        'Cadiz', 'Cantabria', 'Castellon', 'Ciudad Real', 'Cordoba', 'Coruña', 'Cuenca', 'Girona', 'Granada', 'Guadalajara',
-        'Guipuzcoa', 'Huelva', 'Huesca', 'Jaen', 'Leon', 'Lleida', 'Lugo', 'Madrid', 'Malaga', 'Murcia', 'Navarra',
-        'Ourense', 'Palencia', 'Las Palmas', 'Pontevedra', 'La Rioja', 'Salamanca', 'Segovia', 'Sevilla', 'Soria',
-        'Tarragona', 'Teruel', 'Toledo', 'Valencia', 'Valladolid', 'Vizcaya', 'Zamora', 'Zaragoza', 'Ceuta', 'Melilla'
-    ]
+    provinces = PROVINCIAS
     
     data = []
     
@@ -47,17 +45,21 @@ def get_economic_context():
         
     return data
 
+def matriz_economica(economic_data):
+    """Indicadores como registro matriz provincia × indicador."""
+    return matriz_desde_celdas(DIMS_ECONOMIA, celdas_economicas(economic_data))
+
 def main():
     print("Generando Contexto Socio-Económico...")
     economic_data = get_economic_context()
     
-    # MASIVO: Enviar CADA provincia individualmente (50 registros)
-    for record in economic_data:
-        send_data(f"ECONOMIC_{record['province'].replace(' ', '_')}", record)
+    # MASIVO: CADA provincia es un registro individual (50 registros), enviados en un lote
+    send_batch([(f"ECONOMIC_{record['province'].replace(' ', '_')}", record) for record in economic_data])
     
     print(f"Datos Económicos Generados: {len(economic_data)} registros provinciales")
-    # También enviamos el agregado
-    send_data("ECONOMIC_CONTEXT", economic_data)
+    # Agregado como matriz provincia × indicador (ids de common/dimensiones.py), si el servidor no lo materializa
+    send_aggregate("ECONOMIC_MATRIX", matriz_economica(economic_data))
 
 if __name__ == "__main__":
-    main()
+    with session():
+        main()
@@ -2,10 +2,10 @@ import sys
 import time
 
 try:
-    from client_sender import send_data
+    from client_sender import send_data, send_batch, send_aggregate, session
 except ImportError:
     sys.path.append('.')
-    from client_sender import send_data
+    from client_sender import send_data, send_batch, send_aggregate, session
 
 # Comprobación de dependencias
 try:
@@ -96,13 +96,13 @@ def main():
     # Series Temporal
     series = get_time_series_data()
     
-    # MASIVO: Enviar CADA punto temporal individualmente (90 registros)
-    for point in series:
-        send_data(f"TRENDS_DAY_{point['date']}", point)
+    # MASIVO: CADA punto temporal es un registro individual (90 registros), enviados en un lote
+    send_batch([(f"TRENDS_DAY_{point['date']}", point) for point in series])
     
     print(f"Generados Puntos de Serie Temporal: {len(series)} días")
-    # También enviar agregado
-    send_data("GOOGLE_TRENDS_SERIES", series)
+    # Agregado (si el servidor no lo materializa)
+    send_aggregate("GOOGLE_TRENDS_SERIES", series)
 
 if __name__ == "__main__":
-    main()
+    with session():
+        main()
@@ -0,0 +1,196 @@
+"""
+Métricas y salud del servidor de ingesta.
+
+El servidor registra aquí cada mensaje atendido (registros y bytes por prefijo
+de fuente, latencia de atención hasta el ACK), las conexiones activas, los
+errores y los registros descartados por duplicados. Un pequeño servidor HTTP en un segundo puerto local las expone:
+
+    GET /metrics  -> JSON con contadores, ritmos (por segundo) y percentiles
+    GET /health   -> 200 {"ready": true} cuando acepta conexiones, 503 si no
+
+Los ritmos se calculan sobre los últimos VENTANA segundos.
+"""
+
+import bisect
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Segundos sobre los que se calculan registros/s y bytes/s
+VENTANA = 10
+
+# Prefijos de fuente con varios tramos; el resto se agrupa por su primer tramo (CIS_, ECONOMIC_, ...)
+PREFIJOS = ('TRENDS_DAY_', 'PROVINCE_', 'CIS_BAROMETER_', 'CIS_REGION_', 'CIS_DEMO_',
+            'ELECTOMANIA_POLL_', 'ECONOMIC_')
+
+# Límites superiores (segundos) de los cubos del histograma de latencia: 0.1 ms, 0.2 ms, ... ~105 s
+LIMITES_LATENCIA = [0.0001 * 2 ** i for i in range(21)]
+
+
+def prefijo_fuente(source):
+    """'TRENDS_DAY_2025-11-03' -> 'TRENDS_DAY_', 'CIS_CURRENT' -> 'CIS_'"""
+    for prefijo in PREFIJOS:
+        if source.startswith(prefijo):
+            return prefijo
+    tramo, sep, _ = source.partition('_')
+    return tramo + sep
+
+
+class Metricas:
+    """Contadores del servidor, seguros para usar desde varios hilos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.inicio = time.time()
+        self.listo = False
+        self.conexiones_activas = 0
+        self.conexiones_total = 0
+        self.errores = {'err': 0, 'parseo': 0}
+        self.por_prefijo = {}   # prefijo -> [registros, bytes]
+        self.histograma = [0] * (len(LIMITES_LATENCIA) + 1)
+        self.mensajes = 0
+        self.duplicados = 0
+        self._ventana = deque()  # [segundo, {prefijo: [registros, bytes]}]
+        # Función que devuelve los lotes pendientes del escritor (la fija el servidor)
+        self.cola = None
+        # Función con las estadísticas de la caché de consultas (la fija el servidor)
+        self.cache = None
+        # Función con las estadísticas de las suscripciones (la fija el servidor)
+        self.suscripciones = None
+
+    @contextmanager
+    def conexion(self):
+        with self._lock:
+            self.conexiones_activas += 1
+            self.conexiones_total += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.conexiones_activas -= 1
+
+    def registrar(self, lineas, latencia):
+        """Anota un mensaje guardado: sus líneas (source, bytes) y el tiempo hasta el ACK."""
+        segundo = int(time.monotonic())
+        with self._lock:
+            if not self._ventana or self._ventana[-1][0] != segundo:
+                self._ventana.append([segundo, {}])
+                while self._ventana[0][0] <= segundo - VENTANA:
+                    self._ventana.popleft()
+            actual = self._ventana[-1][1]
+            for source, linea in lineas:
+                prefijo = prefijo_fuente(source)
+                for contadores in (self.por_prefijo, actual):
+                    c = contadores.setdefault(prefijo, [0, 0])
+                    c[0] += 1
+                    c[1] += len(linea)
+            self.histograma[bisect.bisect_left(LIMITES_LATENCIA, latencia)] += 1
+            self.mensajes += 1
+
+    def duplicado(self, n):
+        """Anota `n` registros respondidos con ACK sin escribirlos (iguales a su última versión)."""
+        with self._lock:
+            self.duplicados += n
+
+    def error(self, e):
+        """Anota una respuesta ERR; si el mensaje no se pudo parsear o validar, también como fallo de parseo."""
+        with self._lock:
+            self.errores['err'] += 1
+            if isinstance(e, ValueError):
+                self.errores['parseo'] += 1
+
+    def evento_worker(self, tipo, valor):
+        """Conexión o error anotado en un proceso worker (ver server/workers.py)."""
+        if tipo == 'conexion':
+            with self._lock:
+                self.conexiones_activas += valor
+                self.conexiones_total += max(valor, 0)
+        elif tipo == 'error':
+            self.error(ValueError() if valor else Exception())
+
+    def percentil(self, q):
+        """Límite superior (ms) del cubo del histograma donde cae el percentil q (0-100)."""
+        total = sum(self.histograma)
+        if total == 0:
+            return None
+        objetivo = q / 100 * total
+        acumulado = 0
+        for i, n in enumerate(self.histograma):
+            acumulado += n
+            if acumulado >= objetivo:
+                return LIMITES_LATENCIA[i] * 1000 if i < len(LIMITES_LATENCIA) else float('inf')
+
+    def instantanea(self):
+        """Diccionario con todas las métricas (lo que devuelve /metrics)."""
+        ahora = int(time.monotonic())
+        with self._lock:
+            recientes = {}
+            for segundo, contadores in self._ventana:
+                if segundo > ahora - VENTANA:
+                    for prefijo, (n, b) in contadores.items():
+                        r = recientes.setdefault(prefijo, [0, 0])
+                        r[0] += n
+                        r[1] += b
+            por_prefijo = {
+                prefijo: {
+                    'registros': n, 'bytes': b,
+                    'registros_s': recientes.get(prefijo, [0, 0])[0] / VENTANA,
+                    'bytes_s': recientes.get(prefijo, [0, 0])[1] / VENTANA,
+                }
+                for prefijo, (n, b) in sorted(self.por_prefijo.items())
+            }
+            datos = {
+                'ready': self.listo,
+                'uptime_s': round(time.time() - self.inicio, 3),
+                'conexiones_activas': self.conexiones_activas,
+                'conexiones_total': self.conexiones_total,
+                'mensajes': self.mensajes,
+                'registros': sum(n for n, _ in self.por_prefijo.values()),
+                'bytes': sum(b for _, b in self.por_prefijo.values()),
+                'registros_s': sum(n for n, _ in recientes.values()) / VENTANA,
+                'bytes_s': sum(b for _, b in recientes.values()) / VENTANA,
+                'duplicados': self.duplicados,
+                'errores': dict(self.errores),
+                'por_prefijo': por_prefijo,
+                'latencia_ms': {
+                    'p50': self.percentil(50),
+                    'p90': self.percentil(90),
+                    'p99': self.percentil(99),
+                    'histograma': {f"<={limite * 1000:g}": n
+                                   for limite, n in zip(LIMITES_LATENCIA + [float('inf')], self.histograma) if n},
+                },
+            }
+        datos['cola_escritor'] = self.cola() if self.cola else None
+        datos['cache'] = self.cache() if self.cache else None
+        datos['suscripciones'] = self.suscripciones() if self.suscripciones else None
+        return datos
+
+
+def servir_metricas(metricas, host, port):
+    """Arranca el servidor HTTP de métricas en un hilo daemon y lo devuelve."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                codigo, cuerpo = 200, metricas.instantanea()
+            elif self.path == '/health':
+                codigo, cuerpo = (200 if metricas.listo else 503), {'ready': metricas.listo}
+            else:
+                codigo, cuerpo = 404, {'error': 'usa /metrics o /health'}
+            datos = json.dumps(cuerpo).encode('utf-8')
+            self.send_response(codigo)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(datos)))
+            self.end_headers()
+            self.wfile.write(datos)
+
+        def log_message(self, *args):
+            pass  # Las consultas de métricas no van al log del servidor
+
+    servidor = ThreadingHTTPServer((host, port), Handler)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, name='metricas', daemon=True).start()
+    return servidor
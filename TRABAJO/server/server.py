@@ -1,7 +1,15 @@
+import argparse
+import asyncio
+import itertools
+import multiprocessing
+import select
 import socket
 import json
 import os
+import signal
+import sys
 import threading
+import time
 from datetime import datetime
 
 HOST = '127.0.0.1'
@@ -10,49 +18,818 @@ PORT = 9999
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_FILE = os.path.join(BASE_DIR, '../data/raw_data.jsonl')
 
+sys.path.append(os.path.join(BASE_DIR, '..'))
+from concurrent.futures import Future
+
+from common.protocol import (MAGIC, TIPO_REGISTRO, TIPO_LOTE, TIPO_HOLA, TIPO_CONSULTA, TIPO_SUSCRIBIR,
+                             ErrorProtocolo, leer_frame, leer_frame_async, recibir_json, recibir_json_async,
+                             frame_ack, frame_err, frame_hola, frame_resultado, frame_evento, negociar,
+                             descomprimir, es_json, decodificar, registros_json)
+from common.storage import (EscritorLog, LectorAlmacen, POLITICAS_FSYNC, FSYNC_LOTE, MAX_SEGMENTO,
+                            compactar_periodicamente, recibido_linea)
+from common.rollups import Rollups, ROLLUPS, rollup_de
+from common.dedup import Deduplicador, huella
+from common.ultimos import CacheUltimos, MAX_BYTES
+from common.suscripciones import Suscripciones, ConsumidorLento
+from metrics import Metricas, servir_metricas
+from workers import EscritorRemoto, MetricasRemotas
+
+# Tamaño máximo de un mensaje o frame (configurable con --max-mensaje-mb)
+MAX_MENSAJE = 64 * 1024 * 1024
+# Segundos sin recibir nada antes de dar por muerto un mensaje sin framing
+TIMEOUT_LECTURA = 10
+# Segundos sin recibir nada antes de cerrar una conexión (persistente o recién abierta); los
+# clientes (client_sender) reconectan solos al siguiente envío
+TIMEOUT_INACTIVO = 300
+# Conexiones atendidas a la vez en modo asyncio (el resto espera en cola)
+MAX_CONEXIONES = 256
+# Procesos que aceptan y parsean en el mismo puerto (SO_REUSEPORT); 0 = un solo proceso
+WORKERS = 0
+
+# Group commit del escritor único (ver common/storage.py)
+LOTE_MAX = 1024          # registros por lote como máximo
+LOTE_ESPERA = 0.002      # segundos que se espera a que se llene un lote
+FSYNC = FSYNC_LOTE
+
+# Segmentos del log y compactación en segundo plano
+SEGMENTO_MAX = MAX_SEGMENTO
+COMPACTAR_CADA = 300     # segundos entre compactaciones (0 = desactivada)
+VERSIONES = 1            # versiones que se conservan de cada fuente al compactar
+
+# Agregados materializados a partir de las filas (ver common/rollups.py)
+ROLLUPS_ACTIVOS = True
+# Responder ACK sin escribir los registros iguales a la última versión de su fuente (ver common/dedup.py)
+DEDUP_ACTIVO = True
+# Memoria para el último registro de cada fuente que sirven los frames CONSULTA (0 = sin consultas)
+CACHE_BYTES = MAX_BYTES
+
+# Segundos entre comprobaciones de que un suscriptor sin eventos sigue conectado
+ESPERA_SUSCRIPCION = 1.0
+
+# Segundos que se espera a que terminen las conexiones abiertas al apagar
+TIMEOUT_CIERRE = 30
+
+# Métricas y salud por HTTP en un segundo puerto local (0 = desactivado)
+METRICAS_PORT = 9998
+# Log de depuración: se imprime 1 de cada DEBUG_MUESTREO mensajes (0 = nada)
+DEBUG_MUESTREO = 0
+
+# Escritor único del log, rollups, deduplicador y caché de consultas (se crean al arrancar el servidor)
+escritor = None
+rollups = None
+deduplicador = None
+cache = None
+# Conexiones suscritas a los registros nuevos (ver common/suscripciones.py)
+suscripciones = Suscripciones()
+metricas = Metricas()
+# next() de itertools.count es atómico: los hilos que atienden conexiones no pierden cuentas
+_contador_debug = itertools.count(1)
+
+def debug(mensaje):
+    """Log de depuración muestreado: stdout deja de ser un cuello de botella bajo carga."""
+    if DEBUG_MUESTREO <= 0:
+        return
+    if next(_contador_debug) % DEBUG_MUESTREO == 0:
+        print(mensaje)
+
+def preparar_linea(json_data, crudo=None):
+    """
+    Añade el timestamp de recepción y devuelve (source, línea JSON en bytes)
+    para el escritor, que indexa cada registro por su fuente.
+    Si el registro llegó en JSON (`crudo`, su texto tal cual), se guarda sin
+    volver a serializarlo: la marca se inserta antes de la llave de cierre.
+    """
+    if not isinstance(json_data, dict) or not isinstance(json_data.get('source'), str):
+        raise ValueError("El registro debe ser un objeto JSON con 'source'")
+    marca = datetime.now().isoformat()
+    if crudo is not None and crudo.endswith('}') and '\n' not in crudo and '"_received_at"' not in crudo:
+        return json_data['source'], f'{crudo[:-1]}, "_received_at": "{marca}"}}\n'.encode('utf-8')
+    json_data['_received_at'] = marca
+    return json_data['source'], (json.dumps(json_data) + '\n').encode('utf-8')
+
+def preparar(pares):
+    """
+    Líneas de los registros (ver preparar_linea) y, para cada una, lo que el
+    escritor necesita después: (huella para la deduplicación, fila del rollup
+    ya decodificada o None). Se calcula en el hilo (o worker) que atiende la
+    conexión, con el registro ya parseado, y no en el hilo del escritor.
+    """
+    lineas, preparadas = [], []
+    for json_data, crudo in pares:
+        source, linea = preparar_linea(json_data, crudo)
+        fila = None
+        if ROLLUPS_ACTIVOS and rollup_de(source) is not None:
+            fila = {'data': json_data.get('data'), '_received_at': recibido_linea(linea)}
+        lineas.append((source, linea))
+        preparadas.append((huella(json_data) if DEDUP_ACTIVO else None, fila))
+    return lineas, preparadas
+
+def iniciar_escritor():
+    """
+    Arranca el escritor único que hace group commit sobre el log segmentado
+    de DATA_FILE y, si están activados, la compactación periódica, los
+    rollups, el deduplicador y la caché de consultas (reconstruidos desde el
+    log y actualizados con cada lote escrito). Cada lote escrito se publica
+    después a los suscriptores.
+
+    La caché y las huellas se actualizan antes del ACK: quien consulta tras
+    escribir ve su registro, y quien reenvía una versión anterior tras el ACK
+    (A, B, A) se compara con la que acaba de escribir. Los rollups y la
+    publicación se hacen después, con lo ya preparado por quien atendió la
+    conexión.
+    """
+    global escritor, rollups, deduplicador, cache
+    with LectorAlmacen(DATA_FILE) as lector:
+        if ROLLUPS_ACTIVOS:
+            rollups = Rollups(DATA_FILE).cargar(lector)
+        if DEDUP_ACTIVO:
+            deduplicador = Deduplicador(DATA_FILE).abrir(lector)
+        if CACHE_BYTES > 0:
+            cache = CacheUltimos(DATA_FILE, CACHE_BYTES).cargar(lector)
+            metricas.cache = cache.estadisticas
+    if rollups is not None:
+        rollups.guardar()
+        threading.Thread(target=rollups.guardar_periodicamente, name='rollups', daemon=True).start()
+    metricas.suscripciones = suscripciones.estadisticas
+
+    def al_confirmar(lineas, preparadas):
+        if cache is not None:
+            cache.aplicar_lineas(lineas)
+        if deduplicador is not None:
+            deduplicador.aplicar_lineas(lineas, [p[0] if p else None for p in preparadas])
+
+    def al_escribir(lineas, preparadas):
+        if rollups is not None:
+            rollups.aplicar_lineas(lineas, [p[1] if p else None for p in preparadas])
+        publicar(lineas)
+
+    escritor = EscritorLog(DATA_FILE, max_lote=LOTE_MAX, max_espera=LOTE_ESPERA,
+                           fsync=FSYNC, max_segmento=SEGMENTO_MAX,
+                           al_escribir=al_escribir, al_confirmar=al_confirmar).iniciar()
+    metricas.cola = escritor.pendientes
+    if METRICAS_PORT:
+        servir_metricas(metricas, HOST, METRICAS_PORT)
+        print(f"Métricas en http://{HOST}:{METRICAS_PORT}/metrics (salud en /health)")
+    if COMPACTAR_CADA > 0:
+        threading.Thread(target=compactar_periodicamente, args=(DATA_FILE, COMPACTAR_CADA, VERSIONES),
+                         name='compactacion', daemon=True).start()
+    return escritor
+
+def hola(payload):
+    """Respuesta a un HOLA: formato acordado y agregados que el servidor materializa."""
+    return dict(negociar(json.loads(payload)), rollups=list(ROLLUPS) if ROLLUPS_ACTIVOS else [])
+
+def detener_escritor():
+    """Vacía el escritor y guarda el estado final de los rollups y de las huellas."""
+    escritor.cerrar()
+    if rollups is not None:
+        rollups.guardar()
+    if deduplicador is not None:
+        deduplicador.guardar()
+    if cache is not None:
+        cache.cerrar()
+
+def nuevas_lineas(lineas, preparadas):
+    """Quita (y cuenta) las líneas iguales a la última versión guardada de su fuente, y lo preparado para ellas."""
+    if deduplicador is None:
+        return lineas, preparadas
+    nuevas = deduplicador.filtrar(lineas, [p[0] if p else None for p in preparadas])
+    if len(nuevas) < len(lineas):
+        metricas.duplicado(len(lineas) - len(nuevas))
+        debug(f"{len(lineas) - len(nuevas)} registro(s) duplicado(s), no se escriben")
+        return [lineas[i] for i in nuevas], [preparadas[i] for i in nuevas]
+    return lineas, preparadas
+
+def ultima_version(source, linea):
+    """Línea más reciente de la fuente (sin el salto); en los agregados, la vista del rollup si es más nueva."""
+    if rollups is not None and source in ROLLUPS:
+        vista = rollups.vista(source)
+        if vista is not None and (linea is None or vista['_received_at'] >= recibido_linea(linea)):
+            return json.dumps({'source': source, 'data': vista['data'],
+                               '_received_at': vista['_received_at']}).encode('utf-8')
+    return linea.rstrip(b'\n') if linea is not None else None
+
+def publicar(lineas):
+    """
+    Callback del escritor: reparte las líneas escritas a los suscriptores, y
+    la vista nueva de los rollups que tienen alguna fila en el lote.
+    """
+    if not suscripciones:
+        return
+    eventos = [(source, linea.rstrip(b'\n')) for source, linea in lineas if suscripciones.interesa(source)]
+    if rollups is not None:
+        for nombre in {rollup_de(source) for source, _ in lineas} - {None}:
+            if suscripciones.interesa(nombre):
+                vista = ultima_version(nombre, None)
+                if vista is not None:
+                    eventos.append((nombre, vista))
+    if eventos:
+        suscripciones.publicar(eventos)
+
+def consultar(peticion):
+    """Frame RESULTADO de una consulta get/mget/list/historial (ver common/ultimos.py). Solo en el proceso principal."""
+    if cache is None:
+        raise ValueError("Consultas desactivadas en este servidor (--cache-mb 0)")
+    op = peticion.get('op')
+    if op == 'list':
+        texto = json.dumps({'fuentes': cache.fuentes(str(peticion.get('prefijo', '')))}).encode('utf-8')
+    elif op == 'historial':
+        source = peticion.get('source')
+        if not isinstance(source, str):
+            raise ValueError("La fuente de la consulta debe ser una cadena")
+        texto = b'{"registros": [' + b', '.join(linea.rstrip(b'\n') for linea in cache.historial(source)) + b']}'
+    else:
+        if op == 'get':
+            fuentes = [peticion.get('source')]
+        elif op == 'mget':
+            fuentes = peticion.get('sources', [])
+            # Con "prefijos", también todas las fuentes (y agregados) que empiezan por alguno
+            prefijos = peticion.get('prefijos', [])
+            if not isinstance(prefijos, list) or not all(isinstance(p, str) for p in prefijos):
+                raise ValueError("Los prefijos de la consulta deben ser cadenas")
+            if isinstance(fuentes, list):
+                for prefijo in prefijos:
+                    fuentes = fuentes + cache.fuentes(prefijo)
+                    if rollups is not None:
+                        fuentes = fuentes + [n for n in ROLLUPS if n.startswith(prefijo)]
+        else:
+            raise ValueError(f"Operación de consulta desconocida: {op}")
+        if not isinstance(fuentes, list) or not all(isinstance(f, str) for f in fuentes):
+            raise ValueError("Las fuentes de la consulta deben ser cadenas")
+        fuentes = list(dict.fromkeys(fuentes))
+        lineas = cache.lineas(fuentes)
+        # Las líneas ya son JSON: la respuesta se compone sin decodificarlas
+        partes = [json.dumps(f).encode('utf-8') + b': ' + (ultima_version(f, lineas[f]) or b'null')
+                  for f in fuentes]
+        texto = b'{"registros": {' + b', '.join(partes) + b'}}'
+    return frame_resultado(texto, peticion.get('compresion'))
+
+def peticion_frame(payload, flags, que):
+    """Objeto JSON/msgpack de un frame CONSULTA o SUSCRIBIR."""
+    peticion = decodificar(descomprimir(payload, flags, MAX_MENSAJE), flags)
+    if not isinstance(peticion, dict):
+        raise ValueError(f"{que} debe ser un objeto")
+    return peticion
+
+def consulta(peticion):
+    """Future con el frame de respuesta a una consulta; en un worker la resuelve el proceso principal."""
+    if isinstance(escritor, EscritorRemoto):
+        return escritor.consultar(peticion)
+    futuro = Future()
+    futuro.set_result(consultar(peticion))
+    return futuro
+
+def suscribir(payload, flags):
+    """
+    Registra la suscripción de un frame SUSCRIBIR. Devuelve el suscriptor, un
+    Future con la primera respuesta (el último registro de cada fuente que
+    encaja, o un ACK sin "inicial") y la compresión pedida para los EVENTO.
+    """
+    peticion = peticion_frame(payload, flags, "La suscripción")
+    fuentes, prefijos = peticion.get('fuentes', []), peticion.get('prefijos', [])
+    for lista in (fuentes, prefijos):
+        if not isinstance(lista, list) or not all(isinstance(f, str) for f in lista):
+            raise ValueError("Las fuentes y los prefijos de la suscripción deben ser listas de cadenas")
+    if not fuentes and not prefijos:
+        raise ValueError("La suscripción no pide ninguna fuente")
+    compresion = peticion.get('compresion')
+    # Primero la suscripción y después el estado inicial: lo que se escriba entre medias llega (quizá dos veces)
+    suscriptor = suscripciones.suscribir(fuentes, prefijos)
+    if peticion.get('inicial', True):
+        respuesta = consulta({'op': 'mget', 'sources': fuentes, 'prefijos': prefijos, 'compresion': compresion})
+    else:
+        respuesta = Future()
+        respuesta.set_result(frame_ack(0))
+    return suscriptor, respuesta, compresion
+
+def lineas_mensaje(data):
+    """Valida un mensaje JSON de un cliente sin framing y devuelve su línea (y lo preparado, ver preparar)."""
+    # Solo se descodifica el principio para el log; json.loads trabaja sobre los bytes
+    debug(f"Datos recibidos: {bytes(data[:100]).decode('utf-8', 'replace')}...")
+
+    # Parsear JSON para validar que esté bien formado
+    return preparar(registros_json(TIPO_REGISTRO, data))
+
+def lineas_frame(tipo, flags, payload):
+    """
+    Valida un frame REGISTRO o LOTE y devuelve sus líneas (y lo preparado, ver preparar).
+    Un lote se valida entero antes de guardar: o se aceptan todos o ninguno.
+    Los payloads JSON se guardan tal cual llegan; los msgpack se pasan a JSON.
+    """
+    if tipo not in (TIPO_REGISTRO, TIPO_LOTE):
+        raise ErrorProtocolo(f"Tipo de mensaje desconocido: {tipo}")
+    datos = descomprimir(payload, flags, MAX_MENSAJE)
+    if es_json(flags):
+        pares = registros_json(tipo, datos)
+    else:
+        obj = decodificar(datos, flags)
+        if tipo == TIPO_LOTE and not isinstance(obj, list):
+            raise ValueError("El payload de un lote debe ser una lista")
+        pares = [(r, None) for r in (obj if tipo == TIPO_LOTE else [obj])]
+
+    debug(f"Frame recibido: {len(pares)} registro(s), {len(payload)} bytes (flags {flags:#x})")
+    return preparar(pares)
+
+def procesar_mensaje(data):
+    """
+    Guarda un mensaje sin framing y devuelve la respuesta (ACK/ERR).
+    El ACK solo sale cuando el lote del escritor que lo contiene es duradero.
+    """
+    inicio = time.perf_counter()
+    try:
+        lineas, preparadas = nuevas_lineas(*lineas_mensaje(data))
+        if lineas:
+            escritor.enviar(lineas, preparadas).result()
+        metricas.registrar(lineas, time.perf_counter() - inicio)
+        return b"ACK"
+    except Exception as e:
+        metricas.error(e)
+        print(f"Error gestionando cliente: {e}")
+        return b"ERR"
+
+def procesar_frame(tipo, flags, payload):
+    """Guarda un frame REGISTRO o LOTE y devuelve el frame de respuesta."""
+    inicio = time.perf_counter()
+    try:
+        if tipo == TIPO_HOLA:
+            return frame_hola(hola(payload))
+        if tipo == TIPO_CONSULTA:
+            return consulta(peticion_frame(payload, flags, "La consulta")).result()
+        lineas, preparadas = lineas_frame(tipo, flags, payload)
+        nuevas, preparadas = nuevas_lineas(lineas, preparadas)
+        if nuevas:
+            escritor.enviar(nuevas, preparadas).result()
+        metricas.registrar(nuevas, time.perf_counter() - inicio)
+        return frame_ack(len(lineas))
+    except Exception as e:
+        metricas.error(e)
+        print(f"Error gestionando frame: {e}")
+        return frame_err(e)
+
+async def procesar_mensaje_async(data):
+    inicio = time.perf_counter()
+    try:
+        lineas, preparadas = nuevas_lineas(*lineas_mensaje(data))
+        if lineas:
+            await asyncio.wrap_future(escritor.enviar(lineas, preparadas))
+        metricas.registrar(lineas, time.perf_counter() - inicio)
+        return b"ACK"
+    except Exception as e:
+        metricas.error(e)
+        print(f"Error gestionando cliente: {e}")
+        return b"ERR"
+
+async def procesar_frame_async(tipo, flags, payload):
+    inicio = time.perf_counter()
+    try:
+        if tipo == TIPO_HOLA:
+            return frame_hola(hola(payload))
+        if tipo == TIPO_CONSULTA:
+            return await asyncio.wrap_future(consulta(peticion_frame(payload, flags, "La consulta")))
+        lineas, preparadas = lineas_frame(tipo, flags, payload)
+        nuevas, preparadas = nuevas_lineas(lineas, preparadas)
+        if nuevas:
+            await asyncio.wrap_future(escritor.enviar(nuevas, preparadas))
+        metricas.registrar(nuevas, time.perf_counter() - inicio)
+        return frame_ack(len(lineas))
+    except Exception as e:
+        metricas.error(e)
+        print(f"Error gestionando frame: {e}")
+        return frame_err(e)
+
+def atender_frames(conn, cabecera):
+    """
+    Conexión persistente: atiende frames hasta que el cliente cierre (o se
+    suscriba). Tras TIMEOUT_INACTIVO segundos sin recibir nada se cierra.
+    """
+    while True:
+        try:
+            frame = leer_frame(conn, MAX_MENSAJE, cabecera)
+        except socket.timeout:
+            debug("Conexión inactiva, se cierra")
+            return
+        cabecera = None
+        if frame is None:
+            return
+        tipo, flags, payload = frame
+        if tipo == TIPO_SUSCRIBIR:
+            atender_suscripcion(conn, payload, flags)
+            return
+        conn.sendall(procesar_frame(tipo, flags, payload))
+
+def atender_suscripcion(conn, payload, flags):
+    """
+    La conexión pasa a recibir EVENTOs hasta que el cliente cierre o se corte
+    la suscripción. Un consumidor lento sale como excepción (y recibe un ERR);
+    el cierre de la suscripción al apagar es un fin normal de la conexión.
+    """
+    suscriptor, respuesta, compresion = suscribir(payload, flags)
+    try:
+        conn.sendall(respuesta.result())
+        while True:
+            pares = suscriptor.esperar(ESPERA_SUSCRIPCION)
+            if pares:
+                conn.sendall(frame_evento([linea for _, linea in pares], compresion))
+            elif select.select([conn], [], [], 0)[0] and not conn.recv(4096):
+                return  # El cliente ha cerrado
+    except ConnectionAbortedError:
+        return  # Suscripción cerrada (apagado): se corta la conexión sin ERR
+    finally:
+        suscripciones.cancelar(suscriptor)
+
 def handle_client(conn, addr):
-    print(f"Conectado por {addr}")
-    try:
-        data = conn.recv(1024 * 1024) # 1MB max
-        if not data:
-            return
-        
-        # Descodificar mensaje
-        message = data.decode('utf-8')
-        print(f"Datos recibidos: {message[:100]}...")
-        
-        # Parsear JSON para validar que esté bien formado
-        json_data = json.loads(message)
-        
-        # Añadir timestamp de recepción
-        json_data['_received_at'] = datetime.now().isoformat()
-        
-        # Guardar en fichero (thread safe-ish para append en linux)
-        with open(DATA_FILE, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(json_data) + '\n')
-            
-        conn.sendall(b"ACK")
+    with metricas.conexion():
+        _handle_client(conn, addr)
+
+def _handle_client(conn, addr):
+    debug(f"Conectado por {addr}")
+    con_frames = False
+    try:
+        # Un cliente que conecta y no envía nada no se queda con el hilo
+        conn.settimeout(TIMEOUT_INACTIVO)
+        try:
+            primero = conn.recv(1)
+        except socket.timeout:
+            return
+        if not primero:
+            return
+        if primero[0] == MAGIC:
+            con_frames = True
+            atender_frames(conn, primero)
+        else:
+            # Cliente antiguo: un único JSON por conexión, leído hasta que esté completo
+            conn.settimeout(TIMEOUT_LECTURA)
+            data = recibir_json(conn, primero, MAX_MENSAJE)
+            conn.sendall(procesar_mensaje(data))
     except Exception as e:
+        metricas.error(e)
         print(f"Error gestionando cliente: {e}")
-        conn.sendall(b"ERR")
+        try:
+            conn.sendall(frame_err(e) if con_frames else b"ERR")
+        except OSError:
+            pass
     finally:
         conn.close()
 
+def socket_escucha(reuse_port=False, backlog=socket.SOMAXCONN):
+    """Socket de escucha en HOST:PORT; con `reuse_port` lo pueden abrir varios procesos a la vez."""
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    s.bind((HOST, PORT))
+    s.listen(backlog)
+    return s
+
+def _servir_hilos(s):
+    """Acepta conexiones en `s` con un hilo por cliente hasta Ctrl+C/SIGTERM y espera a los que queden."""
+    # SIGTERM apaga igual que Ctrl+C: deja de aceptar, espera a los clientes y vacía el escritor
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    hilos = []
+
+    try:
+        with s:
+            metricas.listo = True
+            print(f"Servidor escuchando en {HOST}:{PORT}")
+
+            while True:
+                conn, addr = s.accept()
+                # Gestionar en un hilo para permitir múltiples scrapers a la vez
+                t = threading.Thread(target=handle_client, args=(conn, addr))
+                t.start()
+                hilos = [h for h in hilos if h.is_alive()] + [t]
+    except KeyboardInterrupt:
+        print("Apagando servidor...")
+    finally:
+        metricas.listo = False
+        suscripciones.cerrar()
+        limite = time.monotonic() + TIMEOUT_CIERRE
+        for h in hilos:
+            h.join(max(0, limite - time.monotonic()))
+
 def start_server():
     # Asegurar que el directorio de datos existe
     os.makedirs(os.path.dirname(DATA_FILE), exist_ok=True)
-    
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind((HOST, PORT))
-        s.listen()
-        print(f"Servidor escuchando en {HOST}:{PORT}")
-        
+    iniciar_escritor()
+    try:
+        _servir_hilos(socket_escucha())
+    finally:
+        detener_escritor()
+        print("Escritor vaciado, servidor detenido")
+
+# Conexiones asyncio en curso (se esperan al apagar)
+_clientes_async = set()
+
+async def handle_client_async(reader, writer, limite):
+    """Versión asyncio de handle_client: mismo contrato ACK/ERR, sin hilos."""
+    tarea = asyncio.current_task()
+    _clientes_async.add(tarea)
+    tarea.add_done_callback(_clientes_async.discard)
+    async with limite:
+        with metricas.conexion():
+            await _handle_client_async(reader, writer)
+
+async def _handle_client_async(reader, writer):
+    addr = writer.get_extra_info('peername')
+    debug(f"Conectado por {addr}")
+    con_frames = False
+    try:
+        try:
+            primero = await asyncio.wait_for(reader.read(1), TIMEOUT_INACTIVO)
+        except asyncio.TimeoutError:
+            return
+        if not primero:
+            return
+        if primero[0] == MAGIC:
+            con_frames = True
+            cabecera = primero
+            while True:
+                try:
+                    frame = await asyncio.wait_for(leer_frame_async(reader, MAX_MENSAJE, cabecera),
+                                                   TIMEOUT_INACTIVO)
+                except asyncio.TimeoutError:
+                    debug("Conexión inactiva, se cierra")
+                    break
+                cabecera = None
+                if frame is None:
+                    break
+                tipo, flags, payload = frame
+                if tipo == TIPO_SUSCRIBIR:
+                    await atender_suscripcion_async(reader, writer, payload, flags)
+                    break
+                writer.write(await procesar_frame_async(tipo, flags, payload))
+                await writer.drain()
+        else:
+            data = await recibir_json_async(reader, primero, MAX_MENSAJE, TIMEOUT_LECTURA)
+            writer.write(await procesar_mensaje_async(data))
+            await writer.drain()
+    except Exception as e:
+        metricas.error(e)
+        print(f"Error gestionando cliente: {e}")
+        try:
+            writer.write(frame_err(e) if con_frames else b"ERR")
+            await writer.drain()
+        except OSError:
+            pass
+    finally:
+        writer.close()
+
+async def atender_suscripcion_async(reader, writer, payload, flags):
+    """Versión asyncio de atender_suscripcion: el escritor despierta a la tarea cuando hay eventos."""
+    suscriptor, respuesta, compresion = suscribir(payload, flags)
+    loop = asyncio.get_running_loop()
+    hay_eventos = asyncio.Event()
+    suscriptor.avisar = lambda: loop.call_soon_threadsafe(hay_eventos.set)
+    # Lectura pendiente: termina (con b'') cuando el cliente cierra
+    cierre = asyncio.ensure_future(reader.read(4096))
+    try:
+        writer.write(await asyncio.wrap_future(respuesta))
+        await writer.drain()
+        while True:
+            hay_eventos.clear()
+            pares = suscriptor.esperar(0)
+            if pares:
+                writer.write(frame_evento([linea for _, linea in pares], compresion))
+                await writer.drain()
+                continue
+            espera = asyncio.ensure_future(hay_eventos.wait())
+            await asyncio.wait({espera, cierre}, return_when=asyncio.FIRST_COMPLETED)
+            espera.cancel()
+            if cierre.done():
+                if not cierre.result():
+                    return  # El cliente ha cerrado
+                cierre = asyncio.ensure_future(reader.read(4096))
+    except ConnectionAbortedError:
+        return  # Suscripción cerrada (apagado): se corta la conexión sin ERR
+    finally:
+        cierre.cancel()
+        suscriptor.avisar = None
+        suscripciones.cancelar(suscriptor)
+
+async def _servir_async(max_conexiones, sock=None):
+    limite = asyncio.Semaphore(max_conexiones)
+    if sock is None:
+        sock = socket_escucha(backlog=max_conexiones)
+    server = await asyncio.start_server(lambda r, w: handle_client_async(r, w, limite), sock=sock)
+    metricas.listo = True
+    print(f"Servidor (asyncio) escuchando en {HOST}:{PORT}")
+    parar = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for senal in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(senal, parar.set)
+    async with server:
+        await parar.wait()
+        metricas.listo = False
+        print("Apagando servidor...")
+        server.close()
+        suscripciones.cerrar()
+        # Se termina de atender a los clientes que ya estaban conectados
+        if _clientes_async:
+            await asyncio.wait(set(_clientes_async), timeout=TIMEOUT_CIERRE)
+
+def start_async_server(max_conexiones=MAX_CONEXIONES):
+    """
+    Servidor basado en asyncio: una sola tarea por conexión en vez de un hilo,
+    con un máximo de `max_conexiones` atendidas a la vez.
+    """
+    os.makedirs(os.path.dirname(DATA_FILE), exist_ok=True)
+    iniciar_escritor()
+    try:
+        asyncio.run(_servir_async(max_conexiones))
+    finally:
+        detener_escritor()
+        print("Escritor vaciado, servidor detenido")
+
+def atender_worker(conexion):
+    """
+    Proceso principal: escribe las líneas que manda un worker (deduplicadas
+    aquí, donde están las huellas, con las que ha calculado el worker) y le
+    responde cuando son duraderas. Si
+    el worker tiene suscriptores, le reenvía lo que piden.
+    """
+    lock = threading.Lock()
+    reenvio = None
+
+    def responder(mensaje):
+        with lock:
+            try:
+                conexion.send(mensaje)
+            except OSError:
+                pass  # El worker ya ha terminado
+
+    def escrito(id_, lineas, nuevas, inicio, futuro=None):
+        error = futuro.exception() if futuro is not None else None
+        if error is not None:
+            metricas.error(error)
+            responder(('fallo', id_, str(error)))
+            return
+        metricas.registrar(nuevas, time.monotonic() - inicio)
+        responder(('hecho', id_, len(lineas)))
+
+    def reenviar(suscriptor):
         while True:
-            conn, addr = s.accept()
-            # Gestionar en un hilo para permitir múltiples scrapers a la vez
-            t = threading.Thread(target=handle_client, args=(conn, addr))
-            t.start()
+            try:
+                pares = suscriptor.esperar()
+            except ConsumidorLento as e:
+                responder(('cortar', None, str(e)))
+                return
+            except ConnectionAbortedError:
+                return
+            responder(('publicar', None, pares))
+
+    while True:
+        try:
+            mensaje = conexion.recv()
+        except (EOFError, OSError):
+            if reenvio is not None:
+                suscripciones.cancelar(reenvio)
+            return
+        if mensaje[0] == 'interes':
+            # Lo que piden ahora los suscriptores del worker; el nuevo reenvío empieza antes de cortar el anterior
+            _, fuentes, prefijos = mensaje
+            anterior = reenvio
+            reenvio = suscripciones.suscribir(fuentes, prefijos) if fuentes or prefijos else None
+            if reenvio is not None:
+                threading.Thread(target=reenviar, args=(reenvio,), name='reenvio', daemon=True).start()
+            if anterior is not None:
+                suscripciones.cancelar(anterior)
+            continue
+        if mensaje[0] == 'consulta':
+            _, id_, peticion = mensaje
+            try:
+                responder(('hecho', id_, consultar(peticion)))
+            except Exception as e:
+                responder(('fallo', id_, str(e)))
+            continue
+        if mensaje[0] != 'lineas':
+            metricas.evento_worker(*mensaje)
+            continue
+        _, id_, lineas, preparadas, inicio = mensaje
+        nuevas, preparadas = nuevas_lineas(lineas, preparadas)
+        if not nuevas:
+            escrito(id_, lineas, nuevas, inicio)
+            continue
+        escritor.enviar(nuevas, preparadas).add_done_callback(
+            lambda f, id_=id_, lineas=lineas, nuevas=nuevas, inicio=inicio: escrito(id_, lineas, nuevas, inicio, f))
+
+def _worker(conexion, modo_async, max_conexiones):
+    """Proceso worker: acepta y parsea en el puerto compartido; escribe a través del principal."""
+    global escritor, metricas
+    escritor = EscritorRemoto(conexion, suscripciones)
+    metricas = MetricasRemotas(escritor.mandar)
+    suscripciones.al_cambiar = lambda registro: escritor.mandar(('interes', *registro.interes()))
+    try:
+        s = socket_escucha(reuse_port=True, backlog=max_conexiones if modo_async else socket.SOMAXCONN)
+        if modo_async:
+            asyncio.run(_servir_async(max_conexiones, s))
+        else:
+            _servir_hilos(s)
+    finally:
+        escritor.cerrar()
+
+def start_workers(n, modo_async=False, max_conexiones=MAX_CONEXIONES):
+    """
+    Servidor multiproceso: `n` workers (ver server/workers.py) escuchan en el
+    mismo puerto con SO_REUSEPORT y parsean cada uno en su proceso; este
+    proceso solo escribe el log con el escritor único.
+    """
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        raise RuntimeError("--workers necesita SO_REUSEPORT (Linux/BSD)")
+    os.makedirs(os.path.dirname(DATA_FILE), exist_ok=True)
+    # Los workers se crean antes de arrancar los hilos del escritor y las métricas: fork solo copia el actual
+    contexto = multiprocessing.get_context('fork')
+    procesos, conexiones = [], []
+    for i in range(n):
+        principal, worker = contexto.Pipe()
+        proceso = contexto.Process(target=_worker, args=(worker, modo_async, max_conexiones),
+                                   name=f'ingesta-{i}')
+        proceso.start()
+        worker.close()
+        procesos.append(proceso)
+        conexiones.append(principal)
+    iniciar_escritor()
+    for conexion in conexiones:
+        threading.Thread(target=atender_worker, args=(conexion,), name='worker', daemon=True).start()
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    metricas.listo = True
+    print(f"{n} workers escuchando en {HOST}:{PORT}")
+    try:
+        for proceso in procesos:
+            proceso.join()
+    except KeyboardInterrupt:
+        print("Apagando servidor...")
+    finally:
+        metricas.listo = False
+        # Los workers dejan de aceptar y terminan con sus clientes; mientras tanto se les sigue escribiendo
+        for proceso in procesos:
+            if proceso.is_alive():
+                proceso.terminate()
+        limite = time.monotonic() + TIMEOUT_CIERRE + 1
+        for proceso in procesos:
+            proceso.join(max(0, limite - time.monotonic()))
+        detener_escritor()
+        print("Escritor vaciado, servidor detenido")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Servidor de ingesta de datos ATD")
+    parser.add_argument('--port', type=int, default=PORT,
+                        help="Puerto TCP de ingesta")
+    parser.add_argument('--datos', default=DATA_FILE,
+                        help="Fichero de log donde se guardan los registros")
+    parser.add_argument('--async', dest='modo_async', action='store_true',
+                        help="Usar el servidor asyncio en vez de un hilo por conexión")
+    parser.add_argument('--max-conexiones', type=int, default=MAX_CONEXIONES,
+                        help="Conexiones simultáneas en modo asyncio")
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help="Procesos que aceptan y parsean en el mismo puerto (SO_REUSEPORT); 0 = uno solo")
+    parser.add_argument('--timeout-inactivo', type=float, default=TIMEOUT_INACTIVO,
+                        help="Segundos sin recibir nada antes de cerrar una conexión")
+    parser.add_argument('--max-mensaje-mb', type=float, default=MAX_MENSAJE / (1024 * 1024),
+                        help="Tamaño máximo de un mensaje o frame, en MB")
+    parser.add_argument('--fsync', choices=POLITICAS_FSYNC, default=FSYNC,
+                        help="Cuándo hacer fsync del log: tras cada lote, por intervalo o nunca")
+    parser.add_argument('--lote-max', type=int, default=LOTE_MAX,
+                        help="Registros máximos por lote de escritura")
+    parser.add_argument('--lote-espera-ms', type=float, default=LOTE_ESPERA * 1000,
+                        help="Milisegundos que se espera a completar un lote")
+    parser.add_argument('--segmento-mb', type=float, default=SEGMENTO_MAX / (1024 * 1024),
+                        help="Tamaño a partir del cual se sella el segmento activo, en MB")
+    parser.add_argument('--compactar-cada', type=float, default=COMPACTAR_CADA,
+                        help="Segundos entre compactaciones del log (0 = nunca)")
+    parser.add_argument('--versiones', type=int, default=VERSIONES,
+                        help="Versiones de cada fuente que conserva la compactación")
+    parser.add_argument('--sin-rollups', dest='rollups', action='store_false',
+                        help="No materializar los agregados (los scrapers los enviarán ellos)")
+    parser.add_argument('--sin-dedup', dest='dedup', action='store_false',
+                        help="Escribir también los registros iguales a la última versión de su fuente")
+    parser.add_argument('--cache-mb', type=float, default=CACHE_BYTES / (1024 * 1024),
+                        help="Memoria para el último registro de cada fuente que sirven las consultas (0 = sin consultas)")
+    parser.add_argument('--metricas-port', type=int, default=METRICAS_PORT,
+                        help="Puerto HTTP local de /metrics y /health (0 = desactivado)")
+    parser.add_argument('--debug-muestreo', type=int, default=DEBUG_MUESTREO,
+                        help="Imprimir 1 de cada N mensajes recibidos (0 = ninguno)")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    start_server()
+    args = parse_args()
+    PORT = args.port
+    DATA_FILE = args.datos
+    MAX_MENSAJE = int(args.max_mensaje_mb * 1024 * 1024)
+    TIMEOUT_INACTIVO = args.timeout_inactivo
+    FSYNC = args.fsync
+    LOTE_MAX = args.lote_max
+    LOTE_ESPERA = args.lote_espera_ms / 1000
+    SEGMENTO_MAX = int(args.segmento_mb * 1024 * 1024)
+    COMPACTAR_CADA = args.compactar_cada
+    VERSIONES = args.versiones
+    ROLLUPS_ACTIVOS = args.rollups
+    DEDUP_ACTIVO = args.dedup
+    CACHE_BYTES = int(args.cache_mb * 1024 * 1024)
+    METRICAS_PORT = args.metricas_port
+    DEBUG_MUESTREO = args.debug_muestreo
+    if args.workers > 0:
+        start_workers(args.workers, args.modo_async, args.max_conexiones)
+    elif args.modo_async:
+        start_async_server(args.max_conexiones)
+    else:
+        start_server()
@@ -0,0 +1,124 @@
+"""
+Piezas de los procesos worker del servidor (--workers N).
+
+Cada worker escucha en el mismo puerto (SO_REUSEPORT, el kernel reparte las
+conexiones) y hace en su propio proceso lo caro de cada mensaje: leer los
+frames, descomprimir, decodificar y validar el JSON, calcular la huella de
+cada línea y decodificar las filas de los rollups. Las líneas y lo preparado
+para ellas se mandan por un Pipe al proceso principal, que tiene el escritor
+único (y con él el log, el índice, los rollups y la deduplicación), así que
+el almacén sigue siendo uno solo.
+
+En el worker, EscritorRemoto y MetricasRemotas sustituyen al escritor y a las
+métricas: el resto del servidor no cambia. Mensajes por el Pipe:
+
+    worker -> principal: ('lineas', id, [(source, línea)], [(huella, fila)], inicio)
+                         ('consulta', id, petición)
+                         ('conexion', +1 | -1)
+                         ('error', es_de_parseo)
+                         ('interes', fuentes, prefijos)   lo que piden sus suscriptores
+    principal -> worker: ('hecho', id, n o frame de la respuesta) | ('fallo', id, mensaje)
+                         ('publicar', None, [(source, línea)]) | ('cortar', None, mensaje)
+"""
+
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from common.suscripciones import ConsumidorLento
+
+
+class EscritorRemoto:
+    """Misma interfaz que EscritorLog (enviar, pendientes, cerrar) sobre el Pipe del worker."""
+
+    def __init__(self, conexion, suscripciones=None):
+        self._conexion = conexion
+        self._suscripciones = suscripciones
+        self._lock = threading.Lock()
+        self._futuros = {}
+        self._ids = itertools.count()
+        threading.Thread(target=self._recibir, name='escritor-remoto', daemon=True).start()
+
+    def mandar(self, mensaje):
+        with self._lock:
+            self._conexion.send(mensaje)
+
+    def _pedir(self, tipo, *args):
+        futuro = Future()
+        id_ = next(self._ids)
+        self._futuros[id_] = futuro
+        try:
+            self.mandar((tipo, id_, *args))
+        except OSError as e:
+            self._futuros.pop(id_, None)
+            futuro.set_exception(e)
+        return futuro
+
+    def enviar(self, lineas, preparadas=None):
+        """Future que se resuelve con el número de líneas cuando el proceso principal las ha escrito."""
+        # `inicio` en el reloj monotónico del sistema, común a todos los procesos
+        return self._pedir('lineas', lineas, preparadas or [None] * len(lineas), time.monotonic())
+
+    def consultar(self, peticion):
+        """Future con el frame de respuesta a una consulta, que resuelve el proceso principal (su caché)."""
+        return self._pedir('consulta', peticion)
+
+    def pendientes(self):
+        return len(self._futuros)
+
+    def _recibir(self):
+        while True:
+            try:
+                tipo, id_, valor = self._conexion.recv()
+            except (EOFError, OSError):
+                break
+            if tipo == 'publicar':
+                self._suscripciones.publicar(valor)
+                continue
+            if tipo == 'cortar':
+                # El Pipe no daba abasto: los suscriptores del worker vuelven a empezar
+                self._suscripciones.cerrar(ConsumidorLento(valor))
+                continue
+            futuro = self._futuros.pop(id_, None)
+            if futuro is None:
+                continue
+            if tipo == 'hecho':
+                futuro.set_result(valor)
+            else:
+                futuro.set_exception(RuntimeError(valor))
+        # El proceso principal ya no está: nada de lo pendiente se va a escribir
+        for id_ in list(self._futuros):
+            self._futuros.pop(id_).set_exception(ConnectionError("Proceso principal no disponible"))
+
+    def cerrar(self):
+        self._conexion.close()
+
+
+class MetricasRemotas:
+    """
+    Métricas de un worker: las conexiones y los errores se mandan al proceso
+    principal, que registra los mensajes al escribirlos y sirve /metrics.
+    """
+
+    def __init__(self, mandar):
+        self._mandar = mandar
+        self.listo = False
+
+    @contextmanager
+    def conexion(self):
+        self._mandar(('conexion', 1))
+        try:
+            yield
+        finally:
+            self._mandar(('conexion', -1))
+
+    def registrar(self, lineas, latencia):
+        pass  # Lo anota el proceso principal
+
+    def duplicado(self, n):
+        pass  # La deduplicación se hace en el proceso principal
+
+    def error(self, e):
+        self._mandar(('error', isinstance(e, ValueError)))
@@ -0,0 +1,79 @@
+"""
+Utilidades comunes de los tests.
+
+Los scripts del proyecto no son un paquete instalable: como hacen ellos
+mismos, se añaden al path la raíz de TRABAJO/, analysis/, bench/, scrapers/ y server/.
+"""
+
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [RAIZ] + [os.path.join(RAIZ, d) for d in ('analysis', 'bench', 'scrapers', 'server')]
+
+from common.protocol import empaquetar, leer_frame  # noqa: E402
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class Servidor:
+    """server/server.py en un subproceso, con el log en un directorio temporal."""
+
+    def __init__(self, directorio, *args):
+        self.puerto = puerto_libre()
+        self.ruta = os.path.join(directorio, 'raw_data.jsonl')
+        self.proceso = subprocess.Popen(
+            [sys.executable, '-u', os.path.join(RAIZ, 'server', 'server.py'), '--port', str(self.puerto),
+             '--datos', self.ruta, '--metricas-port', '0', *args],
+            cwd=RAIZ, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        limite = time.monotonic() + 15
+        while time.monotonic() < limite:
+            if self.proceso.poll() is not None:
+                raise RuntimeError(f"El servidor terminó al arrancar:\n{self.proceso.stdout.read()}")
+            try:
+                socket.create_connection(('127.0.0.1', self.puerto), timeout=0.5).close()
+                return
+            except OSError:
+                time.sleep(0.05)
+        self.detener()
+        raise RuntimeError("El servidor no acepta conexiones")
+
+    def conectar(self):
+        return socket.create_connection(('127.0.0.1', self.puerto), timeout=10)
+
+    def detener(self):
+        """SIGTERM y espera: al salir el escritor está vaciado. Devuelve la salida del servidor."""
+        if self.proceso.poll() is None:
+            self.proceso.send_signal(signal.SIGTERM)
+        salida, _ = self.proceso.communicate(timeout=30)
+        return salida
+
+
+@pytest.fixture
+def servidor(tmp_path):
+    """Fábrica de servidores; los que queden en marcha se paran al terminar el test."""
+    arrancados = []
+
+    def arrancar(*args):
+        arrancados.append(Servidor(str(tmp_path), *args))
+        return arrancados[-1]
+
+    yield arrancar
+    for s in arrancados:
+        s.detener()
+
+
+def peticion(conn, tipo, payload, flags=0):
+    """Envía un frame y devuelve la respuesta (tipo, flags, payload)."""
+    conn.sendall(empaquetar(tipo, payload, flags))
+    return leer_frame(conn)
@@ -0,0 +1,159 @@
+"""Log de ingesta (common/storage.py): group commit, índice, segmentos y compactación."""
+
+import json
+import threading
+
+import pytest
+
+from common import storage
+from common.storage import EscritorLog, LectorAlmacen, leer_registros
+
+
+def linea(source, i):
+    return source, json.dumps({'source': source, 'data': {'i': i}}).encode() + b'\n'
+
+
+@pytest.mark.parametrize('fsync', storage.POLITICAS_FSYNC)
+def test_group_commit(tmp_path, fsync):
+    ruta = str(tmp_path / 'raw_data.jsonl')
+    confirmadas = []
+    escritor = EscritorLog(ruta, max_lote=64, fsync=fsync, fsync_intervalo=0.01,
+                           al_confirmar=lambda lineas, _: confirmadas.extend(lineas)).iniciar()
+    futuros = {}
+
+    def cliente(c):
+        # Cada cliente envía mensajes de varias líneas que no se deben mezclar con las de otros
+        futuros[c] = [escritor.enviar([linea(f'C{c}', 3 * m + k) for k in range(3)]) for m in range(50)]
+
+    hilos = [threading.Thread(target=cliente, args=(c,)) for c in range(8)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert all(f.result(timeout=10) == 3 for fs in futuros.values() for f in fs)
+    # Cuando un future está resuelto su lote ya pasó por al_confirmar
+    assert len(confirmadas) == 8 * 150
+    escritor.cerrar()
+
+    registros = list(leer_registros(ruta))
+    assert len(registros) == 8 * 150
+    for i in range(0, len(registros), 3):
+        mensaje = registros[i:i + 3]
+        assert len({r['source'] for r in mensaje}) == 1
+        assert [r['data']['i'] % 3 for r in mensaje] == [0, 1, 2]
+    for c in range(8):
+        assert [r['data']['i'] for r in registros if r['source'] == f'C{c}'] == list(range(150))
+    # El índice apunta a cada registro
+    with LectorAlmacen(ruta) as lector:
+        assert lector.fuentes() == [f'C{c}' for c in range(8)]
+        assert [r['data']['i'] for r in lector.historial('C3')] == list(range(150))
+
+
+def test_politica_desconocida(tmp_path):
+    with pytest.raises(ValueError):
+        EscritorLog(str(tmp_path / 'raw_data.jsonl'), fsync='siempre')
+
+
+def escribir_versiones(ruta, versiones, fuentes=5, max_segmento=400):
+    """Escribe `versiones` rondas de `fuentes` fuentes, rotando segmentos cada pocos registros."""
+    escritor = EscritorLog(ruta, max_segmento=max_segmento).iniciar()
+    for v in range(versiones):
+        escritor.enviar([linea(f'S{s}', v) for s in range(fuentes)]).result()
+    escritor.cerrar()
+
+
+@pytest.mark.parametrize('versiones', [1, 2])
+def test_compactar_segmentos(tmp_path, versiones):
+    ruta = str(tmp_path / 'raw_data.jsonl')
+    escribir_versiones(ruta, 10)
+    segmentos = storage.rutas_segmentos(ruta)
+    assert len(segmentos) > 3
+    antes = LectorAlmacen(ruta)
+
+    leidos, conservados = storage.compactar(ruta, versiones)
+    assert leidos < 50 and conservados < leidos
+    # Sellados juntos en uno, más el activo
+    assert len(storage.rutas_segmentos(ruta)) == 2
+    assert storage.compactar(ruta, versiones) is None
+
+    # Cada fuente conserva sus últimas versiones (las del activo cuentan), en orden de llegada
+    registros = list(leer_registros(ruta))
+    for s in range(5):
+        valores = [r['data']['i'] for r in registros if r['source'] == f'S{s}']
+        assert valores == sorted(valores) and valores[-1] == 9
+        assert len(valores) >= versiones
+    en_activo = storage.cargar_indice(storage.rutas_segmentos(ruta)[-1])
+    with LectorAlmacen(ruta) as lector:
+        for s in range(5):
+            assert lector.dato(f'S{s}') == {'i': 9}
+            assert len(lector.historial(f'S{s}')) == max(versiones, len(en_activo.get(f'S{s}', [])))
+    # Un lector abierto antes de compactar sigue viendo el conjunto antiguo completo
+    assert [r['data']['i'] for r in antes.historial('S0')] == list(range(10))
+    antes.cerrar()
+
+
+def test_lector_sigue_la_rotacion(tmp_path):
+    ruta = str(tmp_path / 'raw_data.jsonl')
+    escribir_versiones(ruta, 2)
+    with LectorAlmacen(ruta) as lector:
+        escribir_versiones(ruta, 6)
+        lector.refrescar()
+        assert len(lector.historial('S4')) == 8
+        storage.compactar(ruta)
+        lector.refrescar()
+        assert lector.dato('S4') == {'i': 5}
+        assert [r['data']['i'] for r in lector.historial('S4')][-1] == 5
+
+
+def test_indice_tras_una_caida(tmp_path):
+    ruta = str(tmp_path / 'raw_data.jsonl')
+    escritor = EscritorLog(ruta).iniciar()
+    escritor.enviar([linea('A', 0), linea('B', 0)]).result()
+    escritor.cerrar()
+    # Un registro escrito sin índice, una línea de índice a medias y un registro cortado
+    with open(ruta, 'ab') as f:
+        f.write(linea('A', 1)[1] + b'{"source": "B", "da')
+    with open(storage.ruta_indice(ruta), 'ab') as f:
+        f.write(b'{"s":"A","o":')
+    # Los lectores escanean la cola que no está en el índice e ignoran lo cortado
+    assert {s: len(p) for s, p in storage.cargar_indice(ruta).items()} == {'A': 2, 'B': 1}
+    # Al volver a arrancar, el escritor deja log e índice coherentes
+    escritor = EscritorLog(ruta).iniciar()
+    escritor.enviar([linea('B', 1)]).result()
+    escritor.cerrar()
+    with LectorAlmacen(ruta) as lector:
+        assert lector.dato('A') == {'i': 1} and lector.dato('B') == {'i': 1}
+    errores = {}
+    assert [r['source'] for r in leer_registros(ruta, errores=errores)] == ['A', 'B', 'A', 'B']
+    assert errores == {'json': 1}
+
+
+def test_indice_de_otro_log(tmp_path):
+    # Un .idx que apunta más allá del final del log (log sustituido) no se usa
+    ruta = str(tmp_path / 'raw_data.jsonl')
+    with open(ruta, 'wb') as f:
+        f.write(linea('A', 0)[1])
+    with open(storage.ruta_indice(ruta), 'wb') as f:
+        f.write(storage.linea_indice('Z', 0, 10 ** 6))
+    assert list(storage.cargar_indice(ruta)) == ['A']
+    with LectorAlmacen(ruta) as lector:
+        assert lector.fuentes() == ['A']
+
+
+def test_leer_registros_filtra_por_fuente(tmp_path):
+    ruta = str(tmp_path / 'raw_data.jsonl')
+    with open(ruta, 'wb') as f:
+        for source in ('CIS_CURRENT', 'PROVINCE_Madrid', 'OTRA', 'PROVINCE_Soria'):
+            f.write(linea(source, 0)[1])
+        # 'source' que no va primero, con comillas escapadas, sin fuente y JSON roto
+        f.write(b'{"data": {}, "source": "PROVINCE_Lugo"}\n')
+        f.write(json.dumps({'source': 'CIS_"CURRENT"', 'data': {}}).encode() + b'\n')
+        f.write(b'{"data": {}}\n[1, 2]\nno es json\n')
+    errores = {}
+    fuentes = [r['source'] for r in leer_registros(ruta, fuentes=['CIS_CURRENT'], prefijos=['PROVINCE_'],
+                                                  errores=errores)]
+    assert fuentes == ['CIS_CURRENT', 'PROVINCE_Madrid', 'PROVINCE_Soria', 'PROVINCE_Lugo']
+    assert errores == {'source': 2, 'json': 1}
+    assert len(list(leer_registros(ruta))) == 6
+    # Es un generador: no lee nada hasta que se recorre
+    assert next(leer_registros(ruta, fuentes=['OTRA']))['source'] == 'OTRA'
@@ -0,0 +1,50 @@
+"""Archivo Parquet del almacén (common/archivo.py)."""
+
+import json
+
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from common import archivo  # noqa: E402
+from common.storage import EscritorLog, LectorAlmacen  # noqa: E402
+
+FUENTES = ['CIS_CURRENT', 'PROVINCE_Madrid', 'OFFICIAL_MULTI', 'TRENDS_DAY_1', 'ECONOMIC_Soria',
+           'ELECTOMANIA', 'OTRA_COSA', 'CIS_Añil']
+
+
+@pytest.fixture
+def almacen(tmp_path, monkeypatch):
+    # Grupos pequeños para que los registros sueltos se lean de varios grupos
+    monkeypatch.setattr(archivo, 'FILAS_GRUPO', 7)
+    ruta = str(tmp_path / 'raw_data.jsonl')
+    escritor = EscritorLog(ruta, max_segmento=2000).iniciar()
+    for v in range(5):
+        escritor.enviar([(s, json.dumps({'source': s, 'data': {'v': v}, '_received_at': f'2025-01-0{v + 1}'})
+                          .encode() + b'\n') for s in FUENTES]).result()
+    escritor.cerrar()
+    return ruta, str(tmp_path / 'archivo')
+
+
+def test_misma_interfaz_que_el_almacen(almacen):
+    ruta, directorio = almacen
+    filas = archivo.exportar(ruta, directorio)
+    assert filas == {'CIS': 10, 'PROVINCE': 10, 'TRENDS': 5, 'ECONOMIC': 5, 'ELECTOMANIA': 5, 'OTRAS': 5}
+    with archivo.LectorArchivo(directorio) as lector, LectorAlmacen(ruta) as original:
+        assert lector.fuentes() == original.fuentes() == sorted(FUENTES)
+        assert lector.fuentes('PROVINCE_') == ['PROVINCE_Madrid']
+        for s in FUENTES:
+            assert lector.ultimo(s) == original.ultimo(s)
+            assert lector.historial(s) == original.historial(s)
+        assert lector.ultimo('NO_EXISTE') is None and lector.dato('NO_EXISTE', 1) == 1
+
+
+def test_versiones_y_filtro(almacen):
+    ruta, directorio = almacen
+    archivo.exportar(ruta, directorio)
+    # Relanzar sobre el mismo directorio sustituye los ficheros
+    assert sum(archivo.exportar(ruta, directorio, versiones=2).values()) == 2 * len(FUENTES)
+    tabla = archivo.leer_archivo(directorio, familias=['CIS'], fuentes=['CIS_CURRENT'])
+    assert tabla.column('received_at').to_pylist() == ['2025-01-04', '2025-01-05']
+    with archivo.LectorArchivo(directorio) as lector:
+        assert [r['data']['v'] for r in lector.historial('CIS_Añil')] == [3, 4]
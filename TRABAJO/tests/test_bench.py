@@ -0,0 +1,58 @@
+"""Humo de los benchmarks de bench/: corren con tamaños pequeños y dan resultados coherentes."""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from common.protocol import disponibles
+from conftest import RAIZ, puerto_libre
+
+
+def bench(script, *args):
+    subprocess.run([sys.executable, os.path.join(RAIZ, 'bench', script), *args], cwd=RAIZ, check=True,
+                   capture_output=True, timeout=120)
+
+
+@pytest.mark.parametrize('opciones', [
+    ['--lote', '20'], ['--legacy'],
+    pytest.param(['--lote', '20', '--codificacion', 'msgpack', '--compresion', 'zlib'], id='msgpack',
+                 marks=pytest.mark.skipif('msgpack' not in disponibles()['codificaciones'],
+                                          reason="msgpack no instalado")),
+], ids=['frames', 'legacy', 'msgpack'])
+def test_ingest_bench(tmp_path, opciones):
+    salida = tmp_path / 'resultado.json'
+    bench('ingest_bench.py', '--lanzar-servidor', '', '--port', str(puerto_libre()), '--duracion', '0.5',
+          '--clientes', '2', '--salida', str(salida), *opciones)
+    resultado = json.loads(salida.read_text())
+    assert resultado['mensajes'] > 0 and resultado['errores'] == {'err': 0, 'rechazadas': 0, 'otros': 0}
+    assert resultado['registros'] == resultado['mensajes'] * (1 if '--legacy' in opciones else 20)
+    lat = resultado['latencia_ms']
+    assert 0 < lat['p50'] <= lat['p99'] <= lat['max']
+    assert resultado['servidor']['rss_pico_mb'] > 0
+
+
+def test_dataset_sintetico_y_analysis_bench(tmp_path):
+    import generar_dataset
+    from common.storage import LectorAlmacen, leer_registros
+    ruta = str(tmp_path / 'raw_data.jsonl')
+    resumen = generar_dataset.generar(ruta, 3000, semilla=1)
+    assert resumen['lineas'] == 3000 and resumen['bytes'] == os.path.getsize(ruta)
+    # Misma semilla, mismo fichero
+    with open(ruta, 'rb') as f:
+        contenido = f.read()
+    generar_dataset.generar(str(tmp_path / 'otro.jsonl'), 3000, semilla=1)
+    assert (tmp_path / 'otro.jsonl').read_bytes() == contenido
+    # El índice generado es el mismo que el del log
+    with LectorAlmacen(ruta) as lector:
+        assert sum(len(p) for p in lector.indice.values()) == 3000
+        assert lector.ultimo('CIS_CURRENT') == [r for r in leer_registros(ruta, ['CIS_CURRENT'])][-1]
+
+    salida = tmp_path / 'analisis.json'
+    bench('analysis_bench.py', '--datos', ruta, '--repeticiones', '1', '--salida', str(salida))
+    resultado = json.loads(salida.read_text())
+    assert set(resultado['fases']) == {'carga', 'sesgo', 'regresion', 'voto_oculto', 'salida'}
+    assert resultado['total_analizar_s'] > 0
+    assert set(resultado['alternativas']) >= {'carga_completa', 'incremental_frio', 'incremental_sin_cambios'}
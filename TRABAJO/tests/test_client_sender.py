@@ -0,0 +1,89 @@
+"""Envío en segundo plano de scrapers/client_sender.py."""
+
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import client_sender
+from common.storage import leer_registros
+from conftest import RAIZ
+
+
+@pytest.fixture
+def sender(tmp_path, monkeypatch):
+    """client_sender con el spool en un directorio temporal, cerrado y vaciado al terminar."""
+    monkeypatch.setattr(client_sender, 'SPOOL_DIR', str(tmp_path / 'spool'))
+    monkeypatch.setattr(client_sender, 'ESPERA_INICIAL', 0.01)
+    monkeypatch.setattr(client_sender, '_estadisticas', dict.fromkeys(client_sender._estadisticas, 0))
+    yield client_sender
+    client_sender.flush(5)
+    client_sender.close()
+
+
+def test_registro_no_serializable_falla_al_enviarlo(sender):
+    with pytest.raises(TypeError):
+        sender.send_batch([('BIEN', {'a': 1}), ('MAL', {'a': object()})])
+    # Ni siquiera el bueno del mismo lote se ha encolado
+    assert sender._pendientes == 0
+
+
+def test_error_inesperado_no_para_el_hilo(sender, servidor, monkeypatch):
+    srv = servidor()
+    monkeypatch.setattr(sender, 'PORT', srv.puerto)
+    enviar_lote = sender._enviar_lote
+
+    def falla_con_mal(items):
+        if any(registro['source'] == 'MAL' for registro, _ in items):
+            raise TypeError("no serializable")
+        return enviar_lote(items)
+
+    monkeypatch.setattr(sender, '_enviar_lote', falla_con_mal)
+    sender.send_batch([('BIEN_1', {'a': 1}), ('MAL', {'a': 2}), ('BIEN_2', {'a': 3})])
+    assert sender.flush(10)
+    assert sender.stats()['rejected'] == 1
+    # El hilo sigue vivo y envía lo siguiente
+    sender.send_data('BIEN_3', {'a': 4})
+    assert sender.flush(10)
+    sender.close()
+    srv.detener()
+    assert [r['source'] for r in leer_registros(srv.ruta)] == ['BIEN_1', 'BIEN_2', 'BIEN_3']
+
+
+def test_flush_con_timeout(sender, monkeypatch):
+    monkeypatch.setattr(sender, '_enviar_lote', lambda items: time.sleep(1) or len(items))
+    sender.send_data('LENTO', {'a': 1})
+    inicio = time.monotonic()
+    assert not sender.flush(0.2)
+    assert time.monotonic() - inicio < 1
+    assert sender.flush(5)
+
+
+def test_scraper_sin_servidor_termina(tmp_path):
+    """Sin servidor, al salir el proceso deja lo pendiente en el spool y termina."""
+    codigo = (f"import client_sender as c; c.PORT = 1; c.SPOOL_DIR = {str(tmp_path)!r}; c.REINTENTOS = 1; "
+              "c.send_data('X', {'a': 1})")
+    resultado = subprocess.run([sys.executable, '-c', codigo], cwd=os.path.join(RAIZ, 'scrapers'),
+                               capture_output=True, text=True, timeout=30)
+    assert resultado.returncode == 0, resultado.stdout + resultado.stderr
+    assert [f for f in os.listdir(tmp_path) if f.endswith('.jsonl')]
+
+
+@pytest.mark.parametrize('codificacion', client_sender.disponibles()['codificaciones'])
+@pytest.mark.parametrize('compresion', client_sender.disponibles()['compresiones'])
+def test_formato_negociado(sender, servidor, monkeypatch, codificacion, compresion):
+    srv = servidor()
+    monkeypatch.setattr(sender, 'PORT', srv.puerto)
+    monkeypatch.setattr(sender, 'CODIFICACION', codificacion)
+    monkeypatch.setattr(sender, 'COMPRESION', compresion)
+    sender.close()
+    registros = [(f'FORMATO_{i}', {'i': i, 'texto': 'ñ' * 300, 'lista': [1.5, None, True]}) for i in range(200)]
+    sender.send_batch(registros)
+    assert sender.flush(10)
+    assert (sender._formato['codificacion'], sender._formato['compresion']) == (codificacion, compresion)
+    sender.close()
+    srv.detener()
+    # Se guarda JSON sea cual sea el formato del payload
+    assert [(r['source'], r['data']) for r in leer_registros(srv.ruta, prefijos=['FORMATO_'])] == registros
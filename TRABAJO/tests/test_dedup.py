@@ -0,0 +1,63 @@
+"""Deduplicación por contenido en la ingesta (common/dedup.py y el servidor)."""
+
+import json
+
+import pytest
+
+from common.dedup import Deduplicador, huella, huella_linea
+from common.protocol import TIPO_ACK, TIPO_REGISTRO
+from common.storage import leer_registros
+from conftest import peticion
+
+
+def linea(source, data, recibido='2026-01-01T00:00:00'):
+    return json.dumps({'source': source, 'data': data, '_received_at': recibido}).encode('utf-8') + b'\n'
+
+
+def test_huella_canonica():
+    # Ni el orden de las claves ni '_received_at' cambian la huella
+    assert huella_linea(linea('X', {'a': 1, 'b': 2}, 't1')) == huella_linea(linea('X', {'b': 2, 'a': 1}, 't2'))
+    assert huella({'source': 'X', 'data': {'a': 1}}) != huella({'source': 'Y', 'data': {'a': 1}})
+
+
+def test_filtrar_compara_con_la_ultima_version():
+    dedup = Deduplicador()
+    a, b = ('X', linea('X', {'v': 'A'})), ('X', linea('X', {'v': 'B'}))
+    dedup.aplicar_lineas([a])
+    assert dedup.filtrar([a]) == []
+    # Dentro del lote también cuenta lo anterior del propio lote: A, B, A se escribe entero
+    assert dedup.filtrar([b, a, a]) == [0, 1]
+    dedup.aplicar_lineas([b])
+    assert dedup.filtrar([a]) == [0]
+
+
+@pytest.mark.parametrize('modo', [[], ['--async'], ['--workers', '2']], ids=['hilos', 'async', 'workers'])
+def test_aba_secuencial_se_guarda_entero(servidor, modo):
+    """Un cliente que envía A, B, A esperando cada ACK ve escritas las tres versiones."""
+    srv = servidor(*modo)
+    rondas = 300
+    with srv.conectar() as conn:
+        for _ in range(rondas):
+            for valor in ('A', 'B', 'A'):
+                payload = json.dumps({'source': 'ABA', 'data': {'v': valor}}).encode('utf-8')
+                tipo, _, respuesta = peticion(conn, TIPO_REGISTRO, payload)
+                assert tipo == TIPO_ACK, bytes(respuesta)
+    srv.detener()
+    valores = [r['data']['v'] for r in leer_registros(srv.ruta, fuentes=('ABA',))]
+    # La primera A de cada ronda repite la última A de la ronda anterior: solo esa se descarta
+    assert valores == ['A', 'B', 'A'] + ['B', 'A'] * (rondas - 1)
+
+
+def test_repetidos_se_descartan_tambien_tras_reiniciar(servidor):
+    def enviar(srv, valores):
+        with srv.conectar() as conn:
+            for valor in valores:
+                payload = json.dumps({'source': 'REPE', 'data': {'v': valor}}).encode('utf-8')
+                assert peticion(conn, TIPO_REGISTRO, payload)[0] == TIPO_ACK
+        srv.detener()
+        return [r['data']['v'] for r in leer_registros(srv.ruta, fuentes=('REPE',))]
+
+    assert enviar(servidor(), [1, 1, 1]) == [1]
+    # El servidor nuevo recupera la última huella de cada fuente
+    assert enviar(servidor(), [1, 2]) == [1, 2]
+    assert enviar(servidor('--sin-dedup'), [2, 2]) == [1, 2, 2, 2]
@@ -0,0 +1,56 @@
+"""Reparto D'Hondt vectorizado (analysis/dhondt.py)."""
+
+import numpy as np
+import pytest
+
+import dhondt
+
+
+def test_madrid_23j_2023():
+    # Madrid, 37 escaños: PP 40,47%, PSOE 27,31%, SUMAR 16,21%, VOX 13,84% -> 16, 10, 6, 5
+    votos = np.array([[[40.47, 27.31, 16.21, 13.84]]])
+    assert dhondt.repartir(votos, np.array([37])).tolist() == [[[16, 10, 6, 5]]]
+
+
+def test_barrera():
+    # Con 2,9% no entra aunque el cociente diera escaño; el que sí la pasa se lo lleva
+    votos = np.array([[[50.0, 40.0, 2.9, 3.0]]])
+    assert dhondt.repartir(votos, np.array([30])).tolist() == [[[16, 13, 0, 1]]]
+    assert dhondt.repartir(np.array([[[2.0, 1.0]]]), np.array([3])).tolist() == [[[0, 0]]]
+
+
+def test_empate_en_el_ultimo_escano():
+    # 4 escaños: 30, 20, 15 y empate 30/3 = 20/2 = 10 por el cuarto; gana el partido de índice menor
+    votos = np.array([[[30.0, 20.0]], [[20.0, 30.0]]])
+    assert dhondt.repartir(votos, np.array([4])).tolist() == [[[3, 1]], [[2, 2]]]
+
+
+def test_provincias_y_escenarios_a_la_vez():
+    rng = np.random.default_rng(1)
+    votos = rng.uniform(0, 40, size=(50, 6, 5))
+    escanos = np.array([1, 2, 3, 7, 7, 37])
+    resultado = dhondt.repartir(votos, escanos)
+    assert (resultado.sum(axis=-1) == escanos).all()
+    # Igual que el D'Hondt escaño a escaño
+    for s in range(votos.shape[0]):
+        for r, k in enumerate(escanos):
+            v = np.where(votos[s, r] >= dhondt.UMBRAL, votos[s, r], 0.0)
+            ganados = np.zeros(len(v), dtype=int)
+            for _ in range(k):
+                ganados[np.argmax(v / (ganados + 1))] += 1
+            assert resultado[s, r].tolist() == ganados.tolist()
+
+
+def test_escenarios_reproducibles_con_semilla():
+    import monte_carlo as mc
+    from test_monte_carlo import modelo_sintetico
+    modelo = modelo_sintetico()
+    modelo['ratios'] = np.ones((4, len(modelo['partidos'])))
+    modelo['escanos'] = np.array([1, 5, 10, 37])
+    a = mc.simular(modelo, 3000, 1, 1000, semilla=7, reductor=dhondt.reducir_escanos)
+    b = mc.simular(modelo, 3000, 1, 1000, semilla=7, reductor=dhondt.reducir_escanos)
+    assert a['n'] == 3000
+    for clave in ('total', 'provincias', 'mayoria'):
+        np.testing.assert_array_equal(a[clave], b[clave])
+    assert (a['provincias'].sum(axis=1) * np.arange(a['provincias'].shape[-1])).sum(axis=-1).tolist() == \
+        (modelo['escanos'] * 3000).tolist()
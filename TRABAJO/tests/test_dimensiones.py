@@ -0,0 +1,52 @@
+"""Tablas de dimensiones y registros matriz (common/dimensiones.py)."""
+
+import base64
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from common import dimensiones
+from conftest import RAIZ
+
+
+def test_matriz_ida_y_vuelta():
+    celdas = [(('Madrid', 'unemployment_rate'), 10.5), (('Sevilla', 'avg_income_eur'), 21034.25)]
+    data = dimensiones.matriz_desde_celdas(dimensiones.DIMS_ECONOMIA, celdas)
+    assert data['tipo'] == 'f8'
+    # float64: la renta no pierde los céntimos
+    assert sorted(dimensiones.celdas_matriz(data)) == sorted(celdas)
+    cubo = dimensiones.cubo_desde_matriz(data, dimensiones.DIMS_ECONOMIA)
+    assert cubo[dimensiones.IDS['provincia']['Sevilla'], dimensiones.IDS['indicador']['avg_income_eur']] == 21034.25
+    assert np.isnan(cubo[dimensiones.IDS['provincia']['Madrid'], dimensiones.IDS['indicador']['avg_income_eur']])
+
+
+def test_matriz_descarta_nombres_desconocidos(capsys):
+    data = dimensiones.matriz(('region', 'partido'), [['Atlántida', 'Madrid'], ['PP', 'NUEVO', 'PSOE']],
+                              [1, 2, 3, 4, 5, 6])
+    assert 'Atlántida' in capsys.readouterr().out
+    # Quedan las celdas (Madrid, PP) y (Madrid, PSOE), con sus valores
+    assert sorted(dimensiones.celdas_matriz(data)) == [(('Madrid', 'PP'), 4.0), (('Madrid', 'PSOE'), 6.0)]
+
+
+def test_matriz_sin_tipo_es_float32():
+    # Registros escritos antes de 'tipo': float32
+    data = dimensiones.matriz(('region', 'partido'), [['Madrid'], ['PP']], [1.5])
+    data['valores'] = base64.b64encode(np.array([1.5], dtype='<f4').tobytes()).decode('ascii')
+    del data['tipo']
+    assert list(dimensiones.celdas_matriz(data)) == [(('Madrid', 'PP'), 1.5)]
+
+
+@pytest.mark.parametrize('script', ['cis_scraper.py', 'resultados_scraper.py', 'scraper_economia.py'])
+def test_scrapers_importan_common_desde_cualquier_directorio(tmp_path, script):
+    """Cada scraper pone la raíz en el path él mismo, sin depender de client_sender."""
+    # Como `python scrapers/<script>` pero sin ejecutar main(): solo scrapers/ en el path
+    scrapers = os.path.join(RAIZ, 'scrapers')
+    codigo = (f"import runpy, sys; sys.path.insert(0, {scrapers!r}); "
+              f"runpy.run_path({os.path.join(scrapers, script)!r}, run_name='prueba')")
+    entorno = {k: v for k, v in os.environ.items() if k != 'PYTHONPATH'}
+    resultado = subprocess.run([sys.executable, '-c', codigo], cwd=tmp_path, env=entorno,
+                               capture_output=True, text=True, timeout=60)
+    assert resultado.returncode == 0, resultado.stderr
@@ -0,0 +1,82 @@
+"""El modo incremental (analysis/incremental.py) da la misma predicción que el completo."""
+
+import json
+import os
+import shutil
+
+import pytest
+
+import bias_calculator as bc
+import incremental
+from common.rollups import Rollups
+from common.storage import EscritorLog, LectorAlmacen, leer_registros
+from conftest import RAIZ
+
+
+@pytest.fixture
+def analisis(tmp_path, monkeypatch):
+    """bias_calculator sobre una copia del log de ejemplo; devuelve (ruta, completo(), incremental())."""
+    ruta = str(tmp_path / 'raw_data.jsonl')
+    shutil.copy(os.path.join(RAIZ, 'data', 'raw_data.jsonl'), ruta)
+    salida = str(tmp_path / 'prediccion.csv')
+    monkeypatch.setattr(bc, 'ARCHIVO_DATOS', ruta)
+    monkeypatch.setattr(bc, 'ARCHIVO_SALIDA', salida)
+    monkeypatch.setattr(bc, 'ARCHIVO_CHECKPOINT', str(tmp_path / 'checkpoint.json'))
+
+    def ejecutar(analizar):
+        analizar()
+        with open(salida) as f:
+            return f.read()
+
+    return ruta, lambda: ejecutar(bc.analizar), lambda: ejecutar(bc.analizar_incremental)
+
+
+def anadir(ruta, registros, recibido):
+    """Escribe registros (source, data) en el log con el escritor del servidor."""
+    escritor = EscritorLog(ruta).iniciar()
+    lineas = [(source, json.dumps({'source': source, 'data': data, '_received_at': recibido}).encode() + b'\n')
+              for source, data in registros]
+    escritor.enviar(lineas).result()
+    escritor.cerrar()
+
+
+def ultimo(ruta, source):
+    return list(leer_registros(ruta, fuentes=(source,)))[-1]['data']
+
+
+def test_igual_que_el_completo(analisis):
+    ruta, completo, incremental_ = analisis
+    assert incremental_() == completo()
+    # Sin registros nuevos, el checkpoint da lo mismo
+    assert incremental_() == completo()
+
+
+def test_agregado_mas_reciente_sustituye_al_anterior(analisis, tmp_path):
+    ruta, completo, incremental_ = analisis
+    antes = incremental_()
+    # Nuevo histórico del CIS sin el barómetro del 10N, y de Electomanía sin la encuesta más antigua
+    cis = [b for b in ultimo(ruta, 'CIS_HISTORICAL_MULTI') if b['election_id'] != '10N-2019']
+    encuestas = ultimo(ruta, 'ELECTOMANIA_HISTORICAL')[:-1]
+    anadir(ruta, [('CIS_HISTORICAL_MULTI', cis), ('ELECTOMANIA_HISTORICAL', encuestas)], '2026-02-01T00:00:00')
+    despues = incremental_()
+    assert despues == completo()
+    assert despues != antes
+    cp = incremental.cargar_checkpoint(str(tmp_path / 'checkpoint.json'))
+    assert [b['election_id'] for b in incremental.agregado(cp, 'CIS_HISTORICAL_MULTI')] == \
+        [b['election_id'] for b in cis]
+    assert incremental.n_encuestas(cp) == len(encuestas)
+
+
+def test_vista_de_los_rollups(analisis):
+    """Filas nuevas más recientes que el agregado: gana la vista que guarda el servidor."""
+    ruta, completo, incremental_ = analisis
+    antes = incremental_()
+    barometro = ultimo(ruta, 'CIS_BAROMETER_1_23J-2023')
+    anadir(ruta, [('CIS_BAROMETER_1_23J-2023', dict(barometro, data=dict(barometro['data'], PP=40.0)))],
+           '2026-02-01T00:00:00')
+    with LectorAlmacen(ruta) as lector:
+        rollups = Rollups(ruta).cargar(lector)
+    rollups.guardar()
+    despues = incremental_()
+    assert despues == completo()
+    assert despues != antes
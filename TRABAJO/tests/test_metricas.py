@@ -0,0 +1,40 @@
+"""Métricas, salud y log de depuración muestreado del servidor."""
+
+import itertools
+import json
+import threading
+import urllib.request
+
+import server
+from common.protocol import TIPO_ACK, TIPO_LOTE
+from conftest import peticion, puerto_libre
+
+
+def test_debug_muestreado_sin_perder_cuentas(monkeypatch, capsys):
+    monkeypatch.setattr(server, 'DEBUG_MUESTREO', 10)
+    monkeypatch.setattr(server, '_contador_debug', itertools.count(1))
+    hilos = [threading.Thread(target=lambda: [server.debug('x') for _ in range(2000)]) for _ in range(8)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert capsys.readouterr().out.count('x\n') == 8 * 2000 // 10
+
+
+def test_metrics_y_health(servidor):
+    puerto = puerto_libre()
+    srv = servidor('--metricas-port', str(puerto))
+
+    def get(ruta):
+        with urllib.request.urlopen(f'http://127.0.0.1:{puerto}{ruta}', timeout=5) as r:
+            return r.status, json.load(r)
+
+    assert get('/health') == (200, {'ready': True})
+    registros = [{'source': f'TRENDS_DAY_2026-01-0{i}', 'data': {'date': f'2026-01-0{i}'}} for i in range(1, 4)]
+    with srv.conectar() as conn:
+        tipo, _, _ = peticion(conn, TIPO_LOTE, json.dumps(registros).encode('utf-8'))
+        assert tipo == TIPO_ACK
+    _, metricas = get('/metrics')
+    assert metricas['mensajes'] == 1
+    assert metricas['registros'] == 3
+    assert metricas['por_prefijo']['TRENDS_DAY_']['registros'] == 3
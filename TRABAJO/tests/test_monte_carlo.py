@@ -0,0 +1,57 @@
+"""Simulación Monte Carlo (analysis/monte_carlo.py)."""
+
+import numpy as np
+import pytest
+
+import monte_carlo as mc
+
+PARTIDOS = ['PP', 'PSOE', 'VOX', 'SUMAR']
+
+
+def modelo_sintetico(n_encuestas=30):
+    """Modelo como el de preparar_modelo, con encuestas y errores del CIS inventados."""
+    rng = np.random.default_rng(0)
+    meses = np.sort(rng.uniform(-36, 0, n_encuestas))
+    base = np.array([33.0, 29.0, 13.0, 11.0])
+    Y = base + meses[:, None] * np.array([0.05, -0.03, 0.02, -0.04]) + rng.normal(0, 1, (n_encuestas, 4))
+    return {
+        'partidos': list(PARTIDOS),
+        'meses': meses,
+        'Y': Y,
+        'pesos': np.ones(n_encuestas),
+        'errores': rng.normal(0, 2, (3, 4)),
+        'economico': np.zeros(4),
+        'ajuste': np.zeros(4),
+        'electomania': np.full(4, np.nan),
+    }
+
+
+def test_misma_semilla_mismo_resultado():
+    modelo = modelo_sintetico()
+    a = mc.simular(modelo, 5000, 1, 2000, semilla=3)
+    b = mc.simular(modelo, 5000, 1, 2000, semilla=3)
+    c = mc.simular(modelo, 5000, 1, 2000, semilla=4)
+    assert a['n'] == 5000
+    for clave in a:
+        np.testing.assert_array_equal(a[clave], b[clave])
+    assert not np.array_equal(a['histograma'], c['histograma'])
+
+
+def test_no_depende_del_numero_de_procesos():
+    # Cada bloque tiene su semilla, así que el pool da lo mismo que un solo proceso
+    modelo = modelo_sintetico()
+    a = mc.simular(modelo, 4000, 1, 1000, semilla=5)
+    b = mc.simular(modelo, 4000, 2, 1000, semilla=5)
+    for clave in a:
+        np.testing.assert_allclose(a[clave], b[clave])
+
+
+def test_resumen_partidos():
+    modelo = modelo_sintetico()
+    total = mc.simular(modelo, 5000, 1, 5000, semilla=0)
+    filas = mc.resumen_partidos(total, PARTIDOS)
+    assert [f['partido'] for f in filas][0] == 'PP'
+    assert sum(f['prob_primero'] for f in filas) == pytest.approx(1.0)
+    for f in filas:
+        assert f['cuantiles'] == sorted(f['cuantiles'])
+        assert f['cuantiles'][0] <= f['media'] <= f['cuantiles'][-1]
@@ -0,0 +1,54 @@
+"""Orquestador del pipeline (run_pipeline.py) sin los scrapers reales."""
+
+import json
+
+import pytest
+
+import run_pipeline as rp
+from common.storage import leer_registros
+from conftest import puerto_libre
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    monkeypatch.setattr(rp, 'PORT', puerto_libre())
+    monkeypatch.setattr(rp, 'METRICAS_PORT', puerto_libre())
+    monkeypatch.setattr(rp, 'SERVER_LOG', str(tmp_path / 'server_log.txt'))
+    monkeypatch.setattr(rp, 'tiempos', [])
+    return tmp_path
+
+
+def test_arranque_ingesta_y_apagado(pipeline):
+    ruta = str(pipeline / 'raw_data.jsonl')
+    proceso = rp.arrancar_servidor(['--datos', ruta])
+    try:
+        rp.esperar_servidor(proceso)
+        assert rp.consultar_metricas('/health')[0] == 200
+        # Un scraper con ATD_PORT apuntando al servidor del pipeline
+        script = pipeline / 'scraper.py'
+        script.write_text("import sys\nsys.path.insert(0, 'scrapers')\nimport client_sender\n"
+                          "with client_sender.session():\n"
+                          "    client_sender.send_data('PIPELINE', {'ok': True})\n")
+        assert rp.ejecutar(str(script), timeout=60).returncode == 0
+    finally:
+        # Con SIGTERM el servidor vacía el escritor y sale limpio
+        assert rp.apagar_servidor(proceso) == 0
+    assert [r['data'] for r in leer_registros(ruta, fuentes=['PIPELINE'])] == [{'ok': True}]
+
+
+def test_servidor_que_no_arranca(pipeline):
+    proceso = rp.arrancar_servidor(['--fsync', 'nunca_jamas'])
+    with pytest.raises(RuntimeError, match="terminó al arrancar"):
+        rp.esperar_servidor(proceso)
+
+
+def test_scrapers_en_paralelo(pipeline, monkeypatch, capsys):
+    scripts = {}
+    for nombre, codigo in (('bien', 0), ('mal', 3)):
+        scripts[nombre] = pipeline / f'{nombre}.py'
+        scripts[nombre].write_text(f"print('salida de {nombre}')\nraise SystemExit({codigo})\n")
+    monkeypatch.setattr(rp, 'SCRAPERS', [(nombre, str(ruta)) for nombre, ruta in scripts.items()])
+    assert rp.ejecutar_scrapers(2) == ['mal']
+    salida = capsys.readouterr().out
+    assert '[bien] OK' in salida and '[mal] FALLO (3)' in salida and 'salida de mal' in salida
+    assert sorted(nombre for nombre, _ in rp.tiempos) == ['  scraper bien', '  scraper mal']
@@ -0,0 +1,72 @@
+"""Protocolo con frames (common/protocol.py) y conexiones persistentes del servidor."""
+
+import json
+import time
+
+import pytest
+
+from common import protocol
+from common.protocol import (TIPO_ACK, TIPO_HOLA, TIPO_LOTE, TIPO_REGISTRO, ErrorProtocolo, codificar,
+                             decodificar, descomprimir, desempaquetar_cabecera, empaquetar, negociar)
+from common.storage import leer_registros
+from conftest import peticion
+
+MODOS = pytest.mark.parametrize('modo', [[], ['--async']], ids=['hilos', 'async'])
+
+
+def test_cabecera_ida_y_vuelta():
+    frame = empaquetar(TIPO_LOTE, b'[1,2]', flags=5)
+    assert desempaquetar_cabecera(frame[:protocol.CABECERA.size]) == (TIPO_LOTE, 5, 5)
+    with pytest.raises(ErrorProtocolo):
+        desempaquetar_cabecera(frame[:protocol.CABECERA.size], max_longitud=4)
+    with pytest.raises(ErrorProtocolo):
+        desempaquetar_cabecera(b'\x00' + frame[1:protocol.CABECERA.size])
+
+
+@pytest.mark.parametrize('codificacion', protocol.disponibles()['codificaciones'])
+@pytest.mark.parametrize('compresion', [None] + protocol.disponibles()['compresiones'])
+def test_codificar_ida_y_vuelta(codificacion, compresion):
+    obj = [{'source': f'S{i}', 'data': {'valor': i, 'texto': 'x' * 100}} for i in range(100)]
+    flags, payload = codificar(obj, codificacion, compresion, min_comprimir=0)
+    assert decodificar(descomprimir(payload, flags), flags) == obj
+    if compresion is not None:
+        assert len(payload) < len(json.dumps(obj))
+
+
+def test_negociar_elige_lo_que_soportan_los_dos():
+    assert negociar({'codificaciones': ['cbor', 'json'], 'compresiones': ['brotli', 'zlib']}) == \
+        {'codificacion': 'json', 'compresion': 'zlib'}
+    assert negociar({}) == {'codificacion': 'json', 'compresion': None}
+
+
+@MODOS
+def test_conexion_persistente_con_compresion(servidor, modo):
+    srv = servidor(*modo)
+    propias = protocol.disponibles()
+    with srv.conectar() as conn:
+        tipo, _, respuesta = peticion(conn, TIPO_HOLA, json.dumps(
+            {'codificaciones': propias['codificaciones'], 'compresiones': propias['compresiones']}).encode())
+        assert tipo == TIPO_HOLA
+        formato = json.loads(respuesta)
+        assert formato['codificacion'] == propias['codificaciones'][0]
+        # Varios frames por la misma conexión, en el formato acordado y comprimidos
+        lote = [{'source': f'PRUEBA_{i}', 'data': {'i': i, 'relleno': 'x' * 200}} for i in range(50)]
+        flags, payload = codificar(lote, formato['codificacion'], formato['compresion'], min_comprimir=0)
+        assert peticion(conn, TIPO_LOTE, payload, flags)[0] == TIPO_ACK
+        flags, payload = codificar({'source': 'PRUEBA_UNO', 'data': {'i': -1}}, formato['codificacion'])
+        assert peticion(conn, TIPO_REGISTRO, payload, flags)[0] == TIPO_ACK
+    srv.detener()
+    registros = list(leer_registros(srv.ruta, prefijos=('PRUEBA_',)))
+    assert [r['data']['i'] for r in registros] == list(range(50)) + [-1]
+
+
+@MODOS
+def test_conexion_inactiva_se_cierra(servidor, modo):
+    srv = servidor('--timeout-inactivo', '0.5', *modo)
+    with srv.conectar() as conn, srv.conectar() as conn_frames:
+        # Una conexión que no envía nada y otra que se queda parada entre dos frames
+        assert peticion(conn_frames, TIPO_REGISTRO, b'{"source": "A", "data": {}}')[0] == TIPO_ACK
+        inicio = time.monotonic()
+        assert conn.recv(1) == b''
+        assert conn_frames.recv(1) == b''
+        assert time.monotonic() - inicio < 5
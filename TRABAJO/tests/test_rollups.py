@@ -0,0 +1,78 @@
+"""Agregados materializados (common/rollups.py)."""
+
+import json
+
+from common import dimensiones
+from common.rollups import LectorConRollups, Rollups, rollup_de
+from common.storage import EscritorLog, LectorAlmacen
+
+
+def registro(source, data, recibido):
+    return {'source': source, 'data': data, '_received_at': recibido}
+
+
+def test_rollup_de():
+    assert rollup_de('CIS_BAROMETER_3_23J') == 'CIS_HISTORICAL_MULTI'
+    assert rollup_de('ECONOMIC_Madrid') == 'ECONOMIC_MATRIX'
+    # Los agregados que comparten prefijo con sus filas no son filas
+    assert rollup_de('ECONOMIC_CONTEXT') is None and rollup_de('ECONOMIC_MATRIX') is None
+    assert rollup_de('CIS_CURRENT') is None
+
+
+def test_misma_clave_gana_la_mas_reciente():
+    rollups = Rollups()
+    rollups.aplicar('CIS_BAROMETER_1', registro('', {'election_id': '10N-2019', 'PP': 20}, '2025-01-01'))
+    rollups.aplicar('CIS_BAROMETER_0', registro('', {'election_id': '28A-2019', 'PP': 17}, '2025-01-01'))
+    vista = rollups.vista('CIS_HISTORICAL_MULTI')
+    assert [b['election_id'] for b in vista['data']] == ['28A-2019', '10N-2019']
+    # Sin cambios es la misma vista, sin reconstruirla
+    assert rollups.vista('CIS_HISTORICAL_MULTI') is vista
+    # Otra fuente con la misma clave sustituye a la fila anterior
+    rollups.aplicar('CIS_BAROMETER_2', registro('', {'election_id': '10N-2019', 'PP': 21}, '2025-02-01'))
+    vista = rollups.vista('CIS_HISTORICAL_MULTI')
+    assert vista['filas'] == 2 and vista['data'][-1]['PP'] == 21
+    assert vista['_received_at'] == '2025-02-01'
+    # Las filas sin la clave se ignoran
+    assert not rollups.aplicar('CIS_BAROMETER_9', registro('', {'PP': 1}, '2025-03-01'))
+
+
+def test_ventana():
+    rollups = Rollups()
+    for d in range(300):
+        fecha = f'2025-{1 + d // 28:02d}-{1 + d % 28:02d}'
+        rollups.aplicar(f'TRENDS_DAY_{d}', registro('', {'date': fecha, 'PP': d}, fecha))
+    vista = rollups.vista('GOOGLE_TRENDS_SERIES')
+    assert vista['filas'] == 90
+    assert [d['PP'] for d in vista['data']] == list(range(299, 209, -1))
+
+
+def test_cargar_desde_el_log_da_lo_mismo(tmp_path):
+    ruta = str(tmp_path / 'raw_data.jsonl')
+    escritor = EscritorLog(ruta).iniciar()
+    incremental = Rollups()
+    escritor.al_confirmar = lambda lineas, _: incremental.aplicar_lineas(lineas)
+    for v in range(3):
+        filas = [(f'PROVINCE_{p}_23J', registro(f'PROVINCE_{p}_23J', {
+            'election_id': '23J-2023', 'province': p, 'results': {'PP': 30.0 + v, 'PSOE': 25.0}}, f'2025-0{v + 1}'))
+            for p in ('Madrid', 'Soria', 'Atlantida')]
+        escritor.enviar([(s, json.dumps(r).encode() + b'\n') for s, r in filas]).result()
+    escritor.cerrar()
+    with LectorAlmacen(ruta) as lector:
+        cargada = Rollups().cargar(lector).vista('OFFICIAL_PROVINCES_MATRIX')
+    assert cargada == incremental.vista('OFFICIAL_PROVINCES_MATRIX')
+    # La provincia sin id en las tablas no entra en la matriz
+    assert cargada['data']['ids'][1] == [dimensiones.IDS['provincia'][p] for p in ('Madrid', 'Soria')]
+
+
+def test_lector_con_rollups_gana_el_mas_reciente(tmp_path):
+    ruta = str(tmp_path / 'raw_data.jsonl')
+    escritor = EscritorLog(ruta).iniciar()
+    antiguo = registro('CIS_DEMOGRAPHICS', {'edad': 'antiguo'}, '2025-02-01')
+    escritor.enviar([('CIS_DEMOGRAPHICS', json.dumps(antiguo).encode() + b'\n')]).result()
+    escritor.cerrar()
+    with LectorAlmacen(ruta) as lector:
+        vista = {'data': {'edad': 'vista'}, '_received_at': '2025-01-01'}
+        assert LectorConRollups(lector, {'CIS_DEMOGRAPHICS': vista}).dato('CIS_DEMOGRAPHICS') == {'edad': 'antiguo'}
+        # A igual '_received_at' gana la vista
+        vista['_received_at'] = '2025-02-01'
+        assert LectorConRollups(lector, {'CIS_DEMOGRAPHICS': vista}).dato('CIS_DEMOGRAPHICS') == {'edad': 'vista'}
@@ -0,0 +1,70 @@
+"""Servidor de ingesta (server/server.py) con clientes sin framing, en hilos y en asyncio."""
+
+import json
+import socket
+import threading
+
+import pytest
+
+from common.storage import leer_registros
+
+MODOS = pytest.mark.parametrize('modo', [[], ['--async']], ids=['hilos', 'async'])
+
+
+def enviar_legado(srv, registro):
+    """Cliente antiguo: un JSON por conexión y la respuesta ACK/ERR."""
+    with srv.conectar() as conn:
+        conn.sendall(json.dumps(registro).encode())
+        return conn.recv(16)
+
+
+def test_async_muchos_clientes(servidor):
+    srv = servidor('--async', '--max-conexiones', '8')
+    respuestas = []
+    hilos = [threading.Thread(target=lambda i=i: respuestas.append(
+        enviar_legado(srv, {'source': f'CLIENTE_{i}', 'data': {'i': i}}))) for i in range(50)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert respuestas == [b'ACK'] * 50
+    srv.detener()
+    assert sorted(r['data']['i'] for r in leer_registros(srv.ruta)) == list(range(50))
+
+
+def test_async_limite_de_conexiones(servidor):
+    srv = servidor('--async', '--max-conexiones', '2')
+    ocupadas = [srv.conectar(), srv.conectar()]
+    with srv.conectar() as conn:
+        conn.sendall(b'{"source": "ESPERA", "data": {}}')
+        # Con las dos plazas ocupadas no se atiende hasta que una queda libre
+        conn.settimeout(0.5)
+        with pytest.raises(socket.timeout):
+            conn.recv(16)
+        ocupadas.pop().close()
+        conn.settimeout(10)
+        assert conn.recv(16) == b'ACK'
+    ocupadas[0].close()
+
+
+@MODOS
+def test_legado_en_trozos(servidor, modo):
+    # El JSON llega en varios recv, con llaves y comillas escapadas dentro de las cadenas
+    srv = servidor(*modo)
+    registro = {'source': 'TROZOS', 'data': {'texto': 'a } b { "c" \\ ' * 2000, 'n': list(range(1000))}}
+    mensaje = json.dumps(registro).encode()
+    with srv.conectar() as conn:
+        for i in range(0, len(mensaje), 7000):
+            conn.sendall(mensaje[i:i + 7000])
+        assert conn.recv(16) == b'ACK'
+    srv.detener()
+    assert [r['data'] for r in leer_registros(srv.ruta)] == [registro['data']]
+
+
+@MODOS
+def test_legado_demasiado_grande(servidor, modo):
+    srv = servidor('--max-mensaje-mb', '0.01', *modo)
+    assert enviar_legado(srv, {'source': 'GRANDE', 'data': 'x' * 20000}) == b'ERR'
+    assert enviar_legado(srv, {'source': 'PEQUENO', 'data': 'x' * 100}) == b'ACK'
+    srv.detener()
+    assert [r['source'] for r in leer_registros(srv.ruta)] == ['PEQUENO']
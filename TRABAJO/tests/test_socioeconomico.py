@@ -0,0 +1,49 @@
+"""Regresión socioeconómica provincial (analysis/socioeconomico.py)."""
+
+import numpy as np
+
+import socioeconomico as se
+from common import dimensiones
+
+PARTIDOS = ['PP', 'PSOE', 'VOX']
+
+
+def cubos(beta, n_provincias=20):
+    """Cubos con voto = a + β · (indicador - media) exacto en las primeras `n_provincias`."""
+    rng = np.random.default_rng(0)
+    economia = dimensiones.cubo_vacio(dimensiones.DIMS_ECONOMIA)
+    economia[:n_provincias] = np.column_stack([rng.uniform(5, 25, n_provincias),
+                                               rng.uniform(18000, 35000, n_provincias)])
+    X = economia[:n_provincias]
+    provincias = dimensiones.cubo_vacio(dimensiones.DIMS_PROVINCIAS)
+    ordenadas = np.array([[30.0, 28.0, 12.0], [33.0, 31.0, 12.5]])
+    for e, nombre in enumerate(('10N-2019', '23J-2023')):
+        voto = ordenadas[e] + (X - X.mean(axis=0)) @ beta[e]
+        provincias[dimensiones.IDS['eleccion'][nombre], :n_provincias,
+                   [dimensiones.IDS['partido'][p] for p in PARTIDOS]] = voto.T
+    return provincias, economia, ordenadas
+
+
+def test_recupera_los_coeficientes():
+    # indicadores × partidos, por elección
+    beta = np.array([[[0.5, -0.3, 0.1], [0.0002, -0.0001, 0.0]],
+                     [[0.4, -0.2, 0.2], [0.0001, 0.0, 0.0001]]])
+    provincias, economia, ordenadas = cubos(beta)
+    # Una provincia a la que le falta un indicador no cuenta
+    economia[25, 0] = 10.0
+    provincias[1:, 25, :] = 50.0
+    elecciones, V, X = se.arrays_provinciales(provincias, economia, PARTIDOS)
+    assert elecciones == ['10N-2019', '23J-2023']
+    a, coef, usadas = se.ajustar(V, X)
+    assert usadas == 20
+    np.testing.assert_allclose(a, ordenadas)
+    np.testing.assert_allclose(coef, beta.transpose(0, 2, 1), atol=1e-9)
+    esperado = beta.mean(axis=0).T @ (np.nanmean(X, axis=0) - [se.REFERENCIA[k] for k in se.INDICADORES])
+    np.testing.assert_allclose(se.efecto(coef, X), esperado)
+
+
+def test_sin_provincias_suficientes():
+    provincias, economia, _ = cubos(np.zeros((2, 2, 3)), n_provincias=3)
+    assert se.ajustar(*se.arrays_provinciales(provincias, economia, PARTIDOS)[1:]) is None
+    vacio = dimensiones.cubo_vacio(dimensiones.DIMS_PROVINCIAS)
+    assert se.ajustar(*se.arrays_provinciales(vacio, economia, PARTIDOS)[1:]) is None
@@ -0,0 +1,65 @@
+"""Suscripciones (common/suscripciones.py): conflación por fuente, contrapresión y stream del servidor."""
+
+import json
+import threading
+
+import pytest
+
+from common.protocol import TIPO_ACK, TIPO_LOTE
+from common.suscripciones import ConsumidorLento, Suscripciones, Suscriptor, suscribirse
+from conftest import peticion
+
+
+def par(source, i):
+    return source, json.dumps({'source': source, 'data': {'i': i}}).encode() + b'\n'
+
+
+def test_conflacion_conserva_la_ultima_version():
+    suscriptor = Suscriptor(fuentes=['A'], prefijos=['P_'])
+    suscriptor.anotar([par('A', 1), par('P_1', 1), par('B', 1)])
+    suscriptor.anotar([par('A', 2), par('P_2', 1)])
+    # A se sustituye y pasa detrás de lo anotado antes; B no interesa
+    assert suscriptor.esperar(0) == [par('P_1', 1), par('A', 2), par('P_2', 1)]
+    assert suscriptor.sustituidas == 1 and suscriptor.enviadas == 3
+    assert suscriptor.esperar(0.01) == []
+    # Lo ya enviado no se sustituye
+    suscriptor.anotar([par('A', 3)])
+    assert suscriptor.esperar(0) == [par('A', 3)]
+
+
+def test_consumidor_lento_se_corta():
+    suscriptor = Suscriptor(prefijos=['S'], max_pendiente=200)
+    suscriptor.anotar([par('S1', 0)] * 100)  # La misma fuente no acumula
+    assert suscriptor.sustituidas == 99
+    with pytest.raises(ConsumidorLento):
+        suscriptor.anotar([par(f'S{i}', 0) for i in range(10)])
+        suscriptor.esperar(0)
+
+
+def test_esperar_despierta_al_anotar():
+    suscripciones = Suscripciones()
+    suscriptor = suscripciones.suscribir(fuentes=['A'])
+    assert suscripciones.interes() == (['A'], [])
+    threading.Timer(0.05, suscripciones.publicar, [[par('A', 1)]]).start()
+    assert suscriptor.esperar(5) == [par('A', 1)]
+    suscripciones.cancelar(suscriptor)
+    assert not suscripciones
+    with pytest.raises(ConnectionAbortedError):
+        suscriptor.esperar(0)
+
+
+@pytest.mark.parametrize('modo', [[], ['--async']], ids=['hilos', 'async'])
+def test_stream_del_servidor(servidor, modo):
+    srv = servidor(*modo)
+    with srv.conectar() as conn:
+        assert peticion(conn, TIPO_LOTE, json.dumps([{'source': 'SUS_A', 'data': {'i': 0}}]).encode())[0] == TIPO_ACK
+        stream = suscribirse('127.0.0.1', srv.puerto, prefijos=['SUS_'], timeout=10)
+        assert [r['data'] for r in next(stream)] == [{'i': 0}]
+        lote = [{'source': 'SUS_B', 'data': {'i': 1}}, {'source': 'OTRA', 'data': {}},
+                {'source': 'SUS_A', 'data': {'i': 2}}]
+        assert peticion(conn, TIPO_LOTE, json.dumps(lote).encode())[0] == TIPO_ACK
+        recibidos = []
+        while len(recibidos) < 2:
+            recibidos += next(stream)
+        assert [(r['source'], r['data']['i']) for r in recibidos] == [('SUS_B', 1), ('SUS_A', 2)]
+        stream.close()
@@ -0,0 +1,47 @@
+"""Motor de tendencias vectorizado (analysis/trend_engine.py)."""
+
+import numpy as np
+
+import trend_engine as te
+
+
+def encuestas():
+    return [
+        {'date': '2025-01-15', 'data': {'PP': 33.0, 'PSOE': 30.0, 'fuente': 'X', 'publicada': True}},
+        {'date': '2025-04-01', 'data': {'PP': 34.0, 'PSOE': 29.0, 'VOX': 12.0}},
+        {'date': '2025-07-20', 'data': {'PP': 35.5, 'PSOE': 28.0, 'VOX': 13.0}},
+        {'date': '2025-10-02', 'data': {'PP': 36.0, 'VOX': 14.5}},
+    ]
+
+
+def test_matriz_encuestas():
+    meses, partidos, Y = te.matriz_encuestas(encuestas())
+    # Solo columnas numéricas (ni textos ni booleanos), en orden de aparición
+    assert partidos == ['PP', 'PSOE', 'VOX']
+    assert meses.tolist() == [-6.0, -3.0, 0.0, 3.0]
+    assert np.isnan(Y[0, 2]) and np.isnan(Y[3, 1])
+
+
+def test_igual_que_polyfit_por_partido():
+    meses, partidos, Y = te.matriz_encuestas(encuestas())
+    pesos = te.pesos_recencia(meses, 6)
+    m, b = te.ajustar_tendencias(meses, Y, pesos)
+    for j in range(len(partidos)):
+        hay = ~np.isnan(Y[:, j])
+        # polyfit pondera los residuos, no sus cuadrados
+        esperado = np.polyfit(meses[hay], Y[hay, j], 1, w=np.sqrt(pesos[hay]))
+        np.testing.assert_allclose([m[j], b[j]], esperado)
+
+
+def test_lote_igual_que_uno_a_uno():
+    meses, _, Y = te.matriz_encuestas(encuestas())
+    pesos = np.random.default_rng(0).integers(0, 3, size=(20, len(meses))).astype(float)
+    m, b = te.ajustar_tendencias_lote(meses, Y, pesos)
+    for s in range(len(pesos)):
+        np.testing.assert_allclose(np.array([m[s], b[s]]), np.array(te.ajustar_tendencias(meses, Y, pesos[s])),
+                                   atol=1e-9)
+
+
+def test_sin_datos_suficientes():
+    m, b = te.ajustar_tendencias(np.array([0.0, 1.0]), np.array([[np.nan, 5.0], [np.nan, 5.0]]))
+    assert m.tolist() == [0.0, 0.0] and b.tolist() == [0.0, 5.0]
@@ -0,0 +1,53 @@
+"""Último registro de cada fuente en el servidor (common/ultimos.py) y consultas CONSULTA."""
+
+import json
+
+import pytest
+
+from common.protocol import TIPO_ACK, TIPO_LOTE
+from common.storage import EscritorLog
+from common.ultimos import CacheUltimos, LectorServidor
+from conftest import peticion
+
+
+def lineas(registros):
+    return [(r['source'], json.dumps(r).encode() + b'\n') for r in registros]
+
+
+def test_expulsa_las_menos_consultadas_y_relee_del_log(tmp_path):
+    ruta = str(tmp_path / 'raw_data.jsonl')
+    cache = CacheUltimos(ruta, max_bytes=300)
+    escritor = EscritorLog(ruta, al_confirmar=lambda ls, _: cache.aplicar_lineas(ls)).iniciar()
+    escritor.enviar(lineas([{'source': 'AGREGADO', 'data': {'v': 1}}])).result()
+    assert cache.lineas(['AGREGADO'])['AGREGADO']  # Consultada: pasa a ser la más caliente
+    escritor.enviar(lineas([{'source': f'FILA_{i}', 'data': {'v': i}} for i in range(10)])).result()
+    escritor.enviar(lineas([{'source': 'AGREGADO', 'data': {'v': 2}}])).result()
+    # Las filas nuevas, que nadie ha pedido, se expulsan antes que el agregado consultado
+    assert cache.bytes <= 300 and cache.expulsadas > 0
+    assert json.loads(cache.lineas(['AGREGADO'])['AGREGADO'])['data'] == {'v': 2}
+    assert cache.aciertos == 2 and cache.fallos == 0
+    # Una expulsada (la última fila entra como la más fría) se relee del log con el índice; una desconocida es None
+    resultado = cache.lineas(['FILA_9', 'NO_EXISTE'])
+    assert json.loads(resultado['FILA_9'])['data'] == {'v': 9} and resultado['NO_EXISTE'] is None
+    assert cache.fallos == 1
+    assert cache.fuentes('FILA_') == [f'FILA_{i}' for i in range(10)]
+    escritor.cerrar()
+    cache.cerrar()
+
+
+@pytest.mark.parametrize('modo', [[], ['--async'], ['--workers', '2']], ids=['hilos', 'async', 'workers'])
+def test_consultas(servidor, modo):
+    srv = servidor(*modo)
+    with srv.conectar() as conn:
+        for v in range(3):
+            lote = [{'source': 'CIS_CURRENT', 'data': {'v': v}}, {'source': f'PROVINCE_X_{v}', 'data': {'v': v}}]
+            assert peticion(conn, TIPO_LOTE, json.dumps(lote).encode())[0] == TIPO_ACK
+    with LectorServidor('127.0.0.1', srv.puerto) as lector:
+        assert lector.dato('CIS_CURRENT') == {'v': 2}
+        assert lector.ultimo('NO_EXISTE') is None
+        assert lector.fuentes('PROVINCE_') == ['PROVINCE_X_0', 'PROVINCE_X_1', 'PROVINCE_X_2']
+        assert [r['data']['v'] for r in lector.historial('CIS_CURRENT')] == [0, 1, 2]
+        lector.precargar(['PROVINCE_X_1', 'NO_EXISTE_2'])
+        assert lector.dato('PROVINCE_X_1') == {'v': 1} and lector.dato('NO_EXISTE_2', 'x') == 'x'
+        with pytest.raises(RuntimeError):
+            lector._consultar({'op': 'borrar'})